@@ -1,21 +1,32 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import tempfile
 
 from .database import engine, get_db
-from .models import strategy as models
+from .migrations import AUTO_MIGRATE, run_migrations
+from .responses import FastJSONResponse, SelectiveGZipMiddleware, conditional_response, make_etag
 from .models import test as test_models
 from .schemas import strategy as schemas
 from .schemas import test as test_schemas
 from .services import strategy as strategy_service
 from .services import test as test_service
+from .services.worker_pool import shutdown_worker_pool
+from .services.ingest import FORMAT_CSV, FORMAT_NDJSON
+from .services import progress as progress_service
+from .services import report as report_service
+from .services import comparison as comparison_service
+from .services import export as export_service
+from .services import cases as cases_service
+from .services import data_generator
+from .services import metrics as metrics_service
+from .services import sweep as sweep_service
+from .services.scheduler import shutdown_scheduler
+from .services.charts import shutdown_chart_renderer
 
-# 创建数据库表
-models.Base.metadata.create_all(bind=engine)
-test_models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="信贷信用风险策略测试平台")
+app = FastAPI(title="信贷信用风险策略测试平台", default_response_class=FastJSONResponse)
 
 # 配置CORS
 app.add_middleware(
@@ -25,23 +36,57 @@ app.add_middleware(
     allow_methods=["*"],  # 允许的HTTP方法
     allow_headers=["*"],  # 允许的HTTP头
 )
+# 压缩较大的响应
+app.add_middleware(SelectiveGZipMiddleware)
+
+@app.on_event("startup")
+def startup():
+    # 启动时创建或升级数据库表，不在导入时连接数据库；多实例部署可关闭后改为运行 init_db.py
+    if AUTO_MIGRATE:
+        run_migrations(engine)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await shutdown_scheduler()
+    await shutdown_worker_pool()
+    shutdown_chart_renderer()
 
 @app.get("/")
 def read_root():
     return {"message": "信贷信用风险策略测试平台API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(db: Session = Depends(get_db)):
+    """以 Prometheus 文本格式输出本进程的运行指标"""
+    return PlainTextResponse(metrics_service.render_metrics(db), media_type="text/plain; version=0.0.4")
+
 # 策略相关的路由
-@app.get("/api/strategies", response_model=List[schemas.Strategy])
-def get_strategies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    strategies = strategy_service.get_strategies(db, skip=skip, limit=limit)
-    return strategies
+@app.get("/api/strategies", response_model=List[schemas.StrategySummary])
+def get_strategies(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    include_code: bool = False,
+    db: Session = Depends(get_db)
+):
+    """策略列表，默认不返回代码；策略没有变化时按 If-None-Match / If-Modified-Since 返回 304"""
+    count, last_modified = strategy_service.get_strategies_version(db)
+    etag = make_etag('strategies', count, last_modified, skip, limit, include_code)
+    return conditional_response(
+        request,
+        lambda: strategy_service.get_strategies(db, skip=skip, limit=limit, include_code=include_code),
+        etag,
+        last_modified
+    )
 
 @app.get("/api/strategies/{strategy_id}", response_model=schemas.Strategy)
-def get_strategy(strategy_id: int, db: Session = Depends(get_db)):
+def get_strategy(strategy_id: int, request: Request, db: Session = Depends(get_db)):
     strategy = strategy_service.get_strategy(db, strategy_id)
     if strategy is None:
         raise HTTPException(status_code=404, detail="策略不存在")
-    return strategy
+    # 快照本身已在缓存中，直接按内容计算 ETag，不受 updated_at 精度的影响
+    etag = make_etag('strategy', *strategy)
+    return conditional_response(request, lambda: strategy._asdict(), etag, strategy.last_modified)
 
 @app.post("/api/strategies", response_model=schemas.Strategy)
 def create_strategy(strategy: schemas.StrategyCreate, db: Session = Depends(get_db)):
@@ -56,53 +101,258 @@ def update_strategy(strategy_id: int, strategy: schemas.StrategyUpdate, db: Sess
 
 @app.delete("/api/strategies/{strategy_id}", response_model=schemas.Strategy)
 def delete_strategy(strategy_id: int, db: Session = Depends(get_db)):
-    strategy = strategy_service.delete_strategy(db, strategy_id)
+    try:
+        strategy = strategy_service.delete_strategy(db, strategy_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if strategy is None:
         raise HTTPException(status_code=404, detail="策略不存在")
     return strategy
 
 @app.post("/api/strategies/{strategy_id}/test")
-def test_strategy(strategy_id: int, test_data: schemas.StrategyTest, db: Session = Depends(get_db)):
+async def test_strategy(strategy_id: int, test_data: schemas.StrategyTest, db: Session = Depends(get_db)):
     strategy = strategy_service.get_strategy(db, strategy_id)
     if strategy is None:
         raise HTTPException(status_code=404, detail="策略不存在")
     
-    result = strategy_service.test_strategy(db, strategy_id, test_data.test_data)
+    result = await strategy_service.test_strategy(strategy, test_data.test_data, test_data.engine)
     if result is None:
         raise HTTPException(status_code=500, detail="测试执行失败")
     return result 
 
+@app.post("/api/strategies/{strategy_id}/sweep")
+async def sweep_strategy(strategy_id: int, sweep: schemas.StrategySweep, db: Session = Depends(get_db)):
+    """在一到两个输入字段的取值网格上执行策略，返回结果网格、决策边界和阈值穿越位置
+
+    其余字段取 base_input 中的值，扫描的点不保存为测试用例。
+    """
+    strategy = strategy_service.get_strategy(db, strategy_id)
+    if strategy is None:
+        raise HTTPException(status_code=404, detail="策略不存在")
+    try:
+        result = await sweep_service.run_sweep(strategy, sweep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"扫描配置错误：{str(e)}")
+    if result is None:
+        raise HTTPException(status_code=400, detail="策略没有对应引擎的代码")
+    return FastJSONResponse(result)
+
 # 测试相关的路由
 @app.post("/api/tests/generate-data", response_model=List[Dict[str, Any]])
-def generate_test_data(config: test_schemas.TestDataGenerator):
-    """生成测试数据"""
-    return test_service.generate_test_data(config)
+def generate_test_data(
+    config: test_schemas.TestDataGenerator,
+    format: str = Query('json', regex=f'^(json|{FORMAT_NDJSON})$')
+):
+    """生成测试数据，format=ndjson 时以 NDJSON 流式返回"""
+    try:
+        data_generator.validate_config(config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"生成器配置错误：{str(e)}")
+    if format == FORMAT_NDJSON:
+        return StreamingResponse(data_generator.iter_test_data_ndjson(config), media_type="application/x-ndjson")
+    return data_generator.generate_test_data(config)
 
-@app.post("/api/tests/batches", response_model=test_schemas.TestBatch)
-async def create_test_batch(
+@app.post("/api/tests/batches", response_model=test_schemas.TestBatchInfo)
+def create_test_batch(
     test_batch: test_schemas.TestBatchCreate,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
-    """创建并运行测试批次"""
-    batch = test_service.create_test_batch(db, test_batch)
-    background_tasks.add_task(test_service.run_test_batch, db, batch.id)
+    """创建并运行测试批次，指定 challenger_ids 时为冠军 / 挑战者对比批次"""
+    try:
+        batch = test_service.create_test_batch(db, test_batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(test_service.start_test_batch, batch.id)
+    return batch
+
+@app.post("/api/tests/batches/upload", response_model=test_schemas.TestBatchInfo)
+async def upload_test_batch(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    name: str,
+    strategy_id: int,
+    description: Optional[str] = None,
+    priority: int = Query(0, ge=0, le=9),
+    engine: str = Query('python', regex='^(python|sql)$'),
+    challenger_ids: Optional[List[int]] = Query(None),
+    format: str = Query(FORMAT_NDJSON, regex=f'^({FORMAT_NDJSON}|{FORMAT_CSV})$'),
+    db: Session = Depends(get_db)
+):
+    """以 NDJSON 或 CSV 请求体上传测试用例，立即返回批次并在后台导入、运行"""
+    batch_info = test_schemas.TestBatchBase(
+        name=name,
+        description=description,
+        strategy_id=strategy_id,
+        priority=priority,
+        engine=engine,
+        challenger_ids=challenger_ids
+    )
+    try:
+        test_service.check_challengers(db, batch_info)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 请求体边读边写入临时文件，不在内存中保留整个批次
+    with tempfile.NamedTemporaryFile(mode='wb', suffix=f'.{format}', delete=False) as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+        path = f.name
+    
+    batch = test_service.create_batch_record(db, batch_info)
+    background_tasks.add_task(test_service.ingest_and_run_test_batch, batch.id, path, format)
+    return batch
+
+@app.post("/api/tests/batches/generate", response_model=test_schemas.TestBatchInfo)
+def generate_test_batch(
+    test_batch: test_schemas.TestBatchGenerate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """按生成器配置在服务端生成测试用例并运行批次，用例不经过客户端"""
+    try:
+        data_generator.validate_config(test_batch.generator)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"生成器配置错误：{str(e)}")
+    try:
+        batch = test_service.create_batch_record(db, test_batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(test_service.generate_and_run_test_batch, batch.id, test_batch.generator)
     return batch
 
 @app.get("/api/tests/batches/{batch_id}", response_model=test_schemas.TestBatch)
-def get_test_batch(batch_id: int, db: Session = Depends(get_db)):
-    """获取测试批次信息"""
-    batch = db.query(test_models.TestBatch).filter(test_models.TestBatch.id == batch_id).first()
-    if not batch:
+def get_test_batch(
+    batch_id: int,
+    include_cases: bool = Query(False, deprecated=True),
+    db: Session = Depends(get_db)
+):
+    """获取测试批次信息，不含用例；用例请用 /cases 分页读取
+
+    include_cases=true 仅为兼容保留：内嵌最多 CASE_MAX_PAGE_SIZE 个用例，其余用例从返回的
+    next_after_id 起用 /cases 读取。
+    """
+    batch = cases_service.get_batch_info(db, batch_id)
+    if batch is None:
         raise HTTPException(status_code=404, detail="测试批次不存在")
-    return batch
+    page = {'items': [], 'next_after_id': None}
+    if include_cases:
+        page = cases_service.list_cases(db, batch_id, limit=cases_service.MAX_PAGE_SIZE, include_data=True)
+    batch['test_cases'] = page['items']
+    batch['next_after_id'] = page['next_after_id']
+    # 直接按列构造并序列化，不经过 ORM 对象和 pydantic 校验
+    return FastJSONResponse(batch)
+
+@app.delete("/api/tests/batches/{batch_id}", response_model=test_schemas.TestBatchDeleted)
+def delete_test_batch(batch_id: int, archive: bool = False, db: Session = Depends(get_db)):
+    """删除已结束的测试批次及其用例
+
+    用例按批次分区时直接删除整个分区；archive=true 时把分区分离为独立的归档表。
+    """
+    try:
+        result = test_service.delete_test_batch(db, batch_id, archive)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="测试批次不存在")
+    return result
+
+@app.get("/api/tests/batches/{batch_id}/cases", response_model=test_schemas.TestCasePage)
+def list_test_cases(
+    batch_id: int,
+    status: Optional[List[str]] = Query(None),
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(cases_service.DEFAULT_PAGE_SIZE, ge=1, le=cases_service.MAX_PAGE_SIZE),
+    include_data: bool = False,
+    db: Session = Depends(get_db)
+):
+    """按用例 ID 分页列出批次的用例，可按状态过滤（status 可重复）
+
+    下一页以返回的 next_after_id 作为 after_id；include_data=true 时才返回 input_data、
+    expected_output、actual_output 和 phase_timings。
+    """
+    if cases_service.get_batch_info(db, batch_id) is None:
+        raise HTTPException(status_code=404, detail="测试批次不存在")
+    return FastJSONResponse(cases_service.list_cases(db, batch_id, status, after_id, limit, include_data))
+
+@app.get("/api/tests/batches/{batch_id}/progress", response_model=test_schemas.TestBatchProgress)
+def get_test_progress(batch_id: int, db: Session = Depends(get_db)):
+    """获取测试批次进度（只返回各状态的用例数）"""
+    progress = progress_service.get_batch_progress(db, batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="测试批次不存在")
+    return progress
+
+@app.post("/api/tests/batches/{batch_id}/cancel", response_model=test_schemas.TestBatchProgress)
+async def cancel_test_batch(batch_id: int, db: Session = Depends(get_db)):
+    """取消测试批次：待执行和执行中的用例立即停止并标记为已取消"""
+    previous = await test_service.cancel_test_batch(batch_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="测试批次不存在")
+    if previous not in ('pending', 'running'):
+        raise HTTPException(status_code=409, detail="测试批次已结束")
+    return progress_service.get_batch_progress(db, batch_id)
+
+@app.get("/api/tests/batches/{batch_id}/progress/stream")
+def stream_test_progress(batch_id: int):
+    """以 Server-Sent Events 推送测试批次进度，批次结束后发送 done 事件"""
+    return StreamingResponse(
+        progress_service.stream_batch_progress(batch_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/tests/batches/{batch_id}/report")
-def get_test_report(batch_id: int, db: Session = Depends(get_db)):
-    """获取测试报告"""
+def get_test_report(
+    batch_id: int,
+    sample_size: Optional[int] = Query(None, ge=1, le=10000),
+    charts: str = Query(report_service.CHARTS_IMAGE, regex=f'^({report_service.CHARTS_IMAGE}|{report_service.CHARTS_DATA})$'),
+    db: Session = Depends(get_db)
+):
+    """获取测试报告，统计信息覆盖整个批次，用例明细最多返回 sample_size 条
+
+    charts=data 时只返回图表数据序列，由前端绘制图表。
+    """
     try:
-        return test_service.generate_test_report(db, batch_id)
+        return FastJSONResponse(report_service.generate_test_report(db, batch_id, sample_size, charts))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tests/batches/{batch_id}/comparison")
+def get_comparison_report(
+    batch_id: int,
+    sample_size: Optional[int] = Query(None, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    """获取对比批次的报告：各挑战者相对冠军策略的一致率、risk_level 混淆矩阵和执行时间差异
+
+    每个挑战者最多返回 sample_size 条 risk_level 不一致的用例。
+    """
+    try:
+        return comparison_service.generate_comparison_report(db, batch_id, sample_size)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/tests/batches/{batch_id}/export")
+def export_test_batch(
+    batch_id: int,
+    format: Optional[str] = Query(None, regex=f'^({export_service.FORMAT_PARQUET}|{export_service.FORMAT_ARROW}|{export_service.FORMAT_CSV})$'),
+    db: Session = Depends(get_db)
+):
+    """流式导出批次的输入和输出，input_data、actual_output 展开为带类型的列
+
+    format 默认为 parquet，未安装 pyarrow 时默认为 csv。
+    """
+    batch = db.query(test_models.TestBatch).filter(test_models.TestBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="测试批次不存在")
+    format = format or export_service.default_format()
+    if format != export_service.FORMAT_CSV and not export_service.arrow_available():
+        raise HTTPException(status_code=400, detail=f"导出 {format} 需要安装 pyarrow，请使用 format=csv")
+    return StreamingResponse(
+        export_service.iter_export(batch_id, format),
+        media_type=export_service.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.{export_service.EXTENSIONS[format]}"'}
+    )
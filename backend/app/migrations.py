@@ -0,0 +1,124 @@
+"""数据库结构迁移
+
+run_migrations 可以重复执行，只补齐缺少的部分：
+- 创建缺少的表（TEST_CASE_PARTITIONING=batch 时在 PostgreSQL 上把 test_cases 建为分区表）
+- 为已有的表添加模型中新增的列，有默认值的列为已有的行填入默认值
+- 为 PostgreSQL 的枚举类型添加新增的取值
+- 创建缺少的索引，PostgreSQL 上对已有的非分区表使用 CREATE INDEX CONCURRENTLY，不阻塞写入
+
+不会删除或修改已有的列和索引。API 进程默认在启动时执行（AUTO_MIGRATE），也可以用
+init_db.py 单独执行。
+"""
+import logging
+import os
+from typing import Set
+
+from sqlalchemy import Enum, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from .database import Base
+from .models import strategy as strategy_models  # noqa: F401  注册 strategies 表
+from .models.test import TestCase, TestCaseResult
+from .services.partitions import create_partitioned_cases_table, is_partitioned_table, partitioning_requested
+
+logger = logging.getLogger(__name__)
+
+# API 进程启动时是否执行迁移
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+
+def _create_tables(conn: Connection) -> None:
+    existing = set(inspect(conn).get_table_names())
+    cases = TestCase.__table__
+    results = TestCaseResult.__table__
+    if partitioning_requested(conn):
+        if cases.name not in existing:
+            Base.metadata.create_all(bind=conn, tables=[
+                table for table in Base.metadata.sorted_tables if table not in (cases, results)
+            ])
+            create_partitioned_cases_table(conn)
+        elif not is_partitioned_table(conn):
+            logger.warning(f"{cases.name} already exists and is not partitioned, TEST_CASE_PARTITIONING is ignored")
+
+    if not is_partitioned_table(conn):
+        Base.metadata.create_all(bind=conn)
+        return
+    Base.metadata.create_all(bind=conn, tables=[
+        table for table in Base.metadata.sorted_tables if table is not results
+    ])
+    if results.name not in existing:
+        # 分区表的主键含 batch_id，case_id 无法再引用 test_cases.id
+        results.c.status.type.create(conn, checkfirst=True)
+        conn.execute(CreateTable(results, include_foreign_key_constraints=[
+            constraint for constraint in results.foreign_key_constraints
+            if constraint.referred_table is not cases
+        ]))
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    inspector = inspect(conn)
+    ddl = conn.dialect.ddl_compiler(conn.dialect, None)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if isinstance(column.type, Enum):
+                column.type.create(conn, checkfirst=True)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl.get_column_specification(column)}"))
+            if column.default is not None and column.default.is_scalar:
+                # 已有的行使用模型的默认值，例如旧批次的 engine 为 python
+                conn.execute(table.update().values({column.name: column.default.arg}))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+
+def _enum_labels(conn: Connection, name: str) -> Set[str]:
+    return set(conn.execute(text(
+        "SELECT e.enumlabel FROM pg_enum e JOIN pg_type t ON t.oid = e.enumtypid WHERE t.typname = :name"
+    ), {'name': name}).scalars())
+
+
+def _add_enum_values(conn: Connection) -> None:
+    """为 PostgreSQL 枚举类型补充新增的取值（需要在自动提交的连接上执行）"""
+    seen = set()
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if not isinstance(column.type, Enum) or column.type.name in seen:
+                continue
+            seen.add(column.type.name)
+            labels = _enum_labels(conn, column.type.name)
+            for value in column.type.enums:
+                if labels and value not in labels:
+                    conn.execute(text(f"ALTER TYPE {column.type.name} ADD VALUE IF NOT EXISTS '{value}'"))
+                    logger.info(f"Added value {value} to enum {column.type.name}")
+
+
+def _create_missing_indexes(conn: Connection) -> None:
+    """创建缺少的索引；conn 为自动提交连接，PostgreSQL 上对非分区表并发创建"""
+    inspector = inspect(conn)
+    postgresql = conn.dialect.name == 'postgresql'
+    for table in Base.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        concurrently = postgresql and not is_partitioned_table(conn, table.name)
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if concurrently:
+                index.dialect_options['postgresql']['concurrently'] = True
+            try:
+                index.create(conn)
+            finally:
+                index.dialect_options['postgresql']['concurrently'] = False
+            logger.info(f"Created index {index.name} on {table.name}")
+
+
+def run_migrations(engine: Engine) -> None:
+    """创建或升级数据库结构"""
+    with engine.begin() as conn:
+        _create_tables(conn)
+        _add_missing_columns(conn)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == 'postgresql':
+            _add_enum_values(conn)
+        _create_missing_indexes(conn)
@@ -12,4 +12,6 @@ class Strategy(Base):
     python_code = Column(Text)
     status = Column(Enum('active', 'inactive', name='strategy_status'), default='inactive')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default='1')  # 每次更新递增，各进程的策略缓存据此判断快照是否过期
+ 
\ No newline at end of file
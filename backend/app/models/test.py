@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Enum
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Enum, Index
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from ..database import Base
 
@@ -11,7 +11,11 @@ class TestBatch(Base):
     name = Column(String(100), nullable=False)
     description = Column(Text)
     strategy_id = Column(Integer, ForeignKey('strategies.id'))
-    status = Column(Enum('pending', 'running', 'completed', 'failed', name='test_batch_status'), default='pending')
+    challenger_ids = Column(JSON, nullable=True)  # 对比批次中与 strategy_id（冠军策略）同时运行的挑战者策略 id 列表
+    priority = Column(Integer, default=0)  # 调度优先级，越大获得的执行份额越多
+    engine = Column(Enum('python', 'sql', name='test_batch_engine'), default='python')  # 执行策略的 Python 还是 SQL 代码
+    enqueued_at = Column(DateTime(timezone=True), nullable=True)  # 交给队列 worker 执行的时间
+    status = Column(Enum('pending', 'running', 'completed', 'failed', 'cancelled', name='test_batch_status'), default='pending')
     test_cases = relationship("TestCase", back_populates="batch")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -19,15 +23,62 @@ class TestBatch(Base):
 class TestCase(Base):
     """测试用例"""
     __tablename__ = "test_cases"
+    __table_args__ = (
+        # 按批次和状态过滤：认领和读取待执行用例、统计失败用例、进度和报告
+        Index('ix_test_cases_batch_status', 'batch_id', 'status', 'id'),
+        # 按批次分页读取：用例列表、导出、重建汇总
+        Index('ix_test_cases_batch_id', 'batch_id', 'id'),
+        # 只包含执行中用例的部分索引：刷新 worker 心跳、查找心跳超时的认领
+        Index('ix_test_cases_running_claims', 'claimed_by', 'heartbeat_at',
+              postgresql_where=text("status = 'running'"), sqlite_where=text("status = 'running'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     batch_id = Column(Integer, ForeignKey('test_batches.id'))
     input_data = Column(JSON)
     expected_output = Column(JSON, nullable=True)
     actual_output = Column(JSON, nullable=True)
-    status = Column(Enum('pending', 'running', 'passed', 'failed', 'error', name='test_case_status'), default='pending')
+    status = Column(Enum('pending', 'running', 'passed', 'failed', 'error', 'timeout', 'cancelled', name='test_case_status'), default='pending')
     error_message = Column(Text, nullable=True)
     execution_time = Column(Integer, nullable=True)  # 毫秒
+    phase_timings = Column(JSON, nullable=True)  # 各执行阶段的耗时（毫秒），见 services/metrics.py
+    claimed_by = Column(String(100), nullable=True)  # 认领该用例的队列 worker
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # worker 最近一次心跳时间
     batch = relationship("TestBatch", back_populates="test_cases")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
+
+class TestBatchSummary(Base):
+    """测试批次的增量汇总，随用例结果写回同步更新"""
+    __tablename__ = "test_batch_summaries"
+
+    batch_id = Column(Integer, ForeignKey('test_batches.id'), primary_key=True)
+    status_counts = Column(JSON, default=dict)  # 各状态的用例数
+    execution_time = Column(JSON, default=dict)  # 已完成用例执行时间的 count / sum / min / max / histogram
+    risk_score_histogram = Column(JSON, default=dict)  # risk_score 分桶计数，键为桶的下界
+    risk_level_counts = Column(JSON, default=dict)  # 各 risk_level 的用例数
+    cache_hits = Column(Integer, default=0)  # 命中结果缓存、未实际执行的用例数
+    cache_misses = Column(Integer, default=0)  # 实际执行的用例数
+    phase_timings = Column(JSON, default=dict)  # 各执行阶段耗时的 count / sum（毫秒）
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StrategyResultCache(Base):
+    """策略结果缓存：同一份策略代码对同一输入的输出"""
+    __tablename__ = "strategy_result_cache"
+
+    code_hash = Column(String(40), primary_key=True)  # 引擎和策略代码的 sha1
+    input_hash = Column(String(64), primary_key=True)  # 规范化 input_data 的 sha256
+    output = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class TestCaseResult(Base):
+    """对比批次中挑战者策略对同一用例的执行结果，冠军策略的结果仍写在 test_cases 上"""
+    __tablename__ = "test_case_results"
+
+    case_id = Column(Integer, ForeignKey('test_cases.id'), primary_key=True)
+    strategy_id = Column(Integer, ForeignKey('strategies.id'), primary_key=True, index=True)
+    status = Column(Enum('passed', 'failed', 'error', 'timeout', name='test_case_result_status'), nullable=False)
+    actual_output = Column(JSON, nullable=True)
+    error_message = Column(Text, nullable=True)
+    execution_time = Column(Integer, nullable=True)  # 毫秒
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,91 @@
+"""响应序列化和压缩
+
+- FastJSONResponse：用 orjson 序列化，支持 datetime、NumPy 标量和数组、非字符串键，
+  其他类型交给 FastAPI 的 jsonable_encoder 兜底
+- conditional_response：带 ETag / Last-Modified 的响应，客户端缓存仍然有效时返回 304
+- SelectiveGZipMiddleware：客户端接受 gzip 且响应超过 GZIP_MINIMUM_SIZE 字节时压缩；
+  SSE 进度流和导出文件不压缩，前者需要逐条推送，后者本身已经压缩或由客户端自行处理
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# 超过多少字节的响应才压缩
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1024))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", 5))
+
+# 不压缩的路径后缀
+GZIP_EXCLUDED_SUFFIXES: Tuple[str, ...] = ('/progress/stream', '/export')
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=jsonable_encoder, option=ORJSON_OPTIONS)
+
+
+def make_etag(*parts: Any) -> str:
+    """由若干取值计算弱 ETag"""
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite 返回不带时区的 UTC 时间
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """按 If-None-Match（优先）或 If-Modified-Since 判断客户端的缓存是否仍然有效"""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.replace('W/', '', 1) == etag.replace('W/', '', 1) for tag in tags)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def conditional_response(
+    request: Request,
+    load: Callable[[], Any],
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> Response:
+    """返回带 ETag / Last-Modified 的 JSON 响应，客户端缓存仍然有效时返回 304，不调用 load 读取内容"""
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = format_datetime(_utc(last_modified), usegmt=True)
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(load(), headers=headers)
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    def __init__(self, app: ASGIApp, minimum_size: int = GZIP_MINIMUM_SIZE, compresslevel: int = GZIP_COMPRESS_LEVEL):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].endswith(GZIP_EXCLUDED_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
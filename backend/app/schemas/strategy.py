@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, StrictInt
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime
 
 class StrategyBase(BaseModel):
@@ -23,5 +23,34 @@ class Strategy(StrategyBase):
     class Config:
         orm_mode = True
 
+class StrategySummary(BaseModel):
+    """策略列表中的一项，include_code=true 时才包含代码"""
+    id: int
+    name: str
+    description: Optional[str] = None
+    status: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    sql_code: Optional[str] = None
+    python_code: Optional[str] = None
+
 class StrategyTest(BaseModel):
-    test_data: dict 
\ No newline at end of file
+    test_data: dict
+    engine: Optional[str] = Field(None, regex='^(python|sql)$')  # 默认有 Python 代码时用 Python 
+
+class SweepAxis(BaseModel):
+    """扫描的一个输入字段：直接给出 values，或给出 start、stop 和 step / num"""
+    field: str
+    values: Optional[List[Any]] = None
+    start: Optional[Union[StrictInt, float]] = None
+    stop: Optional[Union[StrictInt, float]] = None  # 包含在内
+    step: Optional[Union[StrictInt, float]] = None
+    num: Optional[int] = Field(None, ge=1)  # start 到 stop 之间等分的点数（含两端）
+
+class StrategySweep(BaseModel):
+    base_input: Dict[str, Any] = {}  # 其余字段的固定取值
+    axes: List[SweepAxis] = Field(..., min_items=1, max_items=2)
+    engine: Optional[str] = Field(None, regex='^(python|sql)$')  # 默认有 Python 代码时用 Python
+    output_field: str = 'risk_level'  # 寻找决策边界的分类输出
+    score_field: str = 'risk_score'  # thresholds 对应的数值输出
+    thresholds: List[float] = []  # 报告 score_field 穿过这些阈值的位置
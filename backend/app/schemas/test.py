@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -26,20 +26,64 @@ class TestBatchBase(BaseModel):
     name: str
     description: Optional[str] = None
     strategy_id: int
+    priority: Optional[int] = Field(0, ge=0, le=9)  # 调度优先级，0-9，越大越优先
+    engine: Optional[str] = Field('python', regex='^(python|sql)$')  # python 或 sql
+    challenger_ids: Optional[List[int]] = None  # 指定后为对比批次：这些策略与 strategy_id 在同一组输入上运行
 
 class TestBatchCreate(TestBatchBase):
     test_cases: List[TestCaseCreate]
 
-class TestBatch(TestBatchBase):
+class TestBatchInfo(TestBatchBase):
+    """不含用例的批次信息"""
     id: int
     status: str
-    test_cases: List[TestCase]
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
 
+class TestCaseItem(BaseModel):
+    """用例列表中的一项，input_data 等 JSON 字段只在 include_data=true 时返回"""
+    id: int
+    batch_id: int
+    status: str
+    error_message: Optional[str] = None
+    execution_time: Optional[int] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    input_data: Optional[Dict[str, Any]] = None
+    expected_output: Optional[Dict[str, Any]] = None
+    actual_output: Optional[Dict[str, Any]] = None
+    phase_timings: Optional[Dict[str, float]] = None
+
+class TestCasePage(BaseModel):
+    items: List[TestCaseItem]
+    next_after_id: Optional[int] = None  # 下一页的 after_id，没有更多用例时为空
+
+class TestBatch(TestBatchInfo):
+    """批次信息；include_cases=true 时内嵌第一页用例，其余用例从 next_after_id 起用 /cases 读取"""
+    test_cases: List[TestCaseItem] = []
+    next_after_id: Optional[int] = None
+
+class TestBatchDeleted(BaseModel):
+    batch_id: int
+    archived_table: Optional[str] = None  # 归档时用例所在的表
+
+class TestBatchProgress(BaseModel):
+    """批次执行进度，只包含各状态的用例数"""
+    batch_id: int
+    status: str
+    total: int
+    done: int
+    pending: int
+    running: int
+    passed: int
+    failed: int
+    error: int
+    timeout: int
+    cancelled: int
+
 class TestDataGenerator(BaseModel):
     """测试数据生成器配置"""
     count: int = 10  # 生成的测试用例数量
@@ -61,6 +105,11 @@ class TestDataGenerator(BaseModel):
         }
     }
     include_edge_cases: bool = True  # 是否包含边界值测试用例
+    seed: Optional[int] = None  # 随机种子，指定后生成结果可复现
+
+class TestBatchGenerate(TestBatchBase):
+    """在服务端生成测试用例并创建批次"""
+    generator: TestDataGenerator
 
 class TestReport(BaseModel):
     """测试报告"""
@@ -0,0 +1,69 @@
+"""用例列表
+
+按主键分页（keyset）读取批次的用例，只查询需要的列并直接构造字典，不创建 ORM
+对象，也不经过 pydantic 校验。默认不返回 input_data、expected_output、
+actual_output 等较大的 JSON 字段。
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from ..models.test import TestBatch, TestCase
+
+# 每页默认和最多返回的用例数
+DEFAULT_PAGE_SIZE = int(os.getenv("CASE_PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("CASE_MAX_PAGE_SIZE", 10000))
+
+LEAN_COLUMNS = (
+    TestCase.id, TestCase.batch_id, TestCase.status, TestCase.error_message,
+    TestCase.execution_time, TestCase.created_at, TestCase.updated_at
+)
+DATA_COLUMNS = (
+    TestCase.input_data, TestCase.expected_output, TestCase.actual_output, TestCase.phase_timings
+)
+
+BATCH_COLUMNS = (
+    TestBatch.id, TestBatch.name, TestBatch.description, TestBatch.strategy_id, TestBatch.priority,
+    TestBatch.engine, TestBatch.challenger_ids, TestBatch.status, TestBatch.created_at, TestBatch.updated_at
+)
+
+
+def case_columns(include_data: bool = True) -> Sequence:
+    return LEAN_COLUMNS + DATA_COLUMNS if include_data else LEAN_COLUMNS
+
+
+def row_dicts(rows) -> List[Dict[str, Any]]:
+    """把查询结果行转换为字典列表"""
+    return [dict(row._mapping) for row in rows]
+
+
+def get_batch_info(db: Session, batch_id: int) -> Optional[Dict[str, Any]]:
+    """批次信息（不含用例）"""
+    row = db.query(*BATCH_COLUMNS).filter(TestBatch.id == batch_id).first()
+    return dict(row._mapping) if row else None
+
+
+def list_cases(
+    db: Session,
+    batch_id: int,
+    statuses: Optional[List[str]] = None,
+    after_id: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_data: bool = False
+) -> Dict[str, Any]:
+    """按主键顺序返回 after_id 之后的一页用例，next_after_id 为下一页的起点，没有更多时为 None"""
+    query = db.query(*case_columns(include_data)).filter(
+        TestCase.batch_id == batch_id,
+        TestCase.id > after_id
+    )
+    if statuses:
+        query = query.filter(TestCase.status.in_(statuses))
+    # 多取一行判断是否还有下一页
+    items = row_dicts(query.order_by(TestCase.id).limit(limit + 1))
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        'items': items,
+        'next_after_id': items[-1]['id'] if has_more else None
+    }
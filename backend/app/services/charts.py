@@ -0,0 +1,183 @@
+"""报告图表
+
+图表只依赖报告的聚合序列（状态计数、风险等级分布、执行时间分位数）。渲染在
+独立的进程池中用 Agg 后端完成，不占用请求线程，也不共享 pyplot 的全局状态。
+渲染结果按批次缓存，缓存键包含序列的摘要，用例结果变化后自动失效。
+"""
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 渲染图表的进程数
+RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", 2))
+# 最多缓存多少个批次的图表
+CHART_CACHE_SIZE = int(os.getenv("REPORT_CHART_CACHE_SIZE", 128))
+
+ChartSeries = Dict[str, Dict[str, Any]]
+
+
+def build_series(status: Dict[str, int], risk_levels: Dict[str, int], execution_time: Dict[str, Any]) -> ChartSeries:
+    """由报告的聚合结果构造图表数据序列，前端可以直接据此绘图"""
+    series = {}
+    if status:
+        series['results_distribution'] = {
+            'labels': list(status.keys()),
+            'values': list(status.values())
+        }
+    if risk_levels:
+        series['risk_level_distribution'] = {
+            'labels': list(risk_levels.keys()),
+            'values': list(risk_levels.values())
+        }
+    if execution_time['max_execution_time'] > 0:
+        series['execution_time_distribution'] = {
+            'min': execution_time['min_execution_time'],
+            'q1': execution_time['p25'],
+            'median': execution_time['p50'],
+            'q3': execution_time['p75'],
+            'max': execution_time['max_execution_time']
+        }
+    return series
+
+
+def series_version(series: ChartSeries) -> str:
+    """图表序列的摘要，作为结果版本"""
+    return hashlib.sha1(json.dumps(series, sort_keys=True).encode()).hexdigest()
+
+
+def _to_png(plt, fig) -> str:
+    buf = BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def render_charts(series: ChartSeries) -> Dict[str, str]:
+    """绘制报告图表，返回 base64 编码的 PNG（在渲染进程中执行）"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    charts = {}
+
+    # 1. 测试结果分布饼图
+    if 'results_distribution' in series:
+        data = series['results_distribution']
+        fig, ax = plt.subplots(figsize=(8, 8))
+        ax.pie(data['values'], labels=data['labels'], autopct='%1.1f%%')
+        ax.set_title('Test Results Distribution')
+        charts['results_distribution'] = _to_png(plt, fig)
+
+    # 2. 风险等级分布条形图
+    if 'risk_level_distribution' in series:
+        data = series['risk_level_distribution']
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.bar(data['labels'], data['values'])
+        ax.set_xlabel('risk_level')
+        ax.set_ylabel('count')
+        ax.set_title('Risk Level Distribution')
+        charts['risk_level_distribution'] = _to_png(plt, fig)
+
+    # 3. 执行时间箱线图，箱体和须由数据库算出的分位数直接给出
+    if 'execution_time_distribution' in series:
+        data = series['execution_time_distribution']
+        fig, ax = plt.subplots(figsize=(10, 6))
+        ax.bxp([{
+            'label': 'execution_time',
+            'q1': data['q1'],
+            'med': data['median'],
+            'q3': data['q3'],
+            'whislo': data['min'],
+            'whishi': data['max'],
+            'fliers': []
+        }], showfliers=False)
+        ax.set_title('Execution Time Distribution')
+        charts['execution_time_distribution'] = _to_png(plt, fig)
+
+    return charts
+
+
+class ChartRenderer:
+    """在进程池中渲染图表并按 (批次, 结果版本) 缓存"""
+
+    def __init__(self, workers: int = RENDER_WORKERS, cache_size: int = CHART_CACHE_SIZE):
+        self.workers = max(1, workers)
+        self.cache_size = max(1, cache_size)
+        self._cache: "OrderedDict[Any, Tuple[str, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn 启动的渲染进程不继承 API 进程的线程和数据库连接
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def get(self, key: Any, version: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None or cached[0] != version:
+                return None
+            self._cache.move_to_end(key)
+            return cached[1]
+
+    def put(self, key: Any, version: str, charts: Dict[str, str]) -> None:
+        with self._lock:
+            self._cache[key] = (version, charts)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def render(self, key: Any, series: ChartSeries) -> Dict[str, str]:
+        """返回缓存的图表，缓存未命中或结果已变化时在进程池中重新渲染"""
+        if not series:
+            return {}
+        version = series_version(series)
+        charts = self.get(key, version)
+        if charts is not None:
+            logger.info(f"Chart cache hit for {key}")
+            return charts
+        charts = self._get_executor().submit(render_charts, series).result()
+        self.put(key, version, charts)
+        return charts
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._cache.clear()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+_renderer: Optional[ChartRenderer] = None
+_renderer_lock = threading.Lock()
+
+
+def get_chart_renderer() -> ChartRenderer:
+    """获取进程内共享的图表渲染器"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ChartRenderer()
+        return _renderer
+
+
+def shutdown_chart_renderer() -> None:
+    global _renderer
+    with _renderer_lock:
+        renderer, _renderer = _renderer, None
+    if renderer is not None:
+        renderer.shutdown()
@@ -0,0 +1,174 @@
+"""冠军 / 挑战者对比报告
+
+对比批次中每个输入只导入一次，由冠军策略（批次的 strategy_id）和每个挑战者策略
+分别执行：冠军的结果写在 test_cases 上，挑战者的结果写在 test_case_results 上。
+报告按主键顺序把两张表连接后分块读取一遍，同时累计一致率、risk_level 混淆矩阵
+和执行时间差异，不需要把整个批次读入内存。
+"""
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.test import TestBatch, TestBatchSummary, TestCase, TestCaseResult
+from .metrics import REPORT_GENERATE_SECONDS
+from .report import PERCENTILES, REPORT_SAMPLE_SIZE
+from .summary import SummaryDelta, execution_time_stats
+
+logger = logging.getLogger(__name__)
+
+# 每次读取的（用例，挑战者）结果行数
+COMPARISON_CHUNK_SIZE = int(os.getenv("COMPARISON_CHUNK_SIZE", 10000))
+
+# 混淆矩阵中通过但没有输出 risk_level 的用例
+NO_RISK_LEVEL = 'NONE'
+
+
+def _label(status: str, output: Optional[Dict[str, Any]]) -> str:
+    """混淆矩阵的行列标签：通过的用例取 risk_level，失败和出错的用例取状态"""
+    if status != 'passed':
+        return status
+    if isinstance(output, dict) and output.get('risk_level') is not None:
+        return str(output['risk_level'])
+    return NO_RISK_LEVEL
+
+
+def _strategy_stats(delta: SummaryDelta) -> Dict[str, Any]:
+    """把一个策略的增量汇总转换为状态计数、风险等级分布和执行时间统计"""
+    summary = TestBatchSummary()
+    delta.merge_into(summary)
+    return {
+        'status_counts': summary.status_counts,
+        'risk_level_distribution': dict(sorted(summary.risk_level_counts.items())),
+        **execution_time_stats(summary, PERCENTILES)
+    }
+
+
+class _PairStats:
+    """一个挑战者相对冠军的累计对比"""
+
+    def __init__(self, strategy_id: int, sample_size: int):
+        self.strategy_id = strategy_id
+        self.sample_size = sample_size
+        self.delta = SummaryDelta()
+        self.compared = 0
+        self.status_agreed = 0
+        self.output_agreed = 0
+        self.confusion = Counter()
+        self.latency_pairs = 0
+        self.latency_diff_sum = 0
+        self.faster = 0
+        self.slower = 0
+        self.disagreements: List[Dict[str, Any]] = []
+
+    def add(self, row) -> None:
+        self.delta.add_result({
+            'status': row.challenger_status,
+            'execution_time': row.challenger_execution_time,
+            'actual_output': row.challenger_output
+        }, from_status=None)
+        self.compared += 1
+        self.status_agreed += row.status == row.challenger_status
+        self.output_agreed += row.status == row.challenger_status and row.actual_output == row.challenger_output
+        champion_label = _label(row.status, row.actual_output)
+        challenger_label = _label(row.challenger_status, row.challenger_output)
+        self.confusion[(champion_label, challenger_label)] += 1
+        if champion_label != challenger_label and len(self.disagreements) < self.sample_size:
+            self.disagreements.append({
+                'case_id': row.id,
+                'champion': {'status': row.status, 'actual_output': row.actual_output},
+                'challenger': {'status': row.challenger_status, 'actual_output': row.challenger_output}
+            })
+        if row.execution_time is not None and row.challenger_execution_time is not None:
+            diff = row.challenger_execution_time - row.execution_time
+            self.latency_pairs += 1
+            self.latency_diff_sum += diff
+            self.faster += diff < 0
+            self.slower += diff > 0
+
+    def report(self) -> Dict[str, Any]:
+        def rate(count: int) -> float:
+            return count / self.compared if self.compared else 0.0
+
+        matrix: Dict[str, Dict[str, int]] = {}
+        for (champion_label, challenger_label), count in sorted(self.confusion.items()):
+            matrix.setdefault(champion_label, {})[challenger_label] = count
+        agreed = sum(count for (champion_label, challenger_label), count in self.confusion.items()
+                     if champion_label == challenger_label)
+        return {
+            'strategy_id': self.strategy_id,
+            'compared_cases': self.compared,
+            'status_agreement_rate': rate(self.status_agreed),
+            'risk_level_agreement_rate': rate(agreed),
+            'output_agreement_rate': rate(self.output_agreed),
+            # 行为冠军的标签，列为挑战者的标签
+            'confusion_matrix': matrix,
+            'latency': {
+                'compared_cases': self.latency_pairs,
+                'avg_diff': self.latency_diff_sum / self.latency_pairs if self.latency_pairs else 0,
+                'faster_rate': self.faster / self.latency_pairs if self.latency_pairs else 0.0,
+                'slower_rate': self.slower / self.latency_pairs if self.latency_pairs else 0.0
+            },
+            **_strategy_stats(self.delta),
+            'disagreements': self.disagreements
+        }
+
+
+def generate_comparison_report(db: Session, batch_id: int, sample_size: Optional[int] = None) -> Dict[str, Any]:
+    """生成对比批次的报告：每个挑战者相对冠军的一致率、混淆矩阵和执行时间差异
+
+    只统计冠军和挑战者都已有结果的用例，批次执行中也可以随时生成。
+    """
+    logger.info(f"Generating comparison report for batch {batch_id}")
+    start_time = time.perf_counter()
+    batch = db.query(TestBatch).filter(TestBatch.id == batch_id).first()
+    if not batch:
+        raise ValueError("Test batch not found")
+    if not batch.challenger_ids:
+        raise ValueError("Test batch is not a comparison batch")
+
+    sample_size = sample_size or REPORT_SAMPLE_SIZE
+    pairs = {strategy_id: _PairStats(strategy_id, sample_size) for strategy_id in batch.challenger_ids}
+    champion = SummaryDelta()
+    query = select(
+        TestCase.id, TestCase.status, TestCase.actual_output, TestCase.execution_time,
+        TestCaseResult.strategy_id,
+        TestCaseResult.status.label('challenger_status'),
+        TestCaseResult.actual_output.label('challenger_output'),
+        TestCaseResult.execution_time.label('challenger_execution_time')
+    ).join(TestCaseResult, TestCaseResult.case_id == TestCase.id).where(
+        TestCase.batch_id == batch_id
+    ).order_by(TestCase.id, TestCaseResult.strategy_id)
+
+    last_case_id, last_strategy_id = 0, 0
+    while True:
+        rows = db.execute(query.where(or_(
+            TestCase.id > last_case_id,
+            and_(TestCase.id == last_case_id, TestCaseResult.strategy_id > last_strategy_id)
+        )).limit(COMPARISON_CHUNK_SIZE)).all()
+        if not rows:
+            break
+        for row in rows:
+            if row.id != last_case_id:
+                # 每个用例的冠军结果只计一次
+                champion.add_result({
+                    'status': row.status,
+                    'execution_time': row.execution_time,
+                    'actual_output': row.actual_output
+                }, from_status=None)
+            last_case_id, last_strategy_id = row.id, row.strategy_id
+            if row.strategy_id in pairs:
+                pairs[row.strategy_id].add(row)
+
+    REPORT_GENERATE_SECONDS.observe(time.perf_counter() - start_time, kind='comparison')
+    return {
+        'batch_id': batch_id,
+        'engine': batch.engine,
+        'status': batch.status,
+        'champion': {'strategy_id': batch.strategy_id, **_strategy_stats(champion)},
+        'challengers': [pair.report() for pair in pairs.values()]
+    }
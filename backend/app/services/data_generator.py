@@ -0,0 +1,276 @@
+"""测试数据生成
+
+用 NumPy 按列向量化生成测试用例，可指定随机种子以便复现。支持的分布
+（data_patterns 中每个字段的 type）：
+
+- random_int：min、max 之间的均匀整数（含两端）
+- random_float：min、max 之间的均匀浮点数
+- normal：均值 mean、标准差 std，可选 min、max 截断
+- lognormal：底层正态分布的 mean、sigma，可选 min、max 截断
+- categorical：从 values 中按 weights（可选）抽取
+- correlated：与数值字段 source 的相关系数为 rho 的正态字段，均值 mean、标准差 std，
+  可选 min、max 截断。source 按整个 count 上的均值和标准差标准化（先用同一随机状态
+  重放一遍生成过程求出），结果的分布与分块大小无关
+
+数据按块生成，大批量时可以边生成边输出 NDJSON 或写入数据库。NumPy 在第一次生成
+数据时才导入，不影响 API 进程的启动时间。
+"""
+import json
+import os
+import math
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from ..schemas.test import TestDataGenerator
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 每次生成的用例数
+GENERATE_CHUNK_SIZE = int(os.getenv("GENERATE_CHUNK_SIZE", 10000))
+
+NUMERIC_TYPES = ('random_int', 'random_float', 'normal', 'lognormal', 'correlated')
+REQUIRED_KEYS = {
+    'random_int': ('min', 'max'),
+    'random_float': ('min', 'max'),
+    'normal': (),
+    'lognormal': (),
+    'categorical': ('values',),
+    'correlated': ('source',)
+}
+
+
+def _ordered_fields(patterns: Dict[str, Dict[str, Any]]) -> List[str]:
+    """按依赖关系排序字段，correlated 字段排在其 source 之后"""
+    ordered: List[str] = []
+    visiting = set()
+
+    def visit(field: str) -> None:
+        if field in ordered:
+            return
+        if field in visiting:
+            raise ValueError(f"Circular correlation on field {field}")
+        visiting.add(field)
+        pattern = patterns[field]
+        if pattern["type"] == "correlated":
+            source = pattern.get("source")
+            if source not in patterns:
+                raise ValueError(f"Unknown source field {source} for {field}")
+            if patterns[source]["type"] not in NUMERIC_TYPES:
+                raise ValueError(f"Source field {source} of {field} is not numeric")
+            visit(source)
+        visiting.discard(field)
+        ordered.append(field)
+
+    for field in patterns:
+        visit(field)
+    return ordered
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _validate_numeric(field: str, kind: str, pattern: Dict[str, Any]) -> None:
+    for key in ("min", "max", "mean", "std", "sigma", "rho"):
+        if key in pattern and not _is_number(pattern[key]):
+            raise ValueError(f"{key} of field {field} must be a number")
+    if kind == "random_int" and not all(isinstance(pattern[key], int) for key in ("min", "max")):
+        raise ValueError(f"min and max of field {field} must be integers")
+    if "min" in pattern and "max" in pattern and pattern["min"] > pattern["max"]:
+        raise ValueError(f"min of field {field} must not be greater than max")
+    for key in ("std", "sigma"):
+        if pattern.get(key, 0) < 0:
+            raise ValueError(f"{key} of field {field} must not be negative")
+    if kind == "correlated" and not -1.0 <= pattern.get("rho", 0.0) <= 1.0:
+        raise ValueError(f"rho of field {field} must be between -1 and 1")
+
+
+def _validate_categorical(field: str, pattern: Dict[str, Any]) -> None:
+    values = pattern["values"]
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Field {field} has no values")
+    weights = pattern.get("weights")
+    if weights is None:
+        return
+    if not isinstance(weights, list) or len(weights) != len(values):
+        raise ValueError(f"weights of field {field} must have one entry per value")
+    if not all(_is_number(weight) and weight >= 0 for weight in weights) or sum(weights) <= 0:
+        raise ValueError(f"weights of field {field} must be non-negative numbers with a positive sum")
+
+
+def validate_config(config: TestDataGenerator) -> None:
+    """检查生成器配置，出错时抛出 ValueError"""
+    if config.count < 0:
+        raise ValueError("count must not be negative")
+    for field, pattern in config.data_patterns.items():
+        kind = pattern.get("type")
+        if kind not in REQUIRED_KEYS:
+            raise ValueError(f"Unsupported data pattern type for {field}: {kind}")
+        missing = [key for key in REQUIRED_KEYS[kind] if key not in pattern]
+        if missing:
+            raise ValueError(f"Field {field} is missing {', '.join(missing)}")
+        if kind == "categorical":
+            _validate_categorical(field, pattern)
+        else:
+            _validate_numeric(field, kind, pattern)
+    _ordered_fields(config.data_patterns)
+
+
+def _clip(values: 'np.ndarray', pattern: Dict[str, Any]) -> 'np.ndarray':
+    import numpy as np
+
+    if "min" in pattern or "max" in pattern:
+        return np.clip(values, pattern.get("min"), pattern.get("max"))
+    return values
+
+
+def _generate_field(
+    rng: 'np.random.Generator',
+    pattern: Dict[str, Any],
+    size: int,
+    columns: Dict[str, 'np.ndarray'],
+    moments: Dict[str, Tuple[float, float]]
+) -> 'np.ndarray':
+    import numpy as np
+
+    kind = pattern["type"]
+    if kind == "random_int":
+        return rng.integers(pattern["min"], pattern["max"], size=size, endpoint=True)
+    if kind == "random_float":
+        return rng.uniform(pattern["min"], pattern["max"], size=size)
+    if kind == "normal":
+        return _clip(rng.normal(pattern.get("mean", 0.0), pattern.get("std", 1.0), size=size), pattern)
+    if kind == "lognormal":
+        return _clip(rng.lognormal(pattern.get("mean", 0.0), pattern.get("sigma", 1.0), size=size), pattern)
+    if kind == "categorical":
+        values = pattern["values"]
+        weights = pattern.get("weights")
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+            weights = weights / weights.sum()
+        return rng.choice(np.asarray(values, dtype=object), size=size, p=weights)
+    if kind == "correlated":
+        rho = float(pattern.get("rho", 0.0))
+        source = columns[pattern["source"]].astype(float)
+        # 使用整个 count 上的均值和标准差；count 为 0、只生成边界值用例时用本块的
+        mean, std = moments.get(pattern["source"], (source.mean(), source.std()))
+        z = (source - mean) / std if std > 0 else np.zeros(size)
+        noise = rng.standard_normal(size)
+        values = rho * z + np.sqrt(1.0 - rho * rho) * noise
+        return _clip(pattern.get("mean", 0.0) + pattern.get("std", 1.0) * values, pattern)
+    raise ValueError(f"Unsupported data pattern type: {kind}")
+
+
+def _generate_columns(
+    rng: 'np.random.Generator',
+    patterns: Dict[str, Dict[str, Any]],
+    fields: List[str],
+    size: int,
+    moments: Dict[str, Tuple[float, float]]
+) -> Dict[str, 'np.ndarray']:
+    columns: Dict[str, 'np.ndarray'] = {}
+    for field in fields:
+        columns[field] = _generate_field(rng, patterns[field], size, columns, moments)
+    return columns
+
+
+def _correlation_depth(patterns: Dict[str, Dict[str, Any]], field: str) -> int:
+    depth = 0
+    while patterns[field]["type"] == "correlated":
+        field = patterns[field]["source"]
+        depth += 1
+    return depth
+
+
+def _source_moments(
+    seed: 'np.random.SeedSequence',
+    patterns: Dict[str, Dict[str, Any]],
+    fields: List[str],
+    count: int,
+    chunk_size: int
+) -> Dict[str, Tuple[float, float]]:
+    """correlated 字段的 source 在整个 count 上的 (均值, 标准差)
+
+    用同一随机种子按相同的分块重放生成过程并合并各块的统计量。source 本身也是
+    correlated 字段时，它的取值依赖上一层的统计量，因此按相关链的深度逐层重放。
+    """
+    import numpy as np
+
+    sources = sorted({pattern["source"] for pattern in patterns.values() if pattern["type"] == "correlated"})
+    moments: Dict[str, Tuple[float, float]] = {}
+    for _ in range(1 + max((_correlation_depth(patterns, source) for source in sources), default=-1)):
+        rng = np.random.default_rng(seed)
+        stats = {source: (0, 0.0, 0.0) for source in sources}
+        remaining = count
+        while remaining > 0:
+            size = min(chunk_size, remaining)
+            columns = _generate_columns(rng, patterns, fields, size, moments)
+            for source in sources:
+                # 按 Chan 等人的方法合并各块的个数、均值和平方差之和
+                n, mean, m2 = stats[source]
+                values = columns[source].astype(float)
+                chunk_mean = values.mean()
+                delta = chunk_mean - mean
+                total = n + size
+                stats[source] = (
+                    total,
+                    mean + delta * size / total,
+                    m2 + ((values - chunk_mean) ** 2).sum() + delta * delta * n * size / total
+                )
+            remaining -= size
+        moments = {
+            source: (float(mean), math.sqrt(m2 / n) if n else 0.0)
+            for source, (n, mean, m2) in stats.items()
+        }
+    return moments
+
+
+def _to_cases(columns: Dict[str, 'np.ndarray'], fields: List[str]) -> List[Dict[str, Any]]:
+    # tolist() 把 NumPy 标量转换为 Python 原生类型，可以直接 JSON 序列化
+    values = [columns[field].tolist() for field in fields]
+    return [{"input_data": dict(zip(fields, row))} for row in zip(*values)]
+
+
+def iter_test_data(config: TestDataGenerator, chunk_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """按块生成测试用例，每块是 {"input_data": {...}} 的列表；最后一块为边界值用例"""
+    import numpy as np
+
+    chunk_size = chunk_size or GENERATE_CHUNK_SIZE
+    patterns = config.data_patterns
+    fields = _ordered_fields(patterns)
+    # 未指定 seed 时也固定本次的熵，统计 source 的重放和正式生成使用相同的随机序列
+    seed = np.random.SeedSequence(config.seed)
+    moments = _source_moments(seed, patterns, fields, config.count, chunk_size)
+    rng = np.random.default_rng(seed)
+
+    remaining = config.count
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        yield _to_cases(_generate_columns(rng, patterns, fields, size, moments), fields)
+        remaining -= size
+
+    # 边界值用例：每个有 min / max 的字段各取一次最小值和最大值，其余字段随机生成
+    if config.include_edge_cases:
+        bounded = [
+            (field, bound)
+            for field in fields
+            for bound in ("min", "max")
+            if bound in patterns[field] and patterns[field]["type"] != "categorical"
+        ]
+        if bounded:
+            columns = _generate_columns(rng, patterns, fields, len(bounded), moments)
+            cases = _to_cases(columns, fields)
+            for case, (field, bound) in zip(cases, bounded):
+                case["input_data"][field] = patterns[field][bound]
+            yield cases
+
+
+def generate_test_data(config: TestDataGenerator) -> List[Dict[str, Any]]:
+    """生成测试数据"""
+    return [case for chunk in iter_test_data(config) for case in chunk]
+
+
+def iter_test_data_ndjson(config: TestDataGenerator) -> Iterator[str]:
+    """以 NDJSON 逐块输出测试数据，格式与批量导入接口一致"""
+    for chunk in iter_test_data(config):
+        yield "".join(json.dumps(case) + "\n" for case in chunk)
@@ -0,0 +1,224 @@
+"""测试用例的执行
+
+把一块用例交给工作进程池或 SQL 引擎执行，并把结果转换为要写回的用例字段。
+进程内调度（services/test.py）和队列 worker（services/job_queue.py）共用这些函数。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .result_cache import caches_rows, get_result_cache, input_hash, strategy_code_hash
+from .result_writer import ResultWriter
+from .sql_engine import SqlStrategyRun, sql_strategy_bind
+from .strategy_cache import StrategyRecord, get_strategy_cache
+from .strategy_runner import MODE_ARRAYS, MODE_FRAME, MODE_SCRIPT, detect_mode
+from .worker_pool import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+# 脚本协议的策略每块执行的用例数上限
+CHUNK_SIZE = int(os.getenv("STRATEGY_CHUNK_SIZE", 100))
+# 批量协议（jsonl / evaluate_batch）的策略每块执行的用例数上限
+BATCH_CHUNK_SIZE = int(os.getenv("STRATEGY_BATCH_CHUNK_SIZE", 5000))
+# 向量化协议（evaluate_frame / evaluate_arrays）的策略每块执行的用例数上限
+VECTORIZED_CHUNK_SIZE = int(os.getenv("STRATEGY_VECTORIZED_CHUNK_SIZE", 200000))
+VECTORIZED_MODES = (MODE_FRAME, MODE_ARRAYS)
+# SQL 策略暂存输入和写回结果的分块大小
+SQL_STAGE_CHUNK_SIZE = int(os.getenv("SQL_STAGE_CHUNK_SIZE", 10000))
+
+CaseInput = Tuple[int, Dict[str, Any]]
+
+
+def chunk_limit_for(mode: str) -> int:
+    """按策略协议返回每块用例数的上限"""
+    if mode in VECTORIZED_MODES:
+        return VECTORIZED_CHUNK_SIZE
+    if mode == MODE_SCRIPT:
+        return CHUNK_SIZE
+    return BATCH_CHUNK_SIZE
+
+
+def _phase(ms: float) -> float:
+    return round(ms, 3)
+
+
+def to_case_result(case_id: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    """把工作进程返回的结果转换为要写回的用例字段，phase_timings 记录各阶段耗时（毫秒）"""
+    phase_timings = {
+        'spawn': _phase(result.get('spawn_ms', 0)),
+        'transfer': _phase(result.get('transfer_ms', 0)),
+        'execute': _phase(result.get('elapsed_ms', 0))
+    }
+    case_result = {
+        'case_id': case_id,
+        'execution_time': int(round(result.get('elapsed_ms', 0))),
+        'actual_output': None,
+        'error_message': None,
+        'phase_timings': phase_timings
+    }
+    if result.get('timeout'):
+        logger.error(f"Test case {case_id} timed out: {result['error']}")
+        case_result.update(status='timeout', error_message=result['error'])
+        return case_result
+    if not result['ok']:
+        logger.error(f"Test case {case_id} failed. Error: {result['error']}")
+        case_result.update(status='failed', error_message=result['error'])
+        return case_result
+    parse_start = time.perf_counter()
+    try:
+        output = result['output'] if 'output' in result else json.loads(result['stdout'])
+    except Exception as e:
+        logger.error(f"Error parsing output of test case {case_id}: {str(e)}")
+        case_result.update(status='error', error_message=str(e))
+        return case_result
+    finally:
+        phase_timings['parse'] = _phase((time.perf_counter() - parse_start) * 1000)
+    case_result.update(status='passed', actual_output=output)
+    return case_result
+
+
+def cached_result(case_id: int, output: Dict[str, Any]) -> Dict[str, Any]:
+    """命中结果缓存的用例，不记录执行时间"""
+    return {'case_id': case_id, 'status': 'passed', 'actual_output': output, 'cached': True}
+
+
+async def evaluate_python_cases(
+    test_cases: List[CaseInput],
+    strategy_code: str,
+    use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """用工作进程池执行一组用例并返回要写回的用例字段
+
+    use_cache 为真且策略可以按行缓存时先查结果缓存，只执行未命中的用例。
+    """
+    case_ids = [case_id for case_id, _ in test_cases]
+    cache = get_result_cache()
+    code_hash = strategy_code_hash(strategy_code)
+    cacheable = use_cache and cache.enabled and caches_rows('python', strategy_code)
+    hashes = [input_hash(input_data) for _, input_data in test_cases] if cacheable else []
+    hits = await cache.lookup(code_hash, hashes) if hashes else {}
+    case_results = []
+    misses = []
+    for index, (case_id, input_data) in enumerate(test_cases):
+        if hashes and hashes[index] in hits:
+            case_results.append(cached_result(case_id, hits[hashes[index]]))
+        else:
+            misses.append(index)
+
+    if misses:
+        try:
+            # 交给常驻工作进程执行，避免每个用例重新启动解释器
+            results = await get_worker_pool().run_chunk(
+                strategy_code, [test_cases[index][1] for index in misses]
+            )
+            outputs = {}
+            for index, result in zip(misses, results):
+                case_result = to_case_result(case_ids[index], result)
+                case_results.append(case_result)
+                if hashes and case_result['status'] == 'passed':
+                    outputs[hashes[index]] = case_result['actual_output']
+            await cache.store(code_hash, outputs)
+        except Exception as e:
+            logger.error(f"Error running test cases starting at {case_ids[0]}: {str(e)}")
+            case_results.extend(
+                {'case_id': case_ids[index], 'status': 'error', 'error_message': str(e)}
+                for index in misses
+            )
+    return case_results
+
+
+async def evaluate_cases(
+    engine: str,
+    strategy_code: str,
+    test_cases: List[CaseInput],
+    use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """按引擎执行一组用例，返回要写回的用例字段"""
+    if engine == 'sql':
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_sql_cases, strategy_code, test_cases)
+    return await evaluate_python_cases(test_cases, strategy_code, use_cache)
+
+
+async def run_test_chunk(writer: ResultWriter, batch_id: int, test_cases: List[CaseInput], strategy_code: str) -> None:
+    """在同一个工作进程中运行一组测试用例，结果交给 writer 批量写回"""
+    case_ids = [case_id for case_id, _ in test_cases]
+    logger.info(f"Running {len(test_cases)} test cases starting at {case_ids[0]}")
+    writer.mark_running(batch_id, case_ids)
+    await writer.put(batch_id, await evaluate_python_cases(test_cases, strategy_code))
+
+
+def strategy_code_for(strategy: StrategyRecord, engine: str) -> Optional[str]:
+    return strategy.sql_code if engine == 'sql' else strategy.python_code
+
+
+async def load_challengers(session: AsyncSession, challenger_ids: List[int], engine: str) -> List[Tuple[int, str]]:
+    """读取对比批次挑战者策略的 (strategy_id, code)，策略不存在或缺少对应引擎的代码时抛出 ValueError"""
+    challengers = []
+    for strategy_id in challenger_ids:
+        strategy = await get_strategy_cache().load_async(session, strategy_id)
+        code = strategy_code_for(strategy, engine) if strategy is not None else None
+        if not code:
+            raise ValueError(f"Challenger strategy {strategy_id} has no {engine} code")
+        challengers.append((strategy_id, code))
+    return challengers
+
+
+def comparison_chunk_limit(engine: str, codes: Iterable[str]) -> int:
+    """对比批次每块用例数的上限：同一块要交给每个策略执行，取各策略上限中最小的"""
+    if engine == 'sql':
+        return SQL_STAGE_CHUNK_SIZE
+    return min(chunk_limit_for(detect_mode(code)) for code in codes)
+
+
+async def run_comparison_chunk(
+    writer: ResultWriter,
+    batch_id: int,
+    test_cases: List[CaseInput],
+    engine: str,
+    champion_code: str,
+    challengers: List[Tuple[int, str]]
+) -> None:
+    """对比批次：同一块输入依次交给冠军策略和每个挑战者策略执行，结果在同一次刷新中写回
+
+    challengers 为 (strategy_id, code) 列表。冠军策略的结果写回用例本身，挑战者的结果
+    写入 test_case_results。对比要比较各策略实际的执行时间，不使用结果缓存。
+    """
+    case_ids = [case_id for case_id, _ in test_cases]
+    logger.info(f"Comparing {len(challengers) + 1} strategies on {len(test_cases)} test cases starting at {case_ids[0]}")
+    writer.mark_running(batch_id, case_ids)
+    results = await evaluate_cases(engine, champion_code, test_cases, use_cache=False)
+    challenger_results = []
+    for strategy_id, code in challengers:
+        for result in await evaluate_cases(engine, code, test_cases, use_cache=False):
+            challenger_results.append({**result, 'strategy_id': strategy_id})
+    await writer.put(batch_id, results, challenger_results)
+
+
+def run_sql_cases(sql_code: str, test_cases: List[CaseInput]) -> List[Dict[str, Any]]:
+    """对一块用例以集合方式执行 SQL 策略，返回要写回的用例字段（在线程池中运行）"""
+    try:
+        with SqlStrategyRun(sql_code, bind=sql_strategy_bind()) as run:
+            run.stage([(case_id, input_data or {}) for case_id, input_data in test_cases])
+            outputs = dict(run.execute())
+            execution_time, phase_timings = run.case_timings(len(test_cases))
+    except Exception as e:
+        logger.error(f"Error executing SQL strategy: {str(e)}")
+        return [
+            {'case_id': case_id, 'status': 'failed', 'error_message': str(e)}
+            for case_id, _ in test_cases
+        ]
+    results = []
+    for case_id, _ in test_cases:
+        result = {'case_id': case_id, 'execution_time': execution_time, 'phase_timings': dict(phase_timings)}
+        if case_id in outputs:
+            result.update(status='passed', actual_output=outputs[case_id])
+        else:
+            result.update(status='failed', error_message="SQL 未返回该用例的结果")
+        results.append(result)
+    return results
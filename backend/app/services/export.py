@@ -0,0 +1,303 @@
+"""批次结果导出
+
+按主键分块（keyset）读取批次的用例，把 input_data 和 actual_output 展开为带类型的
+列，以 Parquet、Arrow IPC 流或 CSV 逐块输出。每次只在内存中保留一块，导出千万级
+的批次内存占用也保持不变。
+
+列的类型由第一块推断：全为布尔的字段为 bool，全为整数的为 int64，数值为 float64，
+字符串为 string，对象和数组序列化为 JSON 字符串。第一块中没有出现的字段，或之后
+取值与推断类型不符的单元格，写入 input_extra / output_extra 列（JSON 对象），不会
+丢失数据。
+
+Parquet 和 Arrow 需要安装 pyarrow，未安装时只能导出 CSV。
+"""
+import csv
+import importlib.util
+import io
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models.test import TestCase
+
+logger = logging.getLogger(__name__)
+
+# 每次读取和输出的用例数，也是 Parquet 的行组大小
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 50000))
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMAT_CSV = 'csv'
+
+MEDIA_TYPES = {
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+    FORMAT_CSV: 'text/csv',
+}
+
+EXTENSIONS = {
+    FORMAT_PARQUET: 'parquet',
+    FORMAT_ARROW: 'arrows',
+    FORMAT_CSV: 'csv',
+}
+
+# 展开的 JSON 列：（前缀，用例字段，放不进类型列的取值所在的列）
+JSON_SOURCES = (
+    ('input', 'input_data', 'input_extra'),
+    ('output', 'actual_output', 'output_extra'),
+)
+
+TYPE_BOOL = 'bool'
+TYPE_INT = 'int64'
+TYPE_FLOAT = 'float64'
+TYPE_STRING = 'string'
+TYPE_JSON = 'json'
+
+# 固定的列和类型
+BASE_COLUMNS = (
+    ('case_id', TYPE_INT),
+    ('status', TYPE_STRING),
+    ('execution_time', TYPE_INT),
+    ('error_message', TYPE_STRING),
+)
+
+
+def arrow_available() -> bool:
+    """是否可以导出 Parquet / Arrow（已安装 pyarrow）"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def default_format() -> str:
+    return FORMAT_PARQUET if arrow_available() else FORMAT_CSV
+
+
+def _infer_type(values: List[Any]) -> str:
+    values = [value for value in values if value is not None]
+    if not values:
+        return TYPE_STRING
+    if all(isinstance(value, bool) for value in values):
+        return TYPE_BOOL
+    if any(isinstance(value, bool) for value in values):
+        return TYPE_JSON
+    if all(isinstance(value, int) for value in values):
+        return TYPE_INT
+    if all(isinstance(value, (int, float)) for value in values):
+        return TYPE_FLOAT
+    if all(isinstance(value, str) for value in values):
+        return TYPE_STRING
+    return TYPE_JSON
+
+
+def _json_dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _convert_bool(value: Any) -> bool:
+    if not isinstance(value, bool):
+        raise TypeError
+    return value
+
+
+def _convert_int(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, int) or not -2 ** 63 <= value < 2 ** 63:
+        raise TypeError
+    return value
+
+
+def _convert_float(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError
+    return float(value)
+
+
+def _convert_string(value: Any) -> str:
+    if not isinstance(value, str):
+        raise TypeError
+    return value
+
+
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    TYPE_BOOL: _convert_bool,
+    TYPE_INT: _convert_int,
+    TYPE_FLOAT: _convert_float,
+    TYPE_STRING: _convert_string,
+    TYPE_JSON: _json_dumps,
+}
+
+
+class ExportSchema:
+    """导出的列和类型，由第一块用例推断"""
+
+    def __init__(self, rows: List[Any]):
+        self.fields: Dict[str, List[Tuple[str, str]]] = {}
+        for prefix, attr, _ in JSON_SOURCES:
+            samples: Dict[str, List[Any]] = {}
+            for row in rows:
+                data = getattr(row, attr)
+                if isinstance(data, dict):
+                    for key, value in data.items():
+                        samples.setdefault(key, []).append(value)
+            self.fields[attr] = [(key, _infer_type(values)) for key, values in samples.items()]
+
+    @property
+    def columns(self) -> List[Tuple[str, str]]:
+        columns = list(BASE_COLUMNS)
+        for prefix, attr, extra in JSON_SOURCES:
+            columns += [(f"{prefix}.{key}", kind) for key, kind in self.fields[attr]]
+            columns.append((extra, TYPE_JSON))
+        return columns
+
+    def to_columns(self, rows: List[Any]) -> Dict[str, List[Any]]:
+        """把一块用例转换为 列名 -> 取值列表，JSON 列的取值已序列化为字符串"""
+        columns: Dict[str, List[Any]] = {
+            'case_id': [row.id for row in rows],
+            'status': [row.status for row in rows],
+            'execution_time': [row.execution_time for row in rows],
+            'error_message': [row.error_message for row in rows],
+        }
+        for prefix, attr, extra_column in JSON_SOURCES:
+            fields = self.fields[attr]
+            values = {key: [] for key, _ in fields}
+            extras = []
+            for row in rows:
+                data = getattr(row, attr)
+                if not isinstance(data, dict):
+                    data = {} if data is None else {'': data}
+                extra = {key: value for key, value in data.items() if key not in values}
+                for key, kind in fields:
+                    value = data.get(key)
+                    if value is not None:
+                        try:
+                            value = CONVERTERS[kind](value)
+                        except (TypeError, ValueError):
+                            extra[key] = value
+                            value = None
+                    values[key].append(value)
+                extras.append(_json_dumps(extra) if extra else None)
+            for key, _ in fields:
+                columns[f"{prefix}.{key}"] = values[key]
+            columns[extra_column] = extras
+        return columns
+
+
+def _iter_chunks(db: Session, batch_id: int, chunk_size: int) -> Iterator[List[Any]]:
+    """按主键顺序分块读取用例，每块结束后提交，不长时间占用事务"""
+    last_id = 0
+    while True:
+        rows = db.query(
+            TestCase.id, TestCase.status, TestCase.execution_time, TestCase.error_message,
+            TestCase.input_data, TestCase.actual_output
+        ).filter(
+            TestCase.batch_id == batch_id,
+            TestCase.id > last_id
+        ).order_by(TestCase.id).limit(chunk_size).all()
+        db.commit()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的输出流，pyarrow 写入的字节在每块之后取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _arrow_schema(columns: List[Tuple[str, str]]):
+    import pyarrow as pa
+
+    types = {
+        TYPE_BOOL: pa.bool_(),
+        TYPE_INT: pa.int64(),
+        TYPE_FLOAT: pa.float64(),
+        TYPE_STRING: pa.string(),
+        TYPE_JSON: pa.string(),
+    }
+    return pa.schema([pa.field(name, types[kind]) for name, kind in columns])
+
+
+def _export_arrow(chunks: Iterator[List[Any]], fmt: str) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    first = next(chunks, [])
+    schema = ExportSchema(first)
+    arrow_schema = _arrow_schema(schema.columns)
+    sink = _ChunkSink()
+    if fmt == FORMAT_PARQUET:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, arrow_schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, arrow_schema)
+    try:
+        for rows in _chain(first, chunks):
+            columns = schema.to_columns(rows)
+            table = pa.Table.from_pydict(columns, schema=arrow_schema)
+            if fmt == FORMAT_PARQUET:
+                writer.write_table(table, row_group_size=len(rows))
+            else:
+                writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def _export_csv(chunks: Iterator[List[Any]]) -> Iterator[bytes]:
+    first = next(chunks, [])
+    schema = ExportSchema(first)
+    names = [name for name, _ in schema.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in _chain(first, chunks):
+        columns = schema.to_columns(rows)
+        writer.writerows(zip(*(columns[name] for name in names)))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _chain(first: List[Any], rest: Iterator[List[Any]]) -> Iterator[List[Any]]:
+    if first:
+        yield first
+    yield from rest
+
+
+def iter_export(batch_id: int, fmt: str, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """逐块输出批次的导出文件内容，使用独立的数据库会话（在线程池中迭代）"""
+    logger.info(f"Exporting batch {batch_id} as {fmt}")
+    db = SessionLocal()
+    try:
+        chunks = _iter_chunks(db, batch_id, chunk_size or EXPORT_CHUNK_SIZE)
+        if fmt == FORMAT_CSV:
+            yield from _export_csv(chunks)
+        else:
+            yield from _export_arrow(chunks, fmt)
+    finally:
+        db.close()
@@ -0,0 +1,138 @@
+"""测试用例批量导入
+
+按块批量写入 test_cases：PostgreSQL 上使用 COPY，其他数据库使用 executemany。
+支持从 NDJSON / CSV 流中逐行解析用例，整个批次不需要一次性放进内存。
+"""
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models.test import TestCase
+from .summary import SummaryDelta, apply_delta
+
+logger = logging.getLogger(__name__)
+
+# 每次批量写入的用例数
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 10000))
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+
+_COPY_SQL = (
+    "COPY test_cases (batch_id, input_data, expected_output, status) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """逐行解析 NDJSON
+
+    每行可以是 {"input_data": {...}, "expected_output": {...}}，也可以直接是输入对象。
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {line_no}: {str(e)}")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_no} is not a JSON object")
+        if 'input_data' in record:
+            yield {'input_data': record['input_data'], 'expected_output': record.get('expected_output')}
+        else:
+            yield {'input_data': record, 'expected_output': None}
+
+
+def _csv_value(value: str) -> Any:
+    if value == '':
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """逐行解析带表头的 CSV，每列作为 input_data 的一个字段，数字自动转换类型"""
+    for row in csv.DictReader(lines):
+        yield {
+            'input_data': {key: _csv_value(value) for key, value in row.items() if key},
+            'expected_output': None
+        }
+
+
+def parse_upload(lines: Iterable[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == FORMAT_NDJSON:
+        return parse_ndjson(lines)
+    if fmt == FORMAT_CSV:
+        return parse_csv(lines)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _copy_chunk(db: Session, batch_id: int, rows) -> None:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        expected = row.get('expected_output')
+        writer.writerow([
+            batch_id,
+            json.dumps(row['input_data']),
+            json.dumps(expected) if expected is not None else '',
+            'pending'
+        ])
+    buf.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(_COPY_SQL, buf)
+    finally:
+        cursor.close()
+
+
+def _insert_chunk(db: Session, batch_id: int, rows) -> None:
+    db.execute(TestCase.__table__.insert(), [
+        {
+            'batch_id': batch_id,
+            'input_data': row['input_data'],
+            'expected_output': row.get('expected_output'),
+            'status': 'pending'
+        }
+        for row in rows
+    ])
+
+
+def bulk_insert_cases(
+    db: Session,
+    batch_id: int,
+    rows: Iterable[Dict[str, Any]],
+    chunk_size: Optional[int] = None
+) -> int:
+    """按块写入测试用例，每块提交一次，返回写入的用例数"""
+    chunk_size = chunk_size or INGEST_CHUNK_SIZE
+    bind = db.get_bind()
+    use_copy = bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2'
+    write_chunk = _copy_chunk if use_copy else _insert_chunk
+
+    total = 0
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            break
+        write_chunk(db, batch_id, chunk)
+        delta = SummaryDelta()
+        delta.move(None, 'pending', len(chunk))
+        apply_delta(db, batch_id, delta)
+        db.commit()
+        total += len(chunk)
+        logger.info(f"Ingested {total} test cases for batch {batch_id}")
+    return total
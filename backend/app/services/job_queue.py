@@ -0,0 +1,322 @@
+"""基于数据库的持久化任务队列
+
+EXECUTION_BACKEND=queue 时，API 只把批次标记为已入队，由任意数量的 worker 进程
+（backend/worker.py，可部署在多台机器上）用 SELECT ... FOR UPDATE SKIP LOCKED
+认领待执行的用例块。worker 定期为认领的用例发送心跳，心跳超时的认领会被放回队列，
+进程重启不会丢失未完成的批次。
+"""
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, exists, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..database import AsyncSessionLocal
+from ..models.test import TestBatch, TestCase
+from .execution import (
+    SQL_STAGE_CHUNK_SIZE, chunk_limit_for, comparison_chunk_limit, load_challengers, run_comparison_chunk,
+    run_sql_cases, run_test_chunk, strategy_code_for
+)
+from .progress import notify_progress
+from .result_writer import ResultWriter
+from .strategy_cache import StrategyRecord, get_strategy_cache
+from .strategy_runner import detect_mode
+from .summary import SummaryDelta, apply_delta_async
+from .worker_pool import POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# inprocess：在 API 进程内执行批次；queue：由独立的 worker 进程从数据库队列中认领执行
+EXECUTION_BACKEND = os.getenv("EXECUTION_BACKEND", "inprocess")
+# 心跳间隔和认领超时（秒）
+HEARTBEAT_INTERVAL = float(os.getenv("QUEUE_HEARTBEAT_INTERVAL", 10))
+CLAIM_TIMEOUT = float(os.getenv("QUEUE_CLAIM_TIMEOUT", 60))
+# 队列为空时的轮询间隔（秒）
+POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", 1))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_batch(db: Session, batch_id: int) -> None:
+    """把批次交给队列 worker 执行"""
+    db.query(TestBatch).filter(TestBatch.id == batch_id).update(
+        {'enqueued_at': _now()}, synchronize_session=False
+    )
+    db.commit()
+    logger.info(f"Enqueued test batch {batch_id}")
+
+
+async def claim_cases(
+    session: AsyncSession, worker_id: str, batch_id: int, limit: int
+) -> List[Tuple[int, Dict[str, Any]]]:
+    """认领批次中最多 limit 个待执行用例，返回 (id, input_data) 列表
+
+    PostgreSQL 上通过行锁跳过其他 worker 正在认领的行；对不支持 SKIP LOCKED 的数据库，
+    UPDATE 的 status 条件保证同一用例只会被一个 worker 认领。
+    """
+    rows = (await session.execute(
+        select(TestCase.id, TestCase.input_data).where(
+            TestCase.batch_id == batch_id,
+            TestCase.status == 'pending'
+        ).order_by(TestCase.id).limit(limit).with_for_update(skip_locked=True)
+    )).all()
+    if not rows:
+        await session.commit()
+        return []
+
+    ids = [row.id for row in rows]
+    result = await session.execute(
+        update(TestCase).where(
+            TestCase.batch_id == batch_id,
+            TestCase.id.in_(ids),
+            TestCase.status == 'pending'
+        ).values(status='running', claimed_by=worker_id, heartbeat_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(ids):
+        claimed = set((await session.execute(
+            select(TestCase.id).where(TestCase.id.in_(ids), TestCase.claimed_by == worker_id,
+                                      TestCase.status == 'running')
+        )).scalars())
+        rows = [row for row in rows if row.id in claimed]
+    delta = SummaryDelta()
+    delta.move('pending', 'running', len(rows))
+    await apply_delta_async(session, batch_id, delta)
+    await session.execute(
+        update(TestBatch).where(
+            TestBatch.id == batch_id,
+            TestBatch.status == 'pending'
+        ).values(status='running')
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return [(row.id, row.input_data) for row in rows]
+
+
+async def heartbeat(session: AsyncSession, worker_id: str) -> None:
+    """刷新本 worker 所有在执行用例的心跳时间"""
+    await session.execute(
+        update(TestCase).where(
+            TestCase.claimed_by == worker_id,
+            TestCase.status == 'running'
+        ).values(heartbeat_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+
+
+async def requeue_stale_claims(session: AsyncSession, timeout: float = CLAIM_TIMEOUT) -> int:
+    """把心跳超时的认领放回队列，返回放回的用例数"""
+    stale = and_(
+        TestCase.status == 'running',
+        TestCase.claimed_by.isnot(None),
+        TestCase.heartbeat_at < _now() - timedelta(seconds=timeout)
+    )
+    stale_ids = (await session.execute(
+        select(TestCase.id, TestCase.batch_id).where(stale).with_for_update(skip_locked=True)
+    )).all()
+    if not stale_ids:
+        await session.commit()
+        return 0
+    await session.execute(
+        update(TestCase).where(
+            TestCase.id.in_([row.id for row in stale_ids]),
+            TestCase.status == 'running'
+        ).values(status='pending', claimed_by=None, heartbeat_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    deltas: Dict[int, SummaryDelta] = {}
+    for row in stale_ids:
+        deltas.setdefault(row.batch_id, SummaryDelta()).move('running', 'pending')
+    for batch_id in sorted(deltas):
+        await apply_delta_async(session, batch_id, deltas[batch_id])
+    await session.commit()
+    logger.warning(f"Requeued {len(stale_ids)} stale test cases")
+    return len(stale_ids)
+
+
+async def finalize_finished_batches(session: AsyncSession) -> None:
+    """把已入队且没有待执行、执行中用例的批次标记为完成或失败"""
+    unfinished = exists().where(
+        TestCase.batch_id == TestBatch.id,
+        TestCase.status.in_(['pending', 'running'])
+    )
+    batch_ids = (await session.execute(
+        select(TestBatch.id).where(
+            TestBatch.enqueued_at.isnot(None),
+            TestBatch.status.in_(['pending', 'running']),
+            ~unfinished
+        )
+    )).scalars().all()
+    for batch_id in batch_ids:
+        failed_cases = await session.scalar(
+            select(func.count(TestCase.id)).where(
+                TestCase.batch_id == batch_id,
+                TestCase.status.in_(['failed', 'error', 'timeout'])
+            )
+        )
+        await session.execute(
+            update(TestBatch).where(
+                TestBatch.id == batch_id,
+                TestBatch.status.in_(['pending', 'running'])
+            ).values(status='failed' if failed_cases > 0 else 'completed')
+            .execution_options(synchronize_session=False)
+        )
+        logger.info(f"Finalized queued test batch {batch_id}")
+    await session.commit()
+
+
+class QueueWorker:
+    """从数据库队列认领并执行测试用例的 worker"""
+
+    def __init__(self, worker_id: Optional[str] = None, concurrency: int = POOL_SIZE):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self._stopping = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._task_batches: Dict[asyncio.Task, int] = {}
+
+    def stop(self) -> None:
+        logger.info(f"Worker {self.worker_id} stopping")
+        self._stopping.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        logger.info(f"Worker {self.worker_id} started with concurrency {self.concurrency}")
+        slots = asyncio.Semaphore(self.concurrency)
+        maintenance = asyncio.create_task(self._maintenance())
+        async with ResultWriter() as writer, AsyncSessionLocal() as session:
+            while not self._stopping.is_set():
+                await slots.acquire()
+                try:
+                    claim = await self._claim(session)
+                except Exception as e:
+                    logger.error(f"Error claiming test cases: {str(e)}")
+                    await session.rollback()
+                    claim = None
+                if claim is None:
+                    slots.release()
+                    await self._sleep(POLL_INTERVAL)
+                    continue
+                task = asyncio.create_task(self._execute(writer, *claim))
+                self._tasks.add(task)
+                self._task_batches[task] = claim[0].id
+                task.add_done_callback(lambda t: self._task_batches.pop(t, None))
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        maintenance.cancel()
+        await asyncio.gather(maintenance, return_exceptions=True)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _claim(self, session: AsyncSession):
+        """按优先级加权随机选择一个批次并认领一块用例，没有可执行的用例时返回 None"""
+        batches = (await session.execute(
+            select(
+                TestBatch.id, TestBatch.strategy_id, TestBatch.challenger_ids, TestBatch.priority, TestBatch.engine
+            ).where(
+                TestBatch.enqueued_at.isnot(None),
+                TestBatch.status.in_(['pending', 'running'])
+            )
+        )).all()
+        while batches:
+            weights = [(batch.priority or 0) + 1 for batch in batches]
+            batch = random.choices(batches, weights=weights)[0]
+            batches.remove(batch)
+            strategy = await get_strategy_cache().load_async(session, batch.strategy_id)
+            if strategy is None or not strategy_code_for(strategy, batch.engine):
+                await self._fail_batch(session, batch.id, f"Strategy {batch.strategy_id} has no {batch.engine} code")
+                continue
+            challengers = []
+            if batch.challenger_ids:
+                try:
+                    challengers = await load_challengers(session, batch.challenger_ids, batch.engine)
+                except ValueError as e:
+                    await self._fail_batch(session, batch.id, str(e))
+                    continue
+                codes = [strategy_code_for(strategy, batch.engine)] + [code for _, code in challengers]
+                claim_size = comparison_chunk_limit(batch.engine, codes)
+            elif batch.engine == 'sql':
+                claim_size = SQL_STAGE_CHUNK_SIZE
+            else:
+                claim_size = chunk_limit_for(detect_mode(strategy.python_code))
+            cases = await claim_cases(session, self.worker_id, batch.id, claim_size)
+            if cases:
+                return batch, strategy, challengers, cases
+        await session.commit()
+        return None
+
+    async def _fail_batch(self, session: AsyncSession, batch_id: int, reason: str) -> None:
+        """把无法执行的批次标记为失败，不再参与认领；与 run_test_batch 一致，用例保持原状态"""
+        logger.error(f"Failing queued test batch {batch_id}: {reason}")
+        await session.execute(
+            update(TestBatch).where(
+                TestBatch.id == batch_id,
+                TestBatch.status.in_(['pending', 'running'])
+            ).values(status='failed')
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        notify_progress()
+
+    async def _execute(self, writer: ResultWriter, batch, strategy: StrategyRecord, challengers, cases) -> None:
+        logger.info(f"Worker {self.worker_id} executing {len(cases)} cases of batch {batch.id}")
+        if challengers:
+            await run_comparison_chunk(
+                writer, batch.id, cases, batch.engine, strategy_code_for(strategy, batch.engine), challengers
+            )
+        elif batch.engine == 'sql':
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, run_sql_cases, strategy.sql_code, cases)
+            await writer.put(batch.id, results)
+        else:
+            await run_test_chunk(writer, batch.id, cases, strategy.python_code)
+
+    async def _cancel_stopped_batches(self, session: AsyncSession) -> None:
+        """取消本 worker 正在执行的、已被取消的批次的任务，结束对应的策略进程"""
+        batch_ids = set(self._task_batches.values())
+        if not batch_ids:
+            return
+        cancelled = set((await session.execute(
+            select(TestBatch.id).where(TestBatch.id.in_(batch_ids), TestBatch.status == 'cancelled')
+        )).scalars())
+        for task, batch_id in list(self._task_batches.items()):
+            if batch_id in cancelled:
+                logger.info(f"Worker {self.worker_id} cancelling running cases of batch {batch_id}")
+                task.cancel()
+
+    async def _maintenance(self) -> None:
+        """定期发送心跳、回收超时认领、收尾已完成的批次并停止已取消的批次"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as session:
+                    await heartbeat(session, self.worker_id)
+                    await requeue_stale_claims(session)
+                    await finalize_finished_batches(session)
+                    await self._cancel_stopped_batches(session)
+            except Exception as e:
+                logger.error(f"Error in queue maintenance: {str(e)}")
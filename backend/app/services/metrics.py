@@ -0,0 +1,239 @@
+"""运行指标
+
+进程内的计数器、直方图和抓取时计算的仪表，以 Prometheus 文本格式（0.0.4）由
+/metrics 输出。不依赖 prometheus_client；多个 API 进程或队列 worker 各自统计本进程
+的指标。
+
+用例的阶段耗时（毫秒）：
+- spawn：取得工作进程的时间，没有空闲进程时包括启动解释器和加载策略，按块内用例数平摊
+- transfer：与工作进程之间序列化和管道传输的时间，按块内用例数平摊
+- execute：策略本身的执行时间（即 TestCase.execution_time）
+- parse：解析策略输出的时间
+- persist：结果在写回缓冲中等待刷新的时间；写库和提交本身的耗时见 crm_db_commit_seconds
+- stage：SQL 策略把输入写入暂存表的时间，按用例数平摊
+"""
+import bisect
+import threading
+import time
+from collections import Counter as CounterDict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..models.test import TestBatch, TestBatchSummary
+from .scheduler import peek_scheduler
+from .worker_pool import peek_worker_pool
+
+# 吞吐量按最近多少秒计算
+THROUGHPUT_WINDOW = 60.0
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., 总数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, count: int = 1, **labels: str) -> None:
+        """记录 count 次取值为 value 的观测"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += count
+            state[-2] += count
+            state[-1] += value * count
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', _format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(float(state[-1]))}")
+        return lines
+
+
+class Gauge(_Metric):
+    """抓取时由回调计算的仪表，回调接收数据库会话，返回 {标签值元组: 数值}"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[Session], Dict[LabelValues, float]], labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def samples(self, db: Session) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self.collect(db).items())
+        ]
+
+
+class _Throughput:
+    """最近一段时间内写回的用例数"""
+
+    def __init__(self, window: float = THROUGHPUT_WINDOW):
+        self.window = window
+        self._events: deque = deque()
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, count))
+            self._trim(now)
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return sum(count for _, count in self._events) / self.window
+
+    def _trim(self, now: float) -> None:
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+
+CASES_TOTAL = Counter('crm_cases_total', 'Test case results written back by this process', ['status'])
+CASE_PHASE_SECONDS = Histogram('crm_case_phase_seconds', 'Per-case time spent in each execution phase', ['phase'])
+DB_COMMIT_SECONDS = Histogram('crm_db_commit_seconds', 'Latency of result write-back commits', ['source'])
+REPORT_RENDER_SECONDS = Histogram('crm_report_render_seconds', 'Time to produce report chart images, chart cache hits included')
+REPORT_GENERATE_SECONDS = Histogram('crm_report_generate_seconds', 'Time to build a test report', ['kind'])
+
+_throughput = _Throughput()
+
+
+def record_results(results: Iterable[Dict]) -> None:
+    """登记一组写回的用例结果：按状态计数、计入吞吐量，并记录各阶段耗时
+
+    按块平摊的阶段耗时在同一块内相同，先合并相同的取值再记入直方图。
+    """
+    statuses = CounterDict()
+    phases = CounterDict()
+    for result in results:
+        statuses[result['status']] += 1
+        for phase, ms in (result.get('phase_timings') or {}).items():
+            phases[(phase, ms)] += 1
+    for status, count in statuses.items():
+        CASES_TOTAL.inc(count, status=status)
+    for (phase, ms), count in phases.items():
+        CASE_PHASE_SECONDS.observe(ms / 1000, count, phase=phase)
+    _throughput.add(sum(statuses.values()))
+
+
+def _queue_depth(db: Session) -> Dict[LabelValues, float]:
+    """未结束批次中待执行和执行中的用例数，从批次汇总读取"""
+    depth = {('pending',): 0, ('running',): 0}
+    rows = db.query(TestBatchSummary.status_counts).join(
+        TestBatch, TestBatch.id == TestBatchSummary.batch_id
+    ).filter(TestBatch.status.in_(['pending', 'running'])).all()
+    for (counts,) in rows:
+        for status in ('pending', 'running'):
+            depth[(status,)] += (counts or {}).get(status, 0)
+    return depth
+
+
+def _worker_pool_stats(db: Session = None) -> Dict[LabelValues, float]:
+    pool = peek_worker_pool()
+    if pool is None:
+        return {('size',): 0, ('busy',): 0, ('idle',): 0}
+    return {('size',): pool.size, ('busy',): pool.busy, ('idle',): pool.idle}
+
+
+def _worker_utilization(db: Session) -> Dict[LabelValues, float]:
+    stats = _worker_pool_stats()
+    size = stats[('size',)]
+    return {(): stats[('busy',)] / size if size else 0.0}
+
+
+def _scheduler_stats(db: Session) -> Dict[LabelValues, float]:
+    scheduler = peek_scheduler()
+    if scheduler is None:
+        return {('active_batches',): 0, ('running_jobs',): 0}
+    return {('active_batches',): scheduler.active_batches, ('running_jobs',): scheduler.running_jobs}
+
+
+GAUGES = (
+    Gauge('crm_queue_depth', 'Unfinished test cases of unfinished batches', _queue_depth, ['status']),
+    Gauge('crm_cases_per_second', f'Test case results written per second over the last {THROUGHPUT_WINDOW:g}s',
+          lambda db: {(): _throughput.rate()}),
+    Gauge('crm_worker_pool_workers', 'Strategy worker processes by state', _worker_pool_stats, ['state']),
+    Gauge('crm_worker_pool_utilization', 'Busy strategy worker processes divided by pool size', _worker_utilization),
+    Gauge('crm_scheduler', 'Batches and jobs held by the in-process scheduler', _scheduler_stats, ['kind']),
+)
+METRICS = (CASES_TOTAL, CASE_PHASE_SECONDS, DB_COMMIT_SECONDS, REPORT_RENDER_SECONDS, REPORT_GENERATE_SECONDS)
+
+
+def render_metrics(db: Session) -> str:
+    """以 Prometheus 文本格式输出全部指标"""
+    lines = []
+    for gauge in GAUGES:
+        lines += gauge.header() + gauge.samples(db)
+    for metric in METRICS:
+        lines += metric.header() + metric.samples()
+    return '\n'.join(lines) + '\n'
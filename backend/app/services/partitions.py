@@ -0,0 +1,115 @@
+"""test_cases 按批次分区（仅 PostgreSQL）
+
+设置 TEST_CASE_PARTITIONING=batch 后，新建的数据库中 test_cases 为按 batch_id 的
+LIST 分区表，每个批次在创建时得到自己的分区 test_cases_b<批次号>。删除批次时直接
+DROP 该分区，归档时把分区 DETACH 为独立的表 archived_test_cases_<批次号>，耗时都与
+用例数无关。
+
+分区表的主键为 (id, batch_id)，test_case_results.case_id 不再有外键约束。已存在的
+非分区 test_cases 不会被自动转换，见 README。进程按数据库中表的实际类型判断是否
+分区，与本进程的环境变量无关。
+"""
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models.test import TestCase
+
+logger = logging.getLogger(__name__)
+
+PARTITION_BY_BATCH = 'batch'
+# 新建 test_cases 时的分区方式，目前只支持 batch
+TEST_CASE_PARTITIONING = os.getenv("TEST_CASE_PARTITIONING", "").lower()
+
+_partitioned: Optional[bool] = None
+
+
+def partitioning_requested(bind) -> bool:
+    return TEST_CASE_PARTITIONING == PARTITION_BY_BATCH and bind.dialect.name == 'postgresql'
+
+
+def is_partitioned_table(bind, table_name: str = TestCase.__tablename__) -> bool:
+    if bind.dialect.name != 'postgresql':
+        return False
+    relkind = bind.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {'name': table_name}
+    ).scalar()
+    return relkind == 'p'
+
+
+def cases_partitioned(db: Session) -> bool:
+    """test_cases 是否为分区表，结果在进程内缓存"""
+    global _partitioned
+    if _partitioned is None:
+        _partitioned = is_partitioned_table(db.connection())
+    return _partitioned
+
+
+def partition_name(batch_id: int) -> str:
+    return f"{TestCase.__tablename__}_b{int(batch_id)}"
+
+
+def archive_table_name(batch_id: int) -> str:
+    return f"archived_{TestCase.__tablename__}_{int(batch_id)}"
+
+
+def create_partitioned_cases_table(conn: Connection) -> None:
+    """按模型的列定义创建按 batch_id 分区的 test_cases，不含索引（随后在父表上创建）"""
+    table = TestCase.__table__
+    table.c.status.type.create(conn, checkfirst=True)
+    ddl = conn.dialect.ddl_compiler(conn.dialect, None)
+    columns = ', '.join(ddl.get_column_specification(column) for column in table.columns)
+    conn.execute(text(
+        f"CREATE TABLE {table.name} ({columns}, "
+        f"PRIMARY KEY (id, batch_id), "
+        f"FOREIGN KEY (batch_id) REFERENCES test_batches (id)) "
+        f"PARTITION BY LIST (batch_id)"
+    ))
+    logger.info(f"Created {table.name} partitioned by batch_id")
+
+
+def create_batch_partition(db: Session, batch_id: int) -> None:
+    """为批次创建用例分区，在创建批次记录的事务中调用；未分区时不做任何事"""
+    if not cases_partitioned(db):
+        return
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(batch_id)} "
+        f"PARTITION OF {TestCase.__tablename__} FOR VALUES IN ({int(batch_id)})"
+    ))
+
+
+def _has_partition(db: Session, batch_id: int) -> bool:
+    return db.execute(
+        text("SELECT to_regclass(:name) IS NOT NULL"), {'name': partition_name(batch_id)}
+    ).scalar()
+
+
+def drop_batch_partition(db: Session, batch_id: int) -> bool:
+    """删除批次的用例分区，返回是否存在该分区；不存在时由调用方按行删除"""
+    if not cases_partitioned(db) or not _has_partition(db, batch_id):
+        return False
+    db.execute(text(f"DROP TABLE {partition_name(batch_id)}"))
+    return True
+
+
+def archive_batch_partition(db: Session, batch_id: int) -> str:
+    """把批次的用例分区分离为独立的归档表并去掉其外键，返回归档表名
+
+    未分区或批次没有自己的分区时抛出 ValueError。
+    """
+    if not cases_partitioned(db) or not _has_partition(db, batch_id):
+        raise ValueError("只有按批次分区的用例可以归档")
+    name = partition_name(batch_id)
+    archive = archive_table_name(batch_id)
+    db.execute(text(f"ALTER TABLE {TestCase.__tablename__} DETACH PARTITION {name}"))
+    foreign_keys = db.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:name) AND contype = 'f'"
+    ), {'name': name}).scalars().all()
+    for constraint in foreign_keys:
+        db.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+    db.execute(text(f"ALTER TABLE {name} RENAME TO {archive}"))
+    return archive
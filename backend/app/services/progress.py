@@ -0,0 +1,128 @@
+"""批次执行进度
+
+进度从批次的增量汇总中读取（见 services/summary.py），不扫描用例表。结果写回后
+通知进度流立即推送；由队列 worker 在其他进程中写回的结果则在下一次定时查询时推送。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..database import AsyncSessionLocal
+from ..models.test import TestBatch, TestCase
+from .summary import fetch_summary, get_summary
+
+logger = logging.getLogger(__name__)
+
+# 进度流最长多少秒查询一次数据库
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_STREAM_INTERVAL", 1.0))
+# 两次查询之间的最短间隔，结果写回很频繁时限制查询次数
+MIN_PROGRESS_INTERVAL = 0.2
+# 进度没有变化时发送保活注释的间隔
+KEEPALIVE_INTERVAL = 15.0
+
+CASE_STATUSES = ('pending', 'running', 'passed', 'failed', 'error', 'timeout', 'cancelled')
+FINISHED_CASE_STATUSES = ('passed', 'failed', 'error', 'timeout', 'cancelled')
+FINISHED_BATCH_STATUSES = ('completed', 'failed', 'cancelled')
+
+_updated: Optional[asyncio.Event] = None
+
+
+def notify_progress() -> None:
+    """有新的结果写回，唤醒本进程内等待的进度流"""
+    global _updated
+    if _updated is not None:
+        _updated.set()
+        _updated = None
+
+
+async def _wait_for_update(timeout: float) -> None:
+    global _updated
+    if _updated is None:
+        _updated = asyncio.Event()
+    try:
+        await asyncio.wait_for(_updated.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _build_progress(batch_id: int, batch_status: str, counts: Dict[str, int]) -> Dict[str, Any]:
+    progress = {status: counts.get(status, 0) for status in CASE_STATUSES}
+    total = sum(progress.values())
+    done = sum(progress[status] for status in FINISHED_CASE_STATUSES)
+    progress.update(batch_id=batch_id, status=batch_status, total=total, done=done)
+    return progress
+
+
+def get_batch_progress(db: Session, batch_id: int) -> Optional[Dict[str, Any]]:
+    """返回批次状态和各状态的用例数，批次不存在时返回 None"""
+    batch_status = db.query(TestBatch.status).filter(TestBatch.id == batch_id).scalar()
+    if batch_status is None:
+        return None
+    return _build_progress(batch_id, batch_status, get_summary(db, batch_id).status_counts or {})
+
+
+async def fetch_batch_progress(session: AsyncSession, batch_id: int) -> Optional[Dict[str, Any]]:
+    batch_status = await session.scalar(select(TestBatch.status).where(TestBatch.id == batch_id))
+    if batch_status is None:
+        return None
+    summary = await fetch_summary(session, batch_id)
+    if summary is not None:
+        counts = summary.status_counts or {}
+    else:
+        # 没有汇总的旧批次直接按状态计数
+        counts = dict((await session.execute(
+            select(TestCase.status, func.count(TestCase.id))
+            .where(TestCase.batch_id == batch_id)
+            .group_by(TestCase.status)
+        )).all())
+    return _build_progress(batch_id, batch_status, counts)
+
+
+def _event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def stream_batch_progress(batch_id: int, interval: float = PROGRESS_INTERVAL) -> AsyncIterator[str]:
+    """以 Server-Sent Events 格式推送进度，只在进度变化时发送，批次结束后发送 done 事件
+
+    throughput 为最近两次推送之间每秒完成的用例数。
+    """
+    last: Optional[Dict[str, Any]] = None
+    last_time = last_sent = time.monotonic()
+    async with AsyncSessionLocal() as session:
+        while True:
+            query_time = time.monotonic()
+            progress = await fetch_batch_progress(session, batch_id)
+            # 结束本次只读事务，下一次查询能看到其他会话提交的结果
+            await session.commit()
+            if progress is None:
+                yield _event({'detail': '测试批次不存在'}, 'error')
+                return
+
+            now = time.monotonic()
+            if last is None or any(progress[key] != last[key] for key in ('status', 'done', 'running', 'total')):
+                elapsed = now - last_time
+                completed = progress['done'] - (last['done'] if last else 0)
+                progress['throughput'] = round(completed / elapsed, 1) if last and elapsed > 0 else 0.0
+                yield _event(progress)
+                last, last_time, last_sent = progress, now, now
+            elif now - last_sent >= KEEPALIVE_INTERVAL:
+                # 注释行用于保持连接
+                yield ": keep-alive\n\n"
+                last_sent = now
+
+            if progress['status'] in FINISHED_BATCH_STATUSES:
+                yield _event(progress, 'done')
+                return
+            await _wait_for_update(interval)
+            remaining = MIN_PROGRESS_INTERVAL - (time.monotonic() - query_time)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
@@ -0,0 +1,114 @@
+"""测试报告
+
+统计信息读取随结果写回增量维护的批次汇总（状态计数、执行时间直方图、
+risk_score 直方图、风险等级分布），只取回有限数量的用例明细，报告的内存占用
+和耗时不随批次规模增长，批次执行中也可以随时生成。
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models.test import TestBatch, TestCase
+from .cases import case_columns, row_dicts
+from .charts import build_series, get_chart_renderer
+from .metrics import REPORT_GENERATE_SECONDS, REPORT_RENDER_SECONDS
+from .summary import execution_time_stats, get_summary, phase_averages, sorted_histogram
+
+logger = logging.getLogger(__name__)
+
+# 报告中返回的用例明细数量上限
+REPORT_SAMPLE_SIZE = int(os.getenv("REPORT_SAMPLE_SIZE", 100))
+
+PERCENTILES = (0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+FAILED_STATUSES = ('failed', 'error', 'timeout')
+
+# charts 参数：image 返回服务端渲染的 PNG，data 只返回图表数据序列由前端绘制
+CHARTS_IMAGE = 'image'
+CHARTS_DATA = 'data'
+
+
+def sample_cases(db: Session, batch_id: int, limit: int = REPORT_SAMPLE_SIZE) -> List[Dict[str, Any]]:
+    """取有限数量的用例明细，优先返回失败和出错的用例"""
+    cases = row_dicts(
+        db.query(*case_columns())
+        .filter(TestCase.batch_id == batch_id, TestCase.status.in_(FAILED_STATUSES))
+        .order_by(TestCase.id)
+        .limit(limit)
+    )
+    if len(cases) < limit:
+        cases += row_dicts(
+            db.query(*case_columns())
+            .filter(TestCase.batch_id == batch_id, TestCase.status.notin_(FAILED_STATUSES))
+            .order_by(TestCase.id)
+            .limit(limit - len(cases))
+        )
+    return cases
+
+
+def generate_test_report(
+    db: Session,
+    batch_id: int,
+    sample_size: Optional[int] = None,
+    charts: str = CHARTS_IMAGE
+) -> Dict[str, Any]:
+    """生成测试报告"""
+    logger.info(f"Generating report for batch {batch_id}")
+    start_time = time.perf_counter()
+    batch = db.query(TestBatch).filter(TestBatch.id == batch_id).first()
+    if not batch:
+        logger.error(f"Test batch {batch_id} not found")
+        raise ValueError("Test batch not found")
+
+    try:
+        summary = get_summary(db, batch_id)
+        status = summary.status_counts or {}
+        execution_time = execution_time_stats(summary, PERCENTILES)
+        risk_levels = dict(sorted((summary.risk_level_counts or {}).items()))
+
+        statistics = {
+            'total_cases': sum(status.values()),
+            'passed_cases': status.get('passed', 0),
+            'failed_cases': status.get('failed', 0),
+            'error_cases': status.get('error', 0),
+            'timeout_cases': status.get('timeout', 0),
+            'cancelled_cases': status.get('cancelled', 0),
+            **execution_time,
+            'risk_level_distribution': risk_levels,
+            'risk_score_histogram': sorted_histogram(summary.risk_score_histogram),
+            'cache_hits': summary.cache_hits or 0,
+            'cache_misses': summary.cache_misses or 0,
+            # 各阶段的平均耗时（毫秒），说明见 services/metrics.py
+            'phase_timings': phase_averages(summary)
+        }
+        logger.info(f"Generated statistics for batch {batch_id}: {statistics}")
+
+        series = build_series(status, risk_levels, execution_time)
+        if charts == CHARTS_DATA:
+            charts_data = series
+        else:
+            render_start = time.perf_counter()
+            charts_data = get_chart_renderer().render(batch_id, series)
+            REPORT_RENDER_SECONDS.observe(time.perf_counter() - render_start)
+            logger.info(f"Generated charts for batch {batch_id}")
+
+        report = {
+            'batch_id': batch_id,
+            'summary': {
+                'name': batch.name,
+                'description': batch.description,
+                'status': batch.status,
+                'created_at': batch.created_at,
+                'updated_at': batch.updated_at
+            },
+            'statistics': statistics,
+            'charts_data': charts_data,
+            'test_cases': sample_cases(db, batch_id, sample_size or REPORT_SAMPLE_SIZE)
+        }
+        REPORT_GENERATE_SECONDS.observe(time.perf_counter() - start_time, kind='batch')
+        return report
+    except Exception as e:
+        logger.error(f"Error generating report for batch {batch_id}: {str(e)}")
+        raise
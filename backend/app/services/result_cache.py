@@ -0,0 +1,149 @@
+"""策略结果缓存
+
+把 (策略代码哈希, 规范化输入哈希) 映射到策略输出。同一份策略代码反复回归相同
+输入时，只执行缓存未命中的用例。内存中是有界的 LRU；设置 RESULT_CACHE_PERSIST=true
+后同时写入 strategy_result_cache 表，进程重启和多个队列 worker 之间共享。
+
+只缓存执行成功的输出，失败和出错的用例每次都会重新执行。只有逐个输入独立执行的
+脚本协议策略使用缓存（见 caches_rows），对比批次也不使用缓存。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from ..database import AsyncSessionLocal
+from ..models.test import StrategyResultCache
+from .strategy_runner import MODE_SCRIPT, detect_mode
+
+logger = logging.getLogger(__name__)
+
+# 内存中最多缓存的结果数，0 表示关闭缓存
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 100000))
+# 是否把缓存持久化到数据库
+RESULT_CACHE_PERSIST = os.getenv("RESULT_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# 查询持久化缓存时每条语句的键数上限
+LOOKUP_BATCH_SIZE = 5000
+
+_table = StrategyResultCache.__table__
+
+
+def strategy_code_hash(code: str, engine: str = 'python') -> str:
+    return hashlib.sha1(f"{engine}\0{code}".encode()).hexdigest()
+
+
+def caches_rows(engine: str, code: str) -> bool:
+    """策略的输出能否按行缓存和复用
+
+    脚本协议的策略每个输入单独执行，输出只取决于该输入；批量、向量化和 SQL 策略一次
+    处理整块输入，输出可能依赖同一块中的其他行（排名、分位数、窗口函数等），不缓存。
+    """
+    return engine == 'python' and detect_mode(code) == MODE_SCRIPT
+
+
+def input_hash(input_data: Optional[Dict[str, Any]]) -> str:
+    """规范化的输入哈希：键排序、紧凑分隔符，字段顺序不同的相同输入得到相同的哈希"""
+    canonical = json.dumps(input_data or {}, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _select_sqls(code_hash: str, hashes: List[str]):
+    for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        yield select(_table.c.input_hash, _table.c.output).where(
+            _table.c.code_hash == code_hash,
+            _table.c.input_hash.in_(hashes[start:start + LOOKUP_BATCH_SIZE])
+        )
+
+
+def _insert_sql(dialect: str):
+    """忽略已存在键的插入语句"""
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(_table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return insert(_table).prefix_with('OR IGNORE')
+    return insert(_table)
+
+
+class ResultCache:
+    """有界的 LRU 结果缓存，线程安全"""
+
+    def __init__(self, size: int = RESULT_CACHE_SIZE, persist: bool = RESULT_CACHE_PERSIST):
+        self.size = max(0, size)
+        self.persist = persist
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def get_many(self, code_hash: str, hashes: Iterable[str]) -> Dict[str, Any]:
+        """返回内存中命中的 {input_hash: output}"""
+        hits = {}
+        with self._lock:
+            for h in hashes:
+                key = (code_hash, h)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    hits[h] = self._entries[key]
+        return hits
+
+    def put_many(self, code_hash: str, outputs: Dict[str, Any]) -> None:
+        with self._lock:
+            for h, output in outputs.items():
+                self._entries[(code_hash, h)] = output
+                self._entries.move_to_end((code_hash, h))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    async def lookup(self, code_hash: str, hashes: List[str]) -> Dict[str, Any]:
+        """先查内存，未命中的部分再查数据库（开启持久化时）"""
+        if not self.enabled:
+            return {}
+        hits = self.get_many(code_hash, hashes)
+        missing = [h for h in set(hashes) if h not in hits]
+        if self.persist and missing:
+            persisted = {}
+            async with AsyncSessionLocal() as db:
+                for statement in _select_sqls(code_hash, missing):
+                    persisted.update((row.input_hash, row.output) for row in await db.execute(statement))
+            self.put_many(code_hash, persisted)
+            hits.update(persisted)
+        return hits
+
+    async def store(self, code_hash: str, outputs: Dict[str, Any]) -> None:
+        if not self.enabled or not outputs:
+            return
+        self.put_many(code_hash, outputs)
+        if self.persist:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(_insert_sql(db.bind.dialect.name), _rows(code_hash, outputs))
+                    await db.commit()
+            except IntegrityError:
+                logger.info("Result cache entries already persisted by another worker")
+
+
+def _rows(code_hash: str, outputs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'code_hash': code_hash, 'input_hash': h, 'output': output} for h, output in outputs.items()]
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """获取进程内共享的结果缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
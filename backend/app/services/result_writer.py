@@ -0,0 +1,312 @@
+"""测试结果批量写回
+
+执行中的用例把状态变化交给 ResultWriter 缓存，由单个刷新协程按数量或时间
+触发，把一批结果在一个事务里用 executemany 写回数据库，避免每个用例提交一次。
+同一事务中按批次更新增量汇总（见 services/summary.py）。语句都带上 batch_id，
+test_cases 按批次分区时只访问对应的分区。
+
+写回失败时把这批结果放回缓存，稍后重试；连续失败超过 RESULT_FLUSH_RETRIES 次后，
+把缓存中的用例标记为 error 并记入 failed_batches，批次据此标记为失败，不会留下一直
+处于 running 的用例。
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal
+from ..models.test import TestCase, TestCaseResult
+from .metrics import DB_COMMIT_SECONDS, record_results
+from .progress import notify_progress
+from .summary import SummaryDelta, apply_delta_async
+
+logger = logging.getLogger(__name__)
+
+# 缓存的结果达到该数量时立即刷新
+FLUSH_SIZE = int(os.getenv("RESULT_FLUSH_SIZE", 1000))
+# 距上次刷新超过该秒数时刷新
+FLUSH_INTERVAL = float(os.getenv("RESULT_FLUSH_INTERVAL", 1.0))
+# 写回连续失败后的最多重试次数，之后把缓存的用例标记为 error
+FLUSH_RETRIES = int(os.getenv("RESULT_FLUSH_RETRIES", 3))
+
+_cases = TestCase.__table__
+
+_RUNNING_SQL = (
+    update(_cases)
+    .where(_cases.c.batch_id == bindparam('_batch_id'))
+    .where(_cases.c.id.in_(bindparam('ids', expanding=True)))
+    .where(_cases.c.status == 'pending')
+    .values(status='running')
+)
+
+_RESULT_SQL = (
+    update(_cases)
+    .where(_cases.c.batch_id == bindparam('_batch_id'))
+    .where(_cases.c.id == bindparam('_case_id'))
+    .values(
+        status=bindparam('_status'),
+        actual_output=bindparam('_actual_output'),
+        error_message=bindparam('_error_message'),
+        execution_time=bindparam('_execution_time'),
+        phase_timings=bindparam('_phase_timings')
+    )
+)
+
+# 只写回仍在执行中的用例，已取消或被放回队列的用例不会被迟到的结果覆盖
+_LIVE_SQL = (
+    select(_cases.c.id)
+    .where(_cases.c.batch_id == bindparam('_batch_id'))
+    .where(_cases.c.id.in_(bindparam('ids', expanding=True)))
+    .where(_cases.c.status == 'running')
+    .with_for_update()
+)
+LIVE_CHECK_SIZE = 10000
+
+# 放弃写回时把尚未结束的用例标记为 error
+_ERROR_SQL = (
+    update(_cases)
+    .where(_cases.c.batch_id == bindparam('_batch_id'))
+    .where(_cases.c.id.in_(bindparam('ids', expanding=True)))
+    .where(_cases.c.status == bindparam('_from_status'))
+    .values(status='error', error_message=bindparam('_error_message'))
+)
+
+_RESULT_FIELDS = ('case_id', 'status', 'actual_output', 'error_message', 'execution_time', 'phase_timings')
+
+_case_results = TestCaseResult.__table__
+# 重新执行的用例（如被回收的认领）先删除旧的挑战者结果再写入
+_CHALLENGER_DELETE_SQL = delete(_case_results).where(
+    _case_results.c.case_id.in_(bindparam('ids', expanding=True))
+)
+_CHALLENGER_FIELDS = ('case_id', 'status', 'actual_output', 'error_message', 'execution_time', 'strategy_id')
+
+
+def result_update(results: Iterable[Tuple[int, Dict[str, Any]]]):
+    """写回用例结果的 executemany 语句和参数，results 为 (batch_id, result)；同步和异步会话共用"""
+    return _RESULT_SQL, [
+        {'_batch_id': batch_id, **{f'_{field}': result.get(field) for field in _RESULT_FIELDS}}
+        for batch_id, result in results
+    ]
+
+
+class ResultWriter:
+    """缓存用例状态变化并由单个协程批量写回
+
+    写回使用自己的数据库会话，不与读取待执行用例的查询争用同一个连接。
+    """
+
+    def __init__(
+        self,
+        flush_size: int = FLUSH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_retries: int = FLUSH_RETRIES
+    ):
+        self.session: Optional[AsyncSession] = None
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.flush_retries = max(0, flush_retries)
+        # 结果没能写回的批次及错误信息
+        self.failed_batches: Dict[int, str] = {}
+        self._running_ids: List[Tuple[int, int]] = []
+        self._results: List[Tuple[int, Dict[str, Any]]] = []
+        self._challenger_results: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "ResultWriter":
+        self.session = AsyncSessionLocal()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    def mark_running(self, batch_id: int, case_ids: List[int]) -> None:
+        """登记开始执行的用例，随下一次刷新粗粒度地写入 running 状态"""
+        self._running_ids.extend((batch_id, case_id) for case_id in case_ids)
+
+    async def put(
+        self,
+        batch_id: int,
+        results: List[Dict[str, Any]],
+        challenger_results: Optional[List[Dict[str, Any]]] = None
+    ) -> None:
+        """登记一组结果，每项包含 case_id、status、actual_output、error_message、execution_time
+
+        对比批次的挑战者结果另外带 strategy_id，与用例结果在同一个事务中写回。
+        缓存积压过多时等待刷新完成，形成反压。
+        """
+        while len(self._results) >= self.flush_size * 4 and not self._closing:
+            self._drained.clear()
+            self._wakeup.set()
+            await self._drained.wait()
+        queued_at = time.perf_counter()
+        for result in results:
+            result['queued_at'] = queued_at
+        self._results.extend((batch_id, result) for result in results)
+        self._challenger_results.extend(challenger_results or ())
+        if len(self._results) >= self.flush_size:
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        """停止刷新协程，写回剩余结果并关闭会话"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+            await self.session.close()
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            closing = self._closing
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logger.error(f"Error flushing test results (attempt {failures}): {str(e)}")
+                await self.session.rollback()
+                if failures > self.flush_retries:
+                    await self._fail_buffered(f"结果写回失败：{str(e)}", give_up=closing)
+                    failures = 0
+                # 退避后重试，关闭时也要等剩余结果写回或被标记为 error
+                await asyncio.sleep(self.flush_interval * failures)
+                if closing and (self._results or self._running_ids):
+                    continue
+            finally:
+                self._drained.set()
+            if closing:
+                return
+
+    def _restore(self, running_ids, results, challenger_results) -> None:
+        """把取出的缓存放回队首，保持写回顺序"""
+        self._running_ids[:0] = running_ids
+        self._results[:0] = results
+        self._challenger_results[:0] = challenger_results
+
+    async def flush(self) -> None:
+        """在一个事务中写回当前缓存的状态变化，失败时把这批变化放回缓存后抛出异常"""
+        running_ids, self._running_ids = self._running_ids, []
+        results, self._results = self._results, []
+        challenger_results, self._challenger_results = self._challenger_results, []
+        if not running_ids and not results:
+            return
+        try:
+            await self._write(running_ids, results, challenger_results)
+        except BaseException:
+            self._restore(running_ids, results, challenger_results)
+            raise
+
+    async def _write(self, running_ids, results, challenger_results) -> None:
+        flush_start = time.perf_counter()
+        for _, result in results:
+            # 结果在缓冲中等待刷新的时间，重试时重新计算
+            queued_at = result.get('queued_at', flush_start)
+            if result.get('phase_timings') is not None:
+                result['phase_timings']['persist'] = round((flush_start - queued_at) * 1000, 3)
+        deltas: Dict[int, SummaryDelta] = defaultdict(SummaryDelta)
+        running_by_batch: Dict[int, List[int]] = defaultdict(list)
+        for batch_id, case_id in running_ids:
+            running_by_batch[batch_id].append(case_id)
+        for batch_id, case_ids in running_by_batch.items():
+            result = await self.session.execute(_RUNNING_SQL, {'_batch_id': batch_id, 'ids': case_ids})
+            deltas[batch_id].move('pending', 'running', result.rowcount)
+        if results:
+            live = await self._live_case_ids(results)
+            if len(live) < len(results):
+                logger.info(f"Discarding {len(results) - len(live)} results of test cases no longer running")
+                results = [(batch_id, result) for batch_id, result in results if result['case_id'] in live]
+                challenger_results = [result for result in challenger_results if result['case_id'] in live]
+        if challenger_results:
+            await self.session.execute(_CHALLENGER_DELETE_SQL, {
+                'ids': list({result['case_id'] for result in challenger_results})
+            })
+            await self.session.execute(insert(_case_results), [
+                {field: result.get(field) for field in _CHALLENGER_FIELDS}
+                for result in challenger_results
+            ])
+        if results:
+            await self.session.execute(*result_update(results))
+            for batch_id, result in results:
+                deltas[batch_id].add_result(result)
+        # 按批次号顺序加锁，避免多个写回方互相等待
+        for batch_id in sorted(deltas):
+            await apply_delta_async(self.session, batch_id, deltas[batch_id])
+        commit_start = time.perf_counter()
+        await self.session.commit()
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - commit_start, source='result_writer')
+        record_results(result for _, result in results)
+        for _, result in results:
+            result.pop('queued_at', None)
+        notify_progress()
+        logger.info(f"Flushed {len(results)} test results")
+
+    async def _fail_buffered(self, error: str, give_up: bool = False) -> None:
+        """放弃写回缓存中的结果：把这些用例标记为 error，并记录批次的失败
+
+        标记也失败时把缓存放回，下一轮继续重试；give_up 为真时（关闭写回器）不再重试，
+        用例留在 running，由批次的失败状态或队列的认领超时回收处理。
+        """
+        running_ids, self._running_ids = self._running_ids, []
+        results, self._results = self._results, []
+        challenger_results, self._challenger_results = self._challenger_results, []
+        case_ids: Dict[int, Set[int]] = defaultdict(set)
+        for batch_id, case_id in running_ids:
+            case_ids[batch_id].add(case_id)
+        for batch_id, result in results:
+            case_ids[batch_id].add(result['case_id'])
+        for batch_id in case_ids:
+            self.failed_batches.setdefault(batch_id, error)
+        try:
+            deltas: Dict[int, SummaryDelta] = defaultdict(SummaryDelta)
+            for batch_id in sorted(case_ids):
+                ids = sorted(case_ids[batch_id])
+                for from_status in ('pending', 'running'):
+                    marked = await self.session.execute(_ERROR_SQL, {
+                        '_batch_id': batch_id, 'ids': ids, '_from_status': from_status, '_error_message': error
+                    })
+                    deltas[batch_id].move(from_status, 'error', marked.rowcount)
+            for batch_id in sorted(deltas):
+                await apply_delta_async(self.session, batch_id, deltas[batch_id])
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            if give_up:
+                logger.error(f"Giving up on {sum(len(ids) for ids in case_ids.values())} test results: {str(e)}")
+            else:
+                logger.error(f"Error marking unwritten test results as error: {str(e)}")
+                self._restore(running_ids, results, challenger_results)
+            return
+        notify_progress()
+        logger.error(f"Marked {sum(len(ids) for ids in case_ids.values())} test cases as error after failed flushes")
+
+    async def _live_case_ids(self, results: List[Tuple[int, Dict[str, Any]]]) -> Set[int]:
+        case_ids: Dict[int, List[int]] = defaultdict(list)
+        for batch_id, result in results:
+            case_ids[batch_id].append(result['case_id'])
+        live: Set[int] = set()
+        for batch_id, ids in case_ids.items():
+            for start in range(0, len(ids), LIVE_CHECK_SIZE):
+                rows = await self.session.execute(_LIVE_SQL, {
+                    '_batch_id': batch_id, 'ids': ids[start:start + LIVE_CHECK_SIZE]
+                })
+                live.update(rows.scalars())
+        return live
@@ -0,0 +1,214 @@
+"""测试任务调度器
+
+所有批次共享一个全局并发上限；批次之间按优先级加权轮转（stride scheduling），
+大批次不会饿死小批次，同时优先级高的批次获得更多执行份额。
+"""
+import asyncio
+import logging
+import os
+from typing import AsyncIterable, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Union
+
+from .worker_pool import POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 全局同时执行的任务数
+CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", POOL_SIZE))
+
+Job = Callable[[], Awaitable[None]]
+
+
+class BatchCancelled(Exception):
+    """批次在执行中被取消"""
+
+
+class _BatchQueue:
+    """单个批次的待执行任务"""
+
+    def __init__(self, key: Hashable, jobs: Union[Iterable[Job], AsyncIterable[Job]], priority: int, start_pass: float):
+        self.key = key
+        self.jobs = jobs if hasattr(jobs, '__anext__') else iter(jobs)
+        self.stride = 1.0 / (max(priority, 0) + 1)
+        self.pass_value = start_pass
+        self.exhausted = False
+        self.fetching = False
+        self.in_flight = 0
+        self.tasks: Set[asyncio.Task] = set()
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    async def next_job(self) -> Optional[Job]:
+        try:
+            if hasattr(self.jobs, '__anext__'):
+                return await self.jobs.__anext__()
+            return next(self.jobs)
+        except (StopIteration, StopAsyncIteration):
+            self.exhausted = True
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching jobs of batch {self.key}: {str(e)}")
+            self.exhausted = True
+            if self.error is None:
+                self.error = e
+            return None
+
+    def finish_if_done(self) -> bool:
+        if not (self.exhausted and self.in_flight == 0 and not self.fetching):
+            return False
+        if not self.done.done():
+            if self.cancelled:
+                self.done.set_exception(BatchCancelled(f"Batch {self.key} was cancelled"))
+            elif self.error is not None:
+                self.done.set_exception(self.error)
+            else:
+                self.done.set_result(None)
+        return True
+
+
+class BatchScheduler:
+    """固定数量的执行协程从各批次队列中公平地领取任务"""
+
+    def __init__(self, concurrency: int = CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._queues: Dict[Hashable, _BatchQueue] = {}
+        self._cond = asyncio.Condition()
+        self._runners: List[asyncio.Task] = []
+        self._vtime = 0.0
+
+    @property
+    def active_batches(self) -> int:
+        return len(self._queues)
+
+    @property
+    def running_jobs(self) -> int:
+        return sum(queue.in_flight for queue in self._queues.values())
+
+    async def run_batch(self, key: Hashable, jobs: Union[Iterable[Job], AsyncIterable[Job]], priority: int = 0) -> None:
+        """提交一个批次的任务并等待全部完成
+
+        jobs 可以是惰性的（异步）生成器，调度器每次只取出一个任务。批次被
+        cancel_batch 取消时抛出 BatchCancelled。
+        """
+        self._ensure_runners()
+        async with self._cond:
+            if key in self._queues:
+                raise ValueError(f"Batch {key} is already scheduled")
+            queue = _BatchQueue(key, jobs, priority, self._vtime)
+            self._queues[key] = queue
+            self._cond.notify_all()
+        try:
+            await queue.done
+        finally:
+            async with self._cond:
+                queue.exhausted = True
+                self._queues.pop(key, None)
+
+    async def cancel_batch(self, key: Hashable) -> bool:
+        """取消批次：不再领取新任务，并取消正在执行的任务；批次不在本调度器中时返回 False"""
+        async with self._cond:
+            queue = self._queues.get(key)
+            if queue is None:
+                return False
+            queue.cancelled = True
+            queue.exhausted = True
+            for task in queue.tasks:
+                task.cancel()
+            if queue.finish_if_done():
+                self._queues.pop(key, None)
+            self._cond.notify_all()
+        logger.info(f"Cancelled batch {key} with {len(queue.tasks)} running jobs")
+        return True
+
+    def _ensure_runners(self) -> None:
+        self._runners = [t for t in self._runners if not t.done()]
+        while len(self._runners) < self.concurrency:
+            self._runners.append(asyncio.create_task(self._runner()))
+
+    async def _runner(self) -> None:
+        while True:
+            queue, job = await self._take()
+            # 任务在独立的 Task 中执行，取消批次时只取消任务本身，不影响执行协程
+            task = asyncio.ensure_future(job())
+            queue.tasks.add(task)
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                async with self._cond:
+                    queue.tasks.discard(task)
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        e = task.exception()
+                        logger.error(f"Job of batch {queue.key} failed: {str(e)}")
+                        if queue.error is None:
+                            queue.error = e
+                    queue.in_flight -= 1
+                    if queue.finish_if_done():
+                        self._queues.pop(queue.key, None)
+                    self._cond.notify_all()
+
+    async def _take(self):
+        while True:
+            async with self._cond:
+                while True:
+                    runnable = self._runnable()
+                    if runnable:
+                        queue = min(runnable, key=lambda q: q.pass_value)
+                        queue.fetching = True
+                        break
+                    await self._cond.wait()
+
+            # 取任务可能需要查询数据库，不持有锁，期间其他执行协程可以从别的批次取任务
+            job = None
+            try:
+                job = await queue.next_job()
+            finally:
+                async with self._cond:
+                    queue.fetching = False
+                    if queue.cancelled:
+                        # 取任务期间批次被取消，丢弃取到的任务
+                        job = None
+                    if job is None:
+                        if queue.finish_if_done():
+                            self._queues.pop(queue.key, None)
+                    else:
+                        queue.in_flight += 1
+                        self._vtime = queue.pass_value
+                        queue.pass_value += queue.stride
+                    self._cond.notify_all()
+            if job is not None:
+                return queue, job
+
+    def _runnable(self) -> List[_BatchQueue]:
+        return [q for q in self._queues.values() if not q.exhausted and not q.fetching]
+
+    async def shutdown(self) -> None:
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+
+
+_scheduler: Optional[BatchScheduler] = None
+
+
+def get_scheduler() -> BatchScheduler:
+    """获取进程内共享的调度器（需在事件循环中调用）"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = BatchScheduler()
+    return _scheduler
+
+
+def peek_scheduler() -> Optional[BatchScheduler]:
+    """返回已创建的调度器，不创建新的"""
+    return _scheduler
+
+
+async def shutdown_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.shutdown()
+        _scheduler = None
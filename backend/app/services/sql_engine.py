@@ -0,0 +1,220 @@
+"""SQL 策略执行引擎
+
+把一个批次的输入暂存到临时表 test_inputs（case_id 列加上 input_data 的各个字段），
+在这张表上一次性执行策略的 SQL。SQL 需要返回 case_id 列以及输出字段
+（如 risk_level、risk_score），每个 case_id 一行。
+
+列的类型由所有暂存的行共同决定：分块暂存时后面的块出现的新字段会补充为新列，
+同一字段既有整数又有小数时放宽为浮点数，类型不一致时放宽为文本。
+"""
+import datetime
+import decimal
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import BigInteger, Boolean, Column, Float, Integer, MetaData, Table, Text, create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import StaticPool
+
+from ..database import engine as app_engine
+
+logger = logging.getLogger(__name__)
+
+# sqlite：在进程内的 SQLite 内存库中执行；database：在应用数据库的临时表中执行
+SQL_BACKEND = os.getenv("SQL_STRATEGY_BACKEND", "sqlite")
+STAGING_TABLE = "test_inputs"
+
+
+def sql_strategy_bind() -> Optional[Engine]:
+    """按 SQL_STRATEGY_BACKEND 选择执行 SQL 策略的数据库，None 表示 SQLite 内存库
+
+    所有执行 SQL 策略的路径都通过这里取得 bind，保证在同一种数据库上执行。
+    """
+    return app_engine if SQL_BACKEND == 'database' else None
+
+
+def _column_type(value: Any):
+    if isinstance(value, bool):
+        return Boolean
+    if isinstance(value, int):
+        return BigInteger
+    if isinstance(value, float):
+        return Float
+    return Text
+
+
+def _widen(current: Any, other: Any) -> Any:
+    """能同时容纳两种取值的列类型"""
+    if current is None or current is other:
+        return other
+    if {current, other} == {BigInteger, Float}:
+        return Float
+    return Text
+
+
+def _to_sql_value(value: Any, column_type: Any) -> Any:
+    if value is None:
+        return None
+    if column_type is Text and not isinstance(value, str):
+        # 类型放宽为文本的列统一存 JSON 表示，例如 true、1.5
+        return json.dumps(value)
+    return value
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+class SqlStrategyRun:
+    """一次 SQL 策略执行：暂存输入、执行 SQL、按 case_id 返回输出
+
+    用法::
+
+        with SqlStrategyRun(sql_code, bind=sql_strategy_bind()) as run:
+            run.stage(cases)
+            for case_id, output in run.execute():
+                ...
+            execution_time, phase_timings = run.case_timings(len(cases))
+    """
+
+    def __init__(self, sql_code: str, bind: Optional[Engine] = None, insert_chunk_size: int = 10000):
+        self.sql_code = (sql_code or '').strip().rstrip(';')
+        self.insert_chunk_size = insert_chunk_size
+        if bind is None:
+            bind = create_engine(
+                "sqlite://",
+                connect_args={"check_same_thread": False},
+                poolclass=StaticPool
+            )
+        self.bind = bind
+        self.conn: Optional[Connection] = None
+        self.table: Optional[Table] = None
+        self.types: Dict[str, Any] = {}
+        self.stage_seconds = 0.0
+        self.execute_seconds = 0.0
+        self.null_fields: Set[str] = set()
+        self.trans = None
+
+    def __enter__(self) -> "SqlStrategyRun":
+        self.conn = self.bind.connect()
+        self.trans = self.conn.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            # 临时表只在本连接可见，回滚即可清理
+            self.trans.rollback()
+        finally:
+            self.conn.close()
+
+    def stage(self, cases: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """暂存一组 (case_id, input_data)，按需补充新列或放宽已有列的类型"""
+        if not cases:
+            return
+        stage_start = time.perf_counter()
+        self._update_columns(cases)
+        fields = [(c.name, type(c.type)) for c in self.table.columns if c.name != 'case_id']
+        rows = [
+            dict({name: _to_sql_value(input_data.get(name), column_type) for name, column_type in fields},
+                 case_id=case_id)
+            for case_id, input_data in cases
+        ]
+        for start in range(0, len(rows), self.insert_chunk_size):
+            self.conn.execute(self.table.insert(), rows[start:start + self.insert_chunk_size])
+        self.stage_seconds += time.perf_counter() - stage_start
+
+    def _update_columns(self, cases: List[Tuple[int, Dict[str, Any]]]) -> None:
+        types = dict(self.types)
+        for _, input_data in cases:
+            for name, value in (input_data or {}).items():
+                if name == 'case_id':
+                    continue
+                if value is None:
+                    if name not in types:
+                        self.null_fields.add(name)
+                    continue
+                types[name] = _widen(types.get(name), _column_type(value))
+
+        if self.table is None:
+            self.table = Table(
+                STAGING_TABLE, MetaData(),
+                Column('case_id', Integer, primary_key=True),
+                *[Column(name, column_type) for name, column_type in types.items()],
+                prefixes=['TEMPORARY']
+            )
+            self.table.create(self.conn)
+        else:
+            for name, column_type in types.items():
+                if name not in self.types:
+                    self._add_column(name, column_type)
+                elif column_type is not self.types[name]:
+                    self._alter_column(name, column_type)
+        self.types = types
+        self.null_fields.difference_update(types)
+
+    def _add_column(self, name: str, column_type: Any) -> None:
+        column = Column(name, column_type)
+        ddl = self.conn.dialect.ddl_compiler(self.conn.dialect, None)
+        self.conn.execute(text(f"ALTER TABLE {STAGING_TABLE} ADD COLUMN {ddl.get_column_specification(column)}"))
+        self.table.append_column(column)
+
+    def _alter_column(self, name: str, column_type: Any) -> None:
+        column = self.table.c[name]
+        previous = type(column.type)
+        column.type = column_type()
+        quoted = self.conn.dialect.identifier_preparer.quote(name)
+        if self.conn.dialect.name == 'postgresql':
+            type_name = column.type.compile(dialect=self.conn.dialect)
+            self.conn.execute(text(
+                f"ALTER TABLE {STAGING_TABLE} ALTER COLUMN {quoted} TYPE {type_name} USING {quoted}::{type_name}"
+            ))
+        elif previous is Boolean:
+            # SQLite 的列是动态类型，已存的数值不受影响；布尔值存为 0/1，改为与新行一致的文本
+            self.conn.execute(text(
+                f"UPDATE {STAGING_TABLE} SET {quoted} = CASE {quoted} WHEN 1 THEN 'true' WHEN 0 THEN 'false' END"
+            ))
+
+    def execute(self, fetch_size: int = 10000) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """执行策略 SQL，返回逐行产出 (case_id, 输出字典) 的迭代器
+
+        SQL 在调用时立即执行，耗时记入 execute_seconds。
+        """
+        if self.table is None:
+            return iter(())
+        # 只出现过空值的字段也建为列，SQL 中引用它们时得到 NULL
+        for name in sorted(self.null_fields):
+            self._add_column(name, Text)
+        self.types.update((name, Text) for name in self.null_fields)
+        self.null_fields.clear()
+        execute_start = time.perf_counter()
+        result = self.conn.execute(text(self.sql_code))
+        self.execute_seconds += time.perf_counter() - execute_start
+        if 'case_id' not in result.keys():
+            raise ValueError("strategy SQL must return a case_id column")
+        return self._iter_rows(result, fetch_size)
+
+    def _iter_rows(self, result, fetch_size: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        while True:
+            rows = result.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                output = {key: _to_json_value(value) for key, value in row._mapping.items()}
+                yield output.pop('case_id'), output
+
+    def case_timings(self, count: int) -> Tuple[int, Dict[str, float]]:
+        """每个用例的 (execution_time, phase_timings)，单位毫秒
+
+        集合执行无法区分单个用例的耗时，把暂存和执行的耗时按用例数平摊。
+        """
+        count = max(count, 1)
+        stage_ms = self.stage_seconds * 1000 / count
+        execute_ms = self.execute_seconds * 1000 / count
+        return int(round(stage_ms + execute_ms)), {'stage': round(stage_ms, 3), 'execute': round(execute_ms, 3)}
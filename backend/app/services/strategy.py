@@ -1,21 +1,43 @@
 from sqlalchemy.orm import Session
 from ..models.strategy import Strategy
+from ..models.test import TestBatch, TestCaseResult
 from ..schemas.strategy import StrategyCreate, StrategyUpdate
-import json
-import subprocess
-import tempfile
-import os
+from .execution import run_sql_cases, to_case_result
+from .result_cache import caches_rows, get_result_cache, input_hash, strategy_code_hash
+from .strategy_cache import StrategyRecord, get_strategy_cache
+from .worker_pool import get_worker_pool
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import func
+import asyncio
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_strategies(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Strategy).offset(skip).limit(limit).all()
+# 策略列表默认返回的列，不含代码
+SUMMARY_COLUMNS = (
+    Strategy.id, Strategy.name, Strategy.description, Strategy.status, Strategy.created_at, Strategy.updated_at
+)
 
-def get_strategy(db: Session, strategy_id: int):
-    return db.query(Strategy).filter(Strategy.id == strategy_id).first()
+def get_strategies(db: Session, skip: int = 0, limit: int = 100, include_code: bool = False) -> List[Dict[str, Any]]:
+    """策略列表，默认不含 sql_code 和 python_code"""
+    columns = SUMMARY_COLUMNS + ((Strategy.sql_code, Strategy.python_code) if include_code else ())
+    rows = db.query(*columns).order_by(Strategy.id).offset(skip).limit(limit)
+    return [dict(row._mapping) for row in rows]
+
+def get_strategies_version(db: Session) -> Tuple[int, Optional[datetime]]:
+    """策略表的版本：（策略数，最后修改时间），用于列表的条件请求"""
+    count, last_modified = db.query(
+        func.count(Strategy.id),
+        func.max(func.coalesce(Strategy.updated_at, Strategy.created_at))
+    ).one()
+    return count, last_modified
+
+def get_strategy(db: Session, strategy_id: int) -> Optional[StrategyRecord]:
+    """读取策略的只读快照，经过进程内的策略缓存"""
+    return get_strategy_cache().load(db, strategy_id)
 
 def create_strategy(db: Session, strategy: StrategyCreate):
     logger.info(f"Creating strategy with data: {strategy.dict()}")
@@ -28,16 +50,69 @@ def create_strategy(db: Session, strategy: StrategyCreate):
 
 def update_strategy(db: Session, strategy_id: int, strategy: StrategyUpdate):
     logger.info(f"Updating strategy {strategy_id} with data: {strategy.dict()}")
-    db_strategy = get_strategy(db, strategy_id)
+    db_strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
     if not db_strategy:
         return None
     
     for key, value in strategy.dict(exclude_unset=True).items():
         setattr(db_strategy, key, value)
+    # 在 UPDATE 语句中递增，并发更新也不会得到相同的版本
+    db_strategy.version = Strategy.version + 1
     
     db.commit()
+    get_strategy_cache().invalidate(strategy_id)
     db.refresh(db_strategy)
     logger.info(f"Updated strategy: {db_strategy.id}, sql_code: {db_strategy.sql_code}, python_code: {db_strategy.python_code}")
     return db_strategy
 
-  ## ... existing code ... 
\ No newline at end of file
+def delete_strategy(db: Session, strategy_id: int) -> Optional[StrategyRecord]:
+    """删除策略，返回删除前的快照；策略不存在时返回 None，仍被测试批次使用时抛出 ValueError"""
+    db_strategy = db.query(Strategy).filter(Strategy.id == strategy_id).first()
+    if not db_strategy:
+        return None
+    if db.query(TestBatch.id).filter(TestBatch.strategy_id == strategy_id).first() is not None or \
+            db.query(TestCaseResult.case_id).filter(TestCaseResult.strategy_id == strategy_id).first() is not None:
+        raise ValueError("策略已被测试批次使用，不能删除")
+    record = StrategyRecord.from_model(db_strategy)
+    db.delete(db_strategy)
+    db.commit()
+    get_strategy_cache().invalidate(strategy_id)
+    logger.info(f"Deleted strategy: {strategy_id}")
+    return record
+
+async def test_strategy(strategy: StrategyRecord, test_data: Dict[str, Any], engine: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """用单个输入运行策略，可以按行缓存的策略优先返回结果缓存中的输出
+
+    策略没有对应引擎的代码时返回 None。
+    """
+    engine = engine or ('python' if strategy.python_code else 'sql')
+    code = strategy.python_code if engine == 'python' else strategy.sql_code
+    if not code:
+        return None
+    logger.info(f"Testing strategy {strategy.id} with {engine} engine")
+
+    if engine == 'sql':
+        loop = asyncio.get_running_loop()
+        result = (await loop.run_in_executor(None, run_sql_cases, code, [(strategy.id, test_data)]))[0]
+    elif not caches_rows(engine, code):
+        result = to_case_result(strategy.id, await get_worker_pool().run(code, test_data))
+    else:
+        cache = get_result_cache()
+        code_hash = strategy_code_hash(code)
+        key = input_hash(test_data)
+        hits = await cache.lookup(code_hash, [key])
+        if key in hits:
+            result = {'status': 'passed', 'actual_output': hits[key], 'cached': True}
+        else:
+            result = to_case_result(strategy.id, await get_worker_pool().run(code, test_data))
+            if result['status'] == 'passed':
+                await cache.store(code_hash, {key: result['actual_output']})
+
+    return {
+        'status': result['status'],
+        'output': result.get('actual_output'),
+        'error': result.get('error_message'),
+        'execution_time': result.get('execution_time'),
+        'cached': bool(result.get('cached'))
+    }
+ 
\ No newline at end of file
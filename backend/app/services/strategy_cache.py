@@ -0,0 +1,138 @@
+"""策略读取缓存
+
+按 id 缓存策略的只读快照（StrategyRecord），获取单个策略、测试策略和执行批次时都
+从缓存读取，不必每次读取策略代码。每次读取先用主键查询策略的 version（每次更新
+递增），与快照的版本一致才使用缓存，因此其他进程（例如队列 worker）也不会在策略
+修改后继续执行旧代码。本进程内更新或删除策略时同时立即失效。
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.strategy import Strategy
+
+# 最多缓存的策略数，设为 0 关闭缓存
+STRATEGY_CACHE_SIZE = int(os.getenv("STRATEGY_CACHE_SIZE", 1024))
+
+
+class StrategyRecord(NamedTuple):
+    """策略的只读快照，属性与 Strategy 模型相同，可在会话关闭后使用"""
+    id: int
+    name: str
+    description: Optional[str]
+    sql_code: Optional[str]
+    python_code: Optional[str]
+    status: str
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    version: int
+
+    @classmethod
+    def from_model(cls, strategy: Strategy) -> 'StrategyRecord':
+        return cls(*(getattr(strategy, field) for field in cls._fields))
+
+    @property
+    def last_modified(self) -> Optional[datetime]:
+        return self.updated_at or self.created_at
+
+
+def _version_sql(strategy_id: int):
+    return select(Strategy.version).where(Strategy.id == strategy_id)
+
+
+class StrategyCache:
+    def __init__(self, size: int = STRATEGY_CACHE_SIZE):
+        self.size = size
+        self._entries: 'OrderedDict[int, StrategyRecord]' = OrderedDict()
+        # 每次失效递增，读取数据库期间被失效的结果不再放入缓存
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def get(self, strategy_id: int, version: int) -> Optional[StrategyRecord]:
+        """取版本为 version 的快照，缓存的快照已过期时丢弃"""
+        with self._lock:
+            record = self._entries.get(strategy_id)
+            if record is None:
+                return None
+            if record.version != version:
+                del self._entries[strategy_id]
+                return None
+            self._entries.move_to_end(strategy_id)
+            return record
+
+    def generation(self, strategy_id: int) -> int:
+        with self._lock:
+            return self._generations.get(strategy_id, 0)
+
+    def put(self, record: StrategyRecord, generation: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(record.id, 0) != generation:
+                return
+            self._entries[record.id] = record
+            self._entries.move_to_end(record.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, strategy_id: int) -> None:
+        with self._lock:
+            self._entries.pop(strategy_id, None)
+            self._generations[strategy_id] = self._generations.get(strategy_id, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for strategy_id in self._entries:
+                self._generations[strategy_id] = self._generations.get(strategy_id, 0) + 1
+            self._entries.clear()
+
+    def load(self, db: Session, strategy_id: int) -> Optional[StrategyRecord]:
+        """读取策略：先查询版本，缓存的快照过期或未命中时再读取整行"""
+        generation = self.generation(strategy_id)
+        version = db.execute(_version_sql(strategy_id)).scalar()
+        if version is None:
+            self.invalidate(strategy_id)
+            return None
+        record = self.get(strategy_id, version)
+        if record is not None:
+            return record
+        strategy = db.query(Strategy).filter(Strategy.id == strategy_id).populate_existing().first()
+        if strategy is None:
+            return None
+        record = StrategyRecord.from_model(strategy)
+        self.put(record, generation)
+        return record
+
+    async def load_async(self, session: AsyncSession, strategy_id: int) -> Optional[StrategyRecord]:
+        """load 的异步版本，供执行子系统使用"""
+        generation = self.generation(strategy_id)
+        version = await session.scalar(_version_sql(strategy_id))
+        if version is None:
+            self.invalidate(strategy_id)
+            return None
+        record = self.get(strategy_id, version)
+        if record is not None:
+            return record
+        strategy = await session.get(Strategy, strategy_id, populate_existing=True)
+        if strategy is None:
+            return None
+        record = StrategyRecord.from_model(strategy)
+        self.put(record, generation)
+        return record
+
+
+_strategy_cache = StrategyCache()
+
+
+def get_strategy_cache() -> StrategyCache:
+    return _strategy_cache
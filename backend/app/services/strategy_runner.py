@@ -0,0 +1,321 @@
+"""策略执行进程
+
+由 worker_pool 启动的常驻解释器：先从管道读取一次策略代码并编译，之后逐行接收
+一组 JSON 输入、执行策略并逐行返回对应的结果。只依赖标准库，保证启动足够快。
+
+支持的策略协议：
+- script：默认协议，脚本从 stdin 读取一个 JSON 对象，向 stdout 写出一个 JSON 对象
+- jsonl：脚本声明 BATCH_PROTOCOL = 'jsonl'，从 stdin 逐行读取输入，逐行写出结果
+- batch：脚本定义 evaluate_batch(records)，接收输入列表并返回等长的结果列表，
+  列表中的异常对象表示该行出错
+- frame：脚本定义 evaluate_frame(df)，接收整块输入构成的 pandas DataFrame，
+  返回包含 risk_level、risk_score 列的 DataFrame
+- arrays：脚本定义 evaluate_arrays(columns)，接收列名到 NumPy 数组的字典，
+  返回包含 risk_level、risk_score 的数组字典
+
+资源限制随策略代码一起下发：地址空间（RLIMIT_AS）在加载策略前设置一次；墙钟时间
+（SIGALRM）和 CPU 时间（RLIMIT_CPU 软限制）按用例计算，逐条执行的协议每个用例单独
+计时，整块执行的协议按块内用例数放大。超时的用例返回 timeout 标记，进程继续处理
+后续用例。
+"""
+import ast
+import io
+import json
+import math
+import os
+import signal
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块，不设置 rlimit
+    resource = None
+
+MODE_SCRIPT = 'script'
+MODE_JSONL = 'jsonl'
+MODE_BATCH = 'batch'
+MODE_FRAME = 'frame'
+MODE_ARRAYS = 'arrays'
+
+# 向量化协议要求返回的列
+VECTORIZED_COLUMNS = ('risk_level', 'risk_score')
+
+# 函数式协议的入口函数，按优先级排列
+ENTRY_POINTS = (
+    (MODE_FRAME, 'evaluate_frame'),
+    (MODE_ARRAYS, 'evaluate_arrays'),
+    (MODE_BATCH, 'evaluate_batch'),
+)
+
+
+def detect_mode(source: str) -> str:
+    """静态分析策略代码，判断它使用的协议（不执行代码）"""
+    try:
+        tree = ast.parse(source or '')
+    except SyntaxError:
+        return MODE_SCRIPT
+    functions = set()
+    protocol = None
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.add(node.name)
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant):
+            if any(isinstance(t, ast.Name) and t.id == 'BATCH_PROTOCOL' for t in node.targets):
+                protocol = node.value.value
+    for mode, entry_point in ENTRY_POINTS:
+        if entry_point in functions:
+            return mode
+    if protocol == MODE_JSONL:
+        return MODE_JSONL
+    return MODE_SCRIPT
+
+
+class StrategyTimeout(BaseException):
+    """策略超过时间限制；继承 BaseException，策略代码中的 except Exception 拦截不到"""
+
+
+def _raise_timeout(signum, frame):
+    if signum == getattr(signal, 'SIGXCPU', None):
+        raise StrategyTimeout("CPU time limit exceeded")
+    raise StrategyTimeout("wall-clock time limit exceeded")
+
+
+class Limits:
+    """单个用例的时间限制（秒，0 表示不限制）"""
+
+    def __init__(self, timeout: float = 0, cpu: float = 0, memory: int = 0):
+        self.timeout = timeout
+        self.cpu = cpu
+        self.memory = memory
+        self._cpu_hard = None
+        if hasattr(signal, 'setitimer'):
+            signal.signal(signal.SIGALRM, _raise_timeout)
+        if resource is not None and hasattr(signal, 'SIGXCPU'):
+            signal.signal(signal.SIGXCPU, _raise_timeout)
+            self._cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        if resource is not None and memory > 0:
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (memory, resource.getrlimit(resource.RLIMIT_AS)[1]))
+            except (ValueError, OSError):
+                pass
+
+    def arm(self, cases: int) -> None:
+        """开始计时，时间预算为 cases 个用例的限制之和"""
+        if self.timeout > 0 and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, self.timeout * cases)
+        if self.cpu > 0 and self._cpu_hard is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = math.ceil(usage.ru_utime + usage.ru_stime + self.cpu * cases)
+            if self._cpu_hard == resource.RLIM_INFINITY or soft < self._cpu_hard:
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, self._cpu_hard))
+
+    def disarm(self) -> None:
+        if self.timeout > 0 and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if self.cpu > 0 and self._cpu_hard is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (self._cpu_hard, self._cpu_hard))
+
+
+def _timed_out(error: StrategyTimeout, elapsed_ms: float) -> dict:
+    return {'ok': False, 'timeout': True, 'error': str(error), 'elapsed_ms': elapsed_ms}
+
+
+def _open_protocol_streams():
+    """把协议通道从 fd 0/1 上移走，避免策略代码的读写破坏协议"""
+    proto_in = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    proto_out = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    return proto_in, proto_out
+
+
+def _format_exception(e: BaseException) -> str:
+    """格式化异常，去掉执行器自身的调用栈帧"""
+    tb = e.__traceback__.tb_next if e.__traceback__ is not None else None
+    return ''.join(traceback.format_exception(type(e), e, tb))
+
+
+def run_script(code_obj, input_text: str, name: str = '__main__'):
+    """执行一次策略脚本，标准输入输出重定向到内存
+
+    返回 (是否成功, stdout, stderr, 模块命名空间)。
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    namespace = {'__name__': name, '__builtins__': __builtins__}
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(input_text), stdout, stderr
+    ok = True
+    try:
+        exec(code_obj, namespace)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            ok = False
+            if not isinstance(e.code, int):
+                stderr.write(f"{e.code}\n")
+    except Exception as e:
+        ok = False
+        stderr.write(_format_exception(e))
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved
+    return ok, stdout.getvalue(), stderr.getvalue(), namespace
+
+
+def _vectorized(fn, as_arrays: bool):
+    """把按列计算的策略函数包装成 记录列表 -> 结果列表 的形式"""
+    import pandas as pd
+
+    def evaluate(records):
+        frame = pd.DataFrame.from_records(records)
+        if as_arrays:
+            result = fn({column: frame[column].to_numpy() for column in frame.columns})
+        else:
+            result = fn(frame)
+        if not isinstance(result, pd.DataFrame):
+            result = pd.DataFrame(dict(result))
+        missing = [column for column in VECTORIZED_COLUMNS if column not in result.columns]
+        if missing:
+            raise ValueError(f"strategy result is missing columns: {', '.join(missing)}")
+        result = result.astype(object).where(result.notna(), None)
+        return result.to_dict('records')
+
+    return evaluate
+
+
+class Strategy:
+    """已加载的策略，按协议批量执行输入"""
+
+    def __init__(self, source: str, limits: Limits = None):
+        self.mode = detect_mode(source)
+        self.code_obj = compile(source, '<strategy>', 'exec')
+        self.limits = limits or Limits()
+        self.evaluate = None
+        if self.mode in (MODE_BATCH, MODE_FRAME, MODE_ARRAYS):
+            self.limits.arm(1)
+            try:
+                ok, _, stderr, namespace = run_script(self.code_obj, '', name='__strategy__')
+            finally:
+                self.limits.disarm()
+            if not ok:
+                raise RuntimeError(stderr)
+            entry_point = dict(ENTRY_POINTS)[self.mode]
+            if self.mode == MODE_BATCH:
+                self.evaluate = namespace[entry_point]
+            else:
+                self.evaluate = _vectorized(namespace[entry_point], self.mode == MODE_ARRAYS)
+
+    def run(self, inputs):
+        if self.mode == MODE_SCRIPT:
+            return [self._run_one(record) for record in inputs]
+        start_time = time.perf_counter()
+        self.limits.arm(len(inputs))
+        try:
+            if self.evaluate is not None:
+                return self._run_batch(inputs)
+            return self._run_jsonl(inputs)
+        except StrategyTimeout as e:
+            elapsed_ms = (time.perf_counter() - start_time) * 1000 / max(len(inputs), 1)
+            return [_timed_out(e, elapsed_ms) for _ in inputs]
+        finally:
+            self.limits.disarm()
+
+    def _run_one(self, record):
+        start_time = time.perf_counter()
+        self.limits.arm(1)
+        try:
+            ok, stdout, stderr, _ = run_script(self.code_obj, json.dumps(record))
+        except StrategyTimeout as e:
+            return _timed_out(e, (time.perf_counter() - start_time) * 1000)
+        finally:
+            self.limits.disarm()
+        return {
+            'ok': ok,
+            'stdout': stdout,
+            'error': stderr,
+            'elapsed_ms': (time.perf_counter() - start_time) * 1000,
+        }
+
+    def _run_jsonl(self, inputs):
+        start_time = time.perf_counter()
+        input_text = ''.join(json.dumps(record) + '\n' for record in inputs)
+        ok, stdout, stderr, _ = run_script(self.code_obj, input_text)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000 / max(len(inputs), 1)
+        lines = [line for line in stdout.splitlines() if line.strip()]
+        if ok and len(lines) != len(inputs):
+            ok = False
+            stderr += f"expected {len(inputs)} output lines, got {len(lines)}\n"
+        if not ok:
+            return [{'ok': False, 'error': stderr, 'elapsed_ms': elapsed_ms} for _ in inputs]
+        return [{'ok': True, 'stdout': line, 'elapsed_ms': elapsed_ms} for line in lines]
+
+    def _run_batch(self, inputs):
+        start_time = time.perf_counter()
+        stderr = io.StringIO()
+        saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = io.StringIO(), stderr
+        try:
+            outputs = list(self.evaluate(inputs))
+            if len(outputs) != len(inputs):
+                raise ValueError(f"strategy returned {len(outputs)} results for {len(inputs)} inputs")
+        except Exception as e:
+            outputs = None
+            error = _format_exception(e)
+        finally:
+            sys.stdout, sys.stderr = saved
+        elapsed_ms = (time.perf_counter() - start_time) * 1000 / max(len(inputs), 1)
+
+        if outputs is None:
+            # 逐行函数整组失败时逐条重试，把错误定位到具体的行；
+            # 向量化函数逐行重试代价过高，整块标记为失败
+            if len(inputs) > 1 and self.mode == MODE_BATCH:
+                return [result for record in inputs for result in self._run_batch([record])]
+            return [{'ok': False, 'error': stderr.getvalue() + error, 'elapsed_ms': elapsed_ms} for _ in inputs]
+
+        results = []
+        for output in outputs:
+            if isinstance(output, BaseException):
+                results.append({'ok': False, 'error': _format_exception(output), 'elapsed_ms': elapsed_ms})
+            else:
+                results.append({'ok': True, 'output': output, 'elapsed_ms': elapsed_ms})
+        return results
+
+
+def _send(proto_out, message: dict) -> None:
+    proto_out.write(json.dumps(message, default=str) + '\n')
+    proto_out.flush()
+
+
+def main() -> int:
+    proto_in, proto_out = _open_protocol_streams()
+    sys.argv = ['<strategy>']
+
+    header = proto_in.readline()
+    if not header:
+        return 0
+    try:
+        message = json.loads(header)
+        strategy = Strategy(message['code'], Limits(**message.get('limits', {})))
+    except SyntaxError as e:
+        _send(proto_out, {'ready': False, 'error': ''.join(traceback.format_exception_only(type(e), e))})
+        return 1
+    except (Exception, StrategyTimeout) as e:
+        _send(proto_out, {'ready': False, 'error': str(e) or _format_exception(e)})
+        return 1
+    _send(proto_out, {'ready': True, 'mode': strategy.mode})
+
+    for line in proto_in:
+        request = json.loads(line)
+        try:
+            results = strategy.run(request['inputs'])
+        except StrategyTimeout as e:
+            # 计时器恰好在用例结束、撤销计时之前触发
+            results = [_timed_out(e, 0) for _ in request['inputs']]
+        _send(proto_out, {'results': results})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""批次的增量汇总
+
+每次写回用例状态时，把这批变化折算成 SummaryDelta，在同一个事务里合并到
+test_batch_summaries：各状态的用例数、执行时间直方图、risk_score 直方图和
+risk_level 计数。报告和进度接口只读这一行，耗时与批次规模无关。
+"""
+import logging
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..models.test import TestBatchSummary, TestCase
+
+logger = logging.getLogger(__name__)
+
+# 执行时间直方图各桶的上界（毫秒），超过最后一个上界的计入 +Inf
+EXECUTION_TIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+INF_BUCKET = '+Inf'
+# risk_score 直方图的桶宽
+RISK_SCORE_BUCKET_WIDTH = float(os.getenv("RISK_SCORE_BUCKET_WIDTH", 10))
+
+FINISHED_CASE_STATUSES = ('passed', 'failed', 'error', 'timeout')
+# 重建汇总时每次读取的用例数
+REBUILD_CHUNK_SIZE = 10000
+
+
+def _execution_time_bucket(value: int) -> str:
+    for bound in EXECUTION_TIME_BUCKETS:
+        if value <= bound:
+            return str(bound)
+    return INF_BUCKET
+
+
+def _risk_score_bucket(value: float) -> str:
+    lower = math.floor(value / RISK_SCORE_BUCKET_WIDTH) * RISK_SCORE_BUCKET_WIDTH
+    return f"{lower:g}"
+
+
+class SummaryDelta:
+    """一批用例状态变化对汇总的增量"""
+
+    def __init__(self):
+        self.status = Counter()
+        self.execution_count = 0
+        self.execution_sum = 0
+        self.execution_min: Optional[int] = None
+        self.execution_max: Optional[int] = None
+        self.execution_histogram = Counter()
+        self.risk_score_histogram = Counter()
+        self.risk_level_counts = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.phase_count = Counter()
+        self.phase_sum = Counter()
+
+    def __bool__(self) -> bool:
+        return any(self.status.values()) or self.execution_count > 0 or self.cache_hits > 0
+
+    def move(self, from_status: Optional[str], to_status: str, count: int = 1) -> None:
+        """记录 count 个用例从 from_status 变为 to_status（from_status 为 None 表示新增）"""
+        if count <= 0:
+            return
+        if from_status is not None:
+            self.status[from_status] -= count
+        self.status[to_status] += count
+
+    def add_result(self, result: Dict[str, Any], from_status: str = 'running') -> None:
+        """记录一个用例的执行结果，result 的字段与 ResultWriter.put 相同"""
+        status = result['status']
+        self.move(from_status, status)
+        if status not in FINISHED_CASE_STATUSES:
+            return
+        if result.get('cached'):
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        for phase, ms in (result.get('phase_timings') or {}).items():
+            self.phase_count[phase] += 1
+            self.phase_sum[phase] += ms
+        execution_time = result.get('execution_time')
+        if execution_time is not None:
+            self.execution_count += 1
+            self.execution_sum += execution_time
+            self.execution_min = execution_time if self.execution_min is None else min(self.execution_min, execution_time)
+            self.execution_max = execution_time if self.execution_max is None else max(self.execution_max, execution_time)
+            self.execution_histogram[_execution_time_bucket(execution_time)] += 1
+        output = result.get('actual_output')
+        if isinstance(output, dict):
+            risk_level = output.get('risk_level')
+            if risk_level is not None:
+                self.risk_level_counts[str(risk_level)] += 1
+            risk_score = output.get('risk_score')
+            if isinstance(risk_score, (int, float)) and not isinstance(risk_score, bool) and math.isfinite(risk_score):
+                self.risk_score_histogram[_risk_score_bucket(risk_score)] += 1
+
+    def merge_into(self, summary: TestBatchSummary) -> None:
+        """把增量合并到汇总行，JSON 列整体重新赋值以便被检测为已修改"""
+        summary.status_counts = _add_counts(summary.status_counts, self.status)
+        execution_time = dict(summary.execution_time or {})
+        if self.execution_count:
+            old_min, old_max = execution_time.get('min'), execution_time.get('max')
+            execution_time.update(
+                count=execution_time.get('count', 0) + self.execution_count,
+                sum=execution_time.get('sum', 0) + self.execution_sum,
+                min=self.execution_min if old_min is None else min(old_min, self.execution_min),
+                max=self.execution_max if old_max is None else max(old_max, self.execution_max),
+                histogram=_add_counts(execution_time.get('histogram'), self.execution_histogram)
+            )
+        summary.execution_time = execution_time
+        summary.risk_score_histogram = _add_counts(summary.risk_score_histogram, self.risk_score_histogram)
+        summary.risk_level_counts = _add_counts(summary.risk_level_counts, self.risk_level_counts)
+        summary.cache_hits = (summary.cache_hits or 0) + self.cache_hits
+        summary.cache_misses = (summary.cache_misses or 0) + self.cache_misses
+        if self.phase_count:
+            phases = dict(summary.phase_timings or {})
+            for phase, count in self.phase_count.items():
+                old = phases.get(phase, {})
+                phases[phase] = {
+                    'count': old.get('count', 0) + count,
+                    'sum': round(old.get('sum', 0) + self.phase_sum[phase], 3)
+                }
+            summary.phase_timings = phases
+        elif summary.phase_timings is None:
+            summary.phase_timings = {}
+
+
+def _add_counts(counts: Optional[Dict[str, int]], delta: Counter) -> Dict[str, int]:
+    merged = dict(counts or {})
+    for key, value in delta.items():
+        if value:
+            merged[key] = merged.get(key, 0) + value
+    return {key: value for key, value in merged.items() if value}
+
+
+def apply_delta(db: Session, batch_id: int, delta: SummaryDelta) -> None:
+    """在当前事务中把增量合并到批次汇总（加行锁），由调用方提交"""
+    if not delta:
+        return
+    summary = db.query(TestBatchSummary).filter(
+        TestBatchSummary.batch_id == batch_id
+    ).with_for_update().populate_existing().first()
+    if summary is None:
+        summary = TestBatchSummary(batch_id=batch_id)
+        db.add(summary)
+    delta.merge_into(summary)
+
+
+async def apply_delta_async(session: AsyncSession, batch_id: int, delta: SummaryDelta) -> None:
+    """apply_delta 的异步版本"""
+    if not delta:
+        return
+    # 写回会话是长期复用的，需要用加锁后读到的值覆盖会话中缓存的旧值
+    summary = (await session.execute(
+        select(TestBatchSummary).where(TestBatchSummary.batch_id == batch_id)
+        .with_for_update().execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+    if summary is None:
+        summary = TestBatchSummary(batch_id=batch_id)
+        session.add(summary)
+    delta.merge_into(summary)
+
+
+def rebuild_summary(db: Session, batch_id: int) -> TestBatchSummary:
+    """从用例表重新计算批次汇总（用于没有汇总的旧批次），按主键分块读取"""
+    logger.info(f"Rebuilding summary for batch {batch_id}")
+    delta = SummaryDelta()
+    last_id = 0
+    while True:
+        rows = db.query(
+            TestCase.id, TestCase.status, TestCase.execution_time, TestCase.actual_output, TestCase.phase_timings
+        ).filter(
+            TestCase.batch_id == batch_id,
+            TestCase.id > last_id
+        ).order_by(TestCase.id).limit(REBUILD_CHUNK_SIZE).all()
+        if not rows:
+            break
+        for row in rows:
+            delta.add_result({
+                'status': row.status,
+                'execution_time': row.execution_time,
+                'actual_output': row.actual_output,
+                'phase_timings': row.phase_timings
+            }, from_status=None)
+        last_id = rows[-1].id
+
+    db.query(TestBatchSummary).filter(TestBatchSummary.batch_id == batch_id).delete(synchronize_session=False)
+    summary = TestBatchSummary(batch_id=batch_id)
+    delta.merge_into(summary)
+    db.add(summary)
+    db.commit()
+    return summary
+
+
+def get_summary(db: Session, batch_id: int) -> TestBatchSummary:
+    """读取批次汇总，不存在时从用例表重建"""
+    summary = db.query(TestBatchSummary).filter(TestBatchSummary.batch_id == batch_id).first()
+    if summary is None:
+        summary = rebuild_summary(db, batch_id)
+    return summary
+
+
+async def fetch_summary(session: AsyncSession, batch_id: int) -> Optional[TestBatchSummary]:
+    """读取批次汇总，长期复用的会话也能读到最新的值"""
+    return (await session.execute(
+        select(TestBatchSummary).where(TestBatchSummary.batch_id == batch_id)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+
+
+def estimate_percentile(execution_time: Dict[str, Any], fraction: float) -> float:
+    """由执行时间直方图估算分位数，在桶内线性插值并限制在 [min, max] 之间"""
+    count = execution_time.get('count', 0)
+    if not count:
+        return 0.0
+    low, high = execution_time['min'], execution_time['max']
+    histogram = execution_time.get('histogram', {})
+    target = fraction * count
+    seen = 0
+    lower = 0
+    for bound in list(EXECUTION_TIME_BUCKETS) + [INF_BUCKET]:
+        upper = high if bound == INF_BUCKET else bound
+        in_bucket = histogram.get(str(bound), 0)
+        if in_bucket and seen + in_bucket >= target:
+            start, end = max(lower, low), min(upper, high)
+            value = start + (end - start) * (target - seen) / in_bucket
+            return float(min(max(value, low), high))
+        seen += in_bucket
+        lower = upper
+    return float(high)
+
+
+def execution_time_stats(summary: TestBatchSummary, percentiles: Iterable[float]) -> Dict[str, Any]:
+    """汇总中的执行时间统计：最小、最大、平均值和估算的分位数"""
+    execution_time = summary.execution_time or {}
+    count = execution_time.get('count', 0)
+    stats = {
+        'avg_execution_time': execution_time['sum'] / count if count else 0,
+        'max_execution_time': execution_time.get('max', 0) if count else 0,
+        'min_execution_time': execution_time.get('min', 0) if count else 0
+    }
+    for fraction in percentiles:
+        stats[f"p{round(fraction * 100)}"] = estimate_percentile(execution_time, fraction)
+    return stats
+
+
+def phase_averages(summary: TestBatchSummary) -> Dict[str, float]:
+    """各执行阶段的平均耗时（毫秒）"""
+    return {
+        phase: round(value['sum'] / value['count'], 3)
+        for phase, value in sorted((summary.phase_timings or {}).items())
+        if value.get('count')
+    }
+
+
+def sorted_histogram(histogram: Optional[Dict[str, int]]) -> List[Dict[str, Any]]:
+    """把以下界为键的 risk_score 直方图转换为按下界排序的列表"""
+    return [
+        {'lower': float(key), 'upper': float(key) + RISK_SCORE_BUCKET_WIDTH, 'count': value}
+        for key, value in sorted((histogram or {}).items(), key=lambda item: float(item[0]))
+    ]
@@ -0,0 +1,263 @@
+"""策略参数扫描（敏感性分析）
+
+以 base_input 为基准，对一到两个输入字段按给定的取值或区间取网格，在网格的笛卡尔积
+上执行策略，返回紧凑的结果网格，不创建批次和用例：
+- grid：每个点的 output_field（默认 risk_level）在 levels 中的下标，出错或没有该输出
+  的点为 null；
+  扫描两个字段时 grid[i][j] 对应第一个字段的第 i 个取值和第二个字段的第 j 个取值
+- scores：每个点的 score_field（默认 risk_score），形状与 grid 相同
+- boundaries：沿每个字段相邻两点的 output_field 不同的位置，即决策边界
+- threshold_crossings：沿每个字段相邻两点的 score_field 穿过 thresholds 中阈值的位置
+
+Python 策略按协议分块，交给常驻工作进程池并发执行，向量化策略每块最多执行
+STRATEGY_VECTORIZED_CHUNK_SIZE 个点；SQL 策略一次暂存全部的点，以集合方式执行。
+扫描的点不查询也不写入结果缓存，避免挤掉批次的缓存结果。
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..schemas.strategy import StrategySweep, SweepAxis
+from .execution import chunk_limit_for, strategy_code_for
+from .sql_engine import SqlStrategyRun, sql_strategy_bind
+from .strategy_cache import StrategyRecord
+from .strategy_runner import detect_mode
+from .worker_pool import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+# 一次扫描最多的点数（各字段取值数之积）
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", 100000))
+# 返回的出错样例数
+SWEEP_ERROR_SAMPLES = 5
+
+Axis = Tuple[str, List[Any]]
+# 每个点的 (输出, 错误信息)
+Outcome = Tuple[Any, Optional[str]]
+
+
+def axis_values(axis: SweepAxis) -> List[Any]:
+    """展开一个字段的取值，配置无效时抛出 ValueError
+
+    start、stop、step 都是整数时取值为整数；按 num 等分时各点恰好都是整数才为整数。
+    """
+    if axis.values is not None:
+        if not axis.values:
+            raise ValueError(f"{axis.field}：values 不能为空")
+        return list(axis.values)
+    if axis.start is None or axis.stop is None:
+        raise ValueError(f"{axis.field}：需要给出 values，或 start 和 stop")
+    if (axis.step is None) == (axis.num is None):
+        raise ValueError(f"{axis.field}：step 和 num 需要且只能给出一个")
+    if axis.stop < axis.start:
+        raise ValueError(f"{axis.field}：stop 不能小于 start")
+    integral = isinstance(axis.start, int) and isinstance(axis.stop, int)
+
+    if axis.num is not None:
+        if axis.num > SWEEP_MAX_POINTS:
+            raise ValueError(f"{axis.field}：取值数超过上限 {SWEEP_MAX_POINTS}")
+        if axis.num == 1:
+            return [axis.start]
+        values = [axis.start + (axis.stop - axis.start) * i / (axis.num - 1) for i in range(axis.num)]
+        if integral and all(float(value).is_integer() for value in values):
+            return [int(value) for value in values]
+        return [round(value, 10) for value in values]
+
+    if axis.step <= 0:
+        raise ValueError(f"{axis.field}：step 必须大于 0")
+    count = math.floor((axis.stop - axis.start) / axis.step + 1e-9) + 1
+    if count > SWEEP_MAX_POINTS:
+        raise ValueError(f"{axis.field}：取值数 {count} 超过上限 {SWEEP_MAX_POINTS}")
+    if integral and isinstance(axis.step, int):
+        return [axis.start + axis.step * i for i in range(count)]
+    return [round(axis.start + axis.step * i, 10) for i in range(count)]
+
+
+def build_axes(config: StrategySweep) -> List[Axis]:
+    """展开所有字段的取值并检查总点数，配置无效时抛出 ValueError"""
+    fields = [axis.field for axis in config.axes]
+    if len(set(fields)) != len(fields):
+        raise ValueError("扫描的字段不能重复")
+    axes = [(axis.field, axis_values(axis)) for axis in config.axes]
+    points = math.prod(len(values) for _, values in axes)
+    if points > SWEEP_MAX_POINTS:
+        raise ValueError(f"扫描点数 {points} 超过上限 {SWEEP_MAX_POINTS}")
+    return axes
+
+
+def build_inputs(base_input: Dict[str, Any], axes: List[Axis]) -> List[Dict[str, Any]]:
+    """按行优先顺序展开网格上每个点的输入"""
+    inputs = [dict(base_input)]
+    for field, values in axes:
+        inputs = [{**point, field: value} for point in inputs for value in values]
+    return inputs
+
+
+def _parse(result: Dict[str, Any]) -> Outcome:
+    if not result.get('ok'):
+        return None, result.get('error') or "策略执行失败"
+    try:
+        return (result['output'] if 'output' in result else json.loads(result['stdout'])), None
+    except ValueError as e:
+        return None, f"无法解析策略输出：{str(e)}"
+
+
+async def _run_python(code: str, mode: str, inputs: List[Dict[str, Any]]) -> List[Outcome]:
+    pool = get_worker_pool()
+    # 点数不多时也拆成多块，让多个工作进程同时执行
+    chunk_size = max(1, min(chunk_limit_for(mode), math.ceil(len(inputs) / pool.size)))
+    semaphore = asyncio.Semaphore(pool.size)
+
+    async def run(start: int) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await pool.run_chunk(code, inputs[start:start + chunk_size])
+
+    chunks = await asyncio.gather(*(run(start) for start in range(0, len(inputs), chunk_size)))
+    return [_parse(result) for results in chunks for result in results]
+
+
+def _run_sql(code: str, inputs: List[Dict[str, Any]]) -> List[Outcome]:
+    """以点的序号作为 case_id 暂存全部的点并执行 SQL 策略（在线程池中运行）"""
+    try:
+        with SqlStrategyRun(code, bind=sql_strategy_bind()) as run:
+            run.stage(list(enumerate(inputs)))
+            outputs = dict(run.execute())
+    except Exception as e:
+        logger.error(f"Error executing SQL strategy: {str(e)}")
+        return [(None, str(e))] * len(inputs)
+    return [
+        (outputs[index], None) if index in outputs else (None, "SQL 未返回该点的结果")
+        for index in range(len(inputs))
+    ]
+
+
+def _level(output: Any, field: str) -> Any:
+    value = output.get(field) if isinstance(output, dict) else None
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def _score(output: Any, field: str) -> Optional[float]:
+    value = output.get(field) if isinstance(output, dict) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return value
+
+
+def _shape(cells: List[Any], axes: List[Axis]) -> List[Any]:
+    if len(axes) == 1:
+        return cells
+    width = len(axes[1][1])
+    return [cells[start:start + width] for start in range(0, len(cells), width)]
+
+
+def _lines(axes: List[Axis]) -> Iterator[Tuple[int, Dict[str, Any], List[int]]]:
+    """沿每个字段的扫描线：(字段序号, 其他字段的固定取值, 线上各点的序号)"""
+    if len(axes) == 1:
+        yield 0, {}, list(range(len(axes[0][1])))
+        return
+    (first, first_values), (second, second_values) = axes
+    width = len(second_values)
+    for j, value in enumerate(second_values):
+        yield 0, {second: value}, [i * width + j for i in range(len(first_values))]
+    for i, value in enumerate(first_values):
+        yield 1, {first: value}, [i * width + j for j in range(width)]
+
+
+def summarize_sweep(
+    axes: List[Axis],
+    outcomes: List[Outcome],
+    output_field: str = 'risk_level',
+    score_field: str = 'risk_score',
+    thresholds: Optional[List[float]] = None
+) -> Dict[str, Any]:
+    """把每个点的输出整理为结果网格、决策边界和阈值穿越位置"""
+    point_levels = [_level(output, output_field) if error is None else None for output, error in outcomes]
+    point_scores = [_score(output, score_field) if error is None else None for output, error in outcomes]
+    levels = sorted({level for level in point_levels if level is not None}, key=str)
+    index = {level: position for position, level in enumerate(levels)}
+    level_counts = {str(level): 0 for level in levels}
+    for level in point_levels:
+        if level is not None:
+            level_counts[str(level)] += 1
+
+    boundaries = []
+    crossings = []
+    for axis_index, fixed, points in _lines(axes):
+        field, values = axes[axis_index]
+        for k in range(len(points) - 1):
+            a, b = points[k], points[k + 1]
+            between = [values[k], values[k + 1]]
+            if point_levels[a] is not None and point_levels[b] is not None and point_levels[a] != point_levels[b]:
+                boundaries.append({
+                    'field': field, 'at': fixed, 'between': between,
+                    'from': point_levels[a], 'to': point_levels[b]
+                })
+            if point_scores[a] is None or point_scores[b] is None:
+                continue
+            for threshold in thresholds or ():
+                if (point_scores[a] < threshold) != (point_scores[b] < threshold):
+                    crossings.append({
+                        'threshold': threshold, 'field': field, 'at': fixed, 'between': between,
+                        'from': point_scores[a], 'to': point_scores[b],
+                        'direction': 'up' if point_scores[b] > point_scores[a] else 'down'
+                    })
+
+    errors = [position for position, (_, error) in enumerate(outcomes) if error is not None]
+    samples = []
+    for position in errors[:SWEEP_ERROR_SAMPLES]:
+        coordinates = {}
+        remainder = position
+        for field, values in reversed(axes):
+            remainder, offset = divmod(remainder, len(values))
+            coordinates[field] = values[offset]
+        samples.append({'input': coordinates, 'error': outcomes[position][1]})
+
+    return {
+        'axes': [{'field': field, 'values': values} for field, values in axes],
+        'points': len(outcomes),
+        'output_field': output_field,
+        'score_field': score_field,
+        'levels': levels,
+        'grid': _shape([index.get(level) for level in point_levels], axes),
+        'scores': _shape(point_scores, axes),
+        'level_counts': level_counts,
+        'boundaries': boundaries,
+        'threshold_crossings': crossings,
+        'errors': {'count': len(errors), 'samples': samples}
+    }
+
+
+async def run_sweep(strategy: StrategyRecord, config: StrategySweep) -> Optional[Dict[str, Any]]:
+    """在参数网格上执行策略，策略没有对应引擎的代码时返回 None，扫描配置无效时抛出 ValueError"""
+    engine = config.engine or ('python' if strategy.python_code else 'sql')
+    code = strategy_code_for(strategy, engine)
+    if not code:
+        return None
+    axes = build_axes(config)
+    inputs = build_inputs(config.base_input, axes)
+    logger.info(f"Sweeping strategy {strategy.id} with {engine} engine over {len(inputs)} points")
+
+    start_time = time.perf_counter()
+    if engine == 'sql':
+        mode = 'sql'
+        loop = asyncio.get_running_loop()
+        outcomes = await loop.run_in_executor(None, _run_sql, code, inputs)
+    else:
+        mode = detect_mode(code)
+        outcomes = await _run_python(code, mode, inputs)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    summary = summarize_sweep(axes, outcomes, config.output_field, config.score_field, config.thresholds)
+    return {
+        'strategy_id': strategy.id,
+        'engine': engine,
+        'mode': mode,
+        'elapsed_ms': round(elapsed_ms, 3),
+        **summary
+    }
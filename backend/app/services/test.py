@@ -1,281 +1,487 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import random
-import time
-import json
 import asyncio
-import os
-import tempfile
+import functools
 import logging
-from typing import List, Dict, Any
-from datetime import datetime
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
-
-from ..models.test import TestBatch, TestCase
-from ..schemas.test import TestBatchCreate, TestDataGenerator
-from .strategy import get_strategy
+import math
+import os
+import time
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional, Tuple
+
+from ..database import AsyncSessionLocal, SessionLocal
+from ..models.strategy import Strategy
+from ..models.test import TestBatch, TestBatchSummary, TestCase, TestCaseResult
+from ..schemas.test import TestBatchBase, TestBatchCreate, TestDataGenerator
+from .data_generator import iter_test_data
+from .execution import (
+    SQL_STAGE_CHUNK_SIZE, VECTORIZED_MODES, chunk_limit_for, comparison_chunk_limit,
+    load_challengers, run_comparison_chunk, run_test_chunk, strategy_code_for
+)
+from .ingest import bulk_insert_cases, parse_upload
+from .job_queue import EXECUTION_BACKEND, enqueue_batch
+from .metrics import DB_COMMIT_SECONDS, record_results
+from .partitions import archive_batch_partition, create_batch_partition, drop_batch_partition
+from .progress import notify_progress
+from .result_writer import ResultWriter, result_update
+from .scheduler import BatchCancelled, get_scheduler
+from .sql_engine import SqlStrategyRun, sql_strategy_bind
+from .strategy_cache import get_strategy_cache
+from .strategy_runner import detect_mode
+from .summary import SummaryDelta, apply_delta, apply_delta_async
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_test_batch(db: Session, test_batch: TestBatchCreate) -> TestBatch:
-    """创建测试批次"""
-    logger.info(f"Creating test batch: {test_batch.dict()}")
+def check_challengers(db: Session, test_batch: TestBatchBase) -> Optional[List[int]]:
+    """检查对比批次的挑战者策略，返回去重后的 id 列表；不是对比批次时返回 None"""
+    if not test_batch.challenger_ids:
+        return None
+    challenger_ids = list(dict.fromkeys(test_batch.challenger_ids))
+    if test_batch.strategy_id in challenger_ids:
+        raise ValueError("Challenger strategies must differ from the champion strategy")
+    strategies = db.query(Strategy).filter(Strategy.id.in_(challenger_ids)).all()
+    found = {strategy.id: strategy for strategy in strategies}
+    for strategy_id in challenger_ids:
+        strategy = found.get(strategy_id)
+        if strategy is None:
+            raise ValueError(f"Challenger strategy {strategy_id} not found")
+        if not strategy_code_for(strategy, test_batch.engine):
+            raise ValueError(f"Challenger strategy {strategy_id} has no {test_batch.engine} code")
+    return challenger_ids
+
+def create_batch_record(db: Session, test_batch: TestBatchBase) -> TestBatch:
+    """创建测试批次记录（不含测试用例），挑战者策略无效时抛出 ValueError"""
+    logger.info(f"Creating test batch: {test_batch.name} for strategy {test_batch.strategy_id}")
+    challenger_ids = check_challengers(db, test_batch)
     db_batch = TestBatch(
         name=test_batch.name,
         description=test_batch.description,
-        strategy_id=test_batch.strategy_id
+        strategy_id=test_batch.strategy_id,
+        challenger_ids=challenger_ids,
+        priority=test_batch.priority,
+        engine=test_batch.engine
     )
     db.add(db_batch)
+    db.flush()
+    # 用例按批次分区时，批次的分区随批次一起创建
+    create_batch_partition(db, db_batch.id)
+    # 汇总行随批次一起创建，之后的写回只需加锁更新
+    db.add(TestBatchSummary(batch_id=db_batch.id))
     db.commit()
     db.refresh(db_batch)
     logger.info(f"Created test batch with ID: {db_batch.id}")
+    return db_batch
 
-    # 创建测试用例
-    for test_case in test_batch.test_cases:
-        db_case = TestCase(
-            batch_id=db_batch.id,
-            input_data=test_case.input_data,
-            expected_output=test_case.expected_output
-        )
-        db.add(db_case)
-    
-    db.commit()
-    logger.info(f"Created {len(test_batch.test_cases)} test cases for batch {db_batch.id}")
+def create_test_batch(db: Session, test_batch: TestBatchCreate) -> TestBatch:
+    """创建测试批次"""
+    db_batch = create_batch_record(db, test_batch)
+
+    # 批量写入测试用例
+    count = bulk_insert_cases(db, db_batch.id, (
+        {'input_data': test_case.input_data, 'expected_output': test_case.expected_output}
+        for test_case in test_batch.test_cases
+    ))
+    logger.info(f"Created {count} test cases for batch {db_batch.id}")
     return db_batch
 
-def generate_test_data(config: TestDataGenerator) -> List[Dict[str, Any]]:
-    """生成测试数据"""
-    test_cases = []
-    
-    # 生成随机测试用例
-    for _ in range(config.count):
-        test_case = {}
-        for field, pattern in config.data_patterns.items():
-            if pattern["type"] == "random_int":
-                test_case[field] = random.randint(pattern["min"], pattern["max"])
-            elif pattern["type"] == "random_float":
-                test_case[field] = random.uniform(pattern["min"], pattern["max"])
-        test_cases.append({"input_data": test_case})
-    
-    # 生成边界值测试用例
-    if config.include_edge_cases:
-        for field, pattern in config.data_patterns.items():
-            # 最小值测试
-            min_case = {k: random.uniform(v["min"], v["max"]) for k, v in config.data_patterns.items()}
-            min_case[field] = pattern["min"]
-            test_cases.append({"input_data": min_case})
-            
-            # 最大值测试
-            max_case = {k: random.uniform(v["min"], v["max"]) for k, v in config.data_patterns.items()}
-            max_case[field] = pattern["max"]
-            test_cases.append({"input_data": max_case})
-    
-    return test_cases
+def delete_test_batch(db: Session, batch_id: int, archive: bool = False) -> Optional[Dict[str, Any]]:
+    """删除已结束的批次及其用例、汇总和挑战者结果；批次不存在时返回 None
 
-async def run_test_case(db: Session, test_case: TestCase, strategy_code: str) -> None:
-    """运行单个测试用例"""
-    logger.info(f"Running test case {test_case.id}")
+    用例按批次分区时直接删除整个分区，archive=True 时把分区分离为归档表（挑战者结果不归档）。
+    批次未结束，或要求归档但用例未分区时抛出 ValueError。
+    """
+    batch = db.query(TestBatch).filter(TestBatch.id == batch_id).with_for_update().first()
+    if batch is None:
+        return None
+    if batch.status in ('pending', 'running'):
+        raise ValueError("测试批次尚未结束，请先取消")
     try:
-        test_case.status = 'running'
+        db.query(TestCaseResult).filter(
+            TestCaseResult.case_id.in_(select(TestCase.id).where(TestCase.batch_id == batch_id))
+        ).delete(synchronize_session=False)
+        archived_table = None
+        if archive:
+            archived_table = archive_batch_partition(db, batch_id)
+        elif not drop_batch_partition(db, batch_id):
+            db.query(TestCase).filter(TestCase.batch_id == batch_id).delete(synchronize_session=False)
+        db.query(TestBatchSummary).filter(TestBatchSummary.batch_id == batch_id).delete(synchronize_session=False)
+        db.query(TestBatch).filter(TestBatch.id == batch_id).delete(synchronize_session=False)
         db.commit()
-        
-        start_time = time.time()
-        
-        # 创建临时Python文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(strategy_code)
-            temp_file = f.name
-            logger.info(f"Created temporary file for test case {test_case.id}: {temp_file}")
-        
-        # 执行测试
-        logger.info(f"Executing test case {test_case.id}")
-        proc = await asyncio.create_subprocess_exec(
-            'python', temp_file,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+    except ValueError:
+        db.rollback()
+        raise
+    logger.info(f"Deleted test batch {batch_id}" + (f", test cases archived to {archived_table}" if archived_table else ""))
+    return {'batch_id': batch_id, 'archived_table': archived_table}
+
+def _insert_or_fail(batch_id: int, rows: Iterable[Dict[str, Any]]) -> int:
+    """批量写入用例，出错时把批次标记为失败（在线程池中运行）"""
+    db = SessionLocal()
+    try:
+        return bulk_insert_cases(db, batch_id, rows)
+    except Exception:
+        db.rollback()
+        db.query(TestBatch).filter(TestBatch.id == batch_id).update(
+            {'status': 'failed'}, synchronize_session=False
         )
-        
-        input_data = json.dumps(test_case.input_data).encode()
-        logger.info(f"Test case {test_case.id} input: {input_data}")
-        
-        stdout, stderr = await proc.communicate(input=input_data)
-        execution_time = int((time.time() - start_time) * 1000)
-        
-        if proc.returncode == 0:
-            output = stdout.decode()
-            logger.info(f"Test case {test_case.id} passed. Output: {output}")
-            test_case.status = 'passed'
-            test_case.actual_output = json.loads(output)
-        else:
-            error = stderr.decode()
-            logger.error(f"Test case {test_case.id} failed. Error: {error}")
-            test_case.status = 'failed'
-            test_case.error_message = error
-        
-        test_case.execution_time = execution_time
         db.commit()
-        
+        raise
+    finally:
+        db.close()
+
+def ingest_upload(batch_id: int, path: str, fmt: str) -> int:
+    """从暂存的上传文件中流式导入测试用例，完成后删除文件（在线程池中运行）"""
+    try:
+        with open(path, encoding='utf-8', newline='') as f:
+            return _insert_or_fail(batch_id, parse_upload(f, fmt))
+    finally:
+        os.unlink(path)
+
+def generate_cases(batch_id: int, config: TestDataGenerator) -> int:
+    """在服务端按生成器配置逐块生成并写入测试用例（在线程池中运行）"""
+    return _insert_or_fail(batch_id, (case for chunk in iter_test_data(config) for case in chunk))
+
+async def _load_and_start(batch_id: int, load, *args) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(None, load, batch_id, *args)
+        logger.info(f"Loaded {count} test cases for batch {batch_id}")
     except Exception as e:
-        logger.error(f"Error running test case {test_case.id}: {str(e)}")
-        test_case.status = 'error'
-        test_case.error_message = str(e)
+        logger.error(f"Error loading test cases for batch {batch_id}: {str(e)}")
+        return
+    if await loop.run_in_executor(None, _cancel_if_cancelled, batch_id):
+        # 导入期间批次已被取消，导入的用例直接标记为已取消
+        return
+    await start_test_batch(batch_id)
+
+async def ingest_and_run_test_batch(batch_id: int, path: str, fmt: str) -> None:
+    """后台导入上传的测试用例，然后运行批次"""
+    await _load_and_start(batch_id, ingest_upload, path, fmt)
+
+async def generate_and_run_test_batch(batch_id: int, config: TestDataGenerator) -> None:
+    """后台生成测试用例，然后运行批次"""
+    await _load_and_start(batch_id, generate_cases, config)
+
+def _cancel_unfinished_cases(db: Session, batch_id: int) -> int:
+    """把批次中待执行和执行中的用例标记为已取消并更新汇总，由调用方提交"""
+    delta = SummaryDelta()
+    for status in ('pending', 'running'):
+        count = db.query(TestCase).filter(
+            TestCase.batch_id == batch_id,
+            TestCase.status == status
+        ).update({'status': 'cancelled', 'claimed_by': None, 'heartbeat_at': None}, synchronize_session=False)
+        delta.move(status, 'cancelled', count)
+    apply_delta(db, batch_id, delta)
+    return delta.status['cancelled']
+
+def _cancel_if_cancelled(batch_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        status = db.query(TestBatch.status).filter(TestBatch.id == batch_id).scalar()
+        if status != 'cancelled':
+            return False
+        _cancel_unfinished_cases(db, batch_id)
         db.commit()
+        return True
     finally:
-        if 'temp_file' in locals():
-            try:
-                os.unlink(temp_file)
-                logger.info(f"Cleaned up temporary file for test case {test_case.id}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary file: {str(e)}")
-
-async def run_test_batch(db: Session, batch_id: int) -> None:
-    """运行测试批次"""
-    logger.info(f"Starting test batch {batch_id}")
-    batch = db.query(TestBatch).filter(TestBatch.id == batch_id).first()
-    if not batch:
-        logger.error(f"Test batch {batch_id} not found")
-        return
-    
+        db.close()
+
+def _cancel_batch_record(batch_id: int) -> Optional[str]:
+    """把未结束的批次及其未完成的用例标记为已取消，返回批次原来的状态；批次不存在时返回 None"""
+    db = SessionLocal()
     try:
-        batch.status = 'running'
+        batch = db.query(TestBatch).filter(TestBatch.id == batch_id).with_for_update().first()
+        if batch is None:
+            return None
+        previous = batch.status
+        if previous not in ('pending', 'running'):
+            return previous
+        batch.status = 'cancelled'
+        cancelled = _cancel_unfinished_cases(db, batch_id)
         db.commit()
-        logger.info(f"Updated batch {batch_id} status to running")
-        
-        strategy = get_strategy(db, batch.strategy_id)
-        if not strategy:
-            raise ValueError(f"Strategy {batch.strategy_id} not found")
-        
-        logger.info(f"Found strategy {strategy.id} for batch {batch_id}")
-        
-        # 并行执行测试用例
-        tasks = []
-        for test_case in batch.test_cases:
-            task = asyncio.create_task(run_test_case(db, test_case, strategy.python_code))
-            tasks.append(task)
-        
-        logger.info(f"Created {len(tasks)} tasks for batch {batch_id}")
-        await asyncio.gather(*tasks)
-        logger.info(f"Completed all tasks for batch {batch_id}")
-        
-        # 更新批次状态
-        failed_cases = db.query(TestCase).filter(
+        logger.info(f"Cancelled batch {batch_id} with {cancelled} unfinished test cases")
+        return previous
+    finally:
+        db.close()
+
+async def cancel_test_batch(batch_id: int) -> Optional[str]:
+    """取消批次：待执行和执行中的用例立即标记为已取消，本进程内正在执行的任务随即被取消，
+    其策略进程被结束；队列 worker 在下一次心跳时停止该批次的任务。迟到的结果不会被写回。
+
+    返回批次原来的状态，批次不存在时返回 None。
+    """
+    loop = asyncio.get_running_loop()
+    previous = await loop.run_in_executor(None, _cancel_batch_record, batch_id)
+    if previous in ('pending', 'running'):
+        await get_scheduler().cancel_batch(batch_id)
+        notify_progress()
+    return previous
+
+def _enqueue(batch_id: int) -> None:
+    db = SessionLocal()
+    try:
+        enqueue_batch(db, batch_id)
+    finally:
+        db.close()
+
+async def start_test_batch(batch_id: int) -> None:
+    """按 EXECUTION_BACKEND 在本进程内运行批次，或交给队列 worker 执行"""
+    if EXECUTION_BACKEND == 'queue':
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _enqueue, batch_id)
+        return
+    await run_test_batch(batch_id)
+
+def _chunk_size_for(total: int, mode: str) -> int:
+    """按批次规模和策略协议确定分块大小，保证小批次也能用满并发"""
+    if mode in VECTORIZED_MODES:
+        # 向量化策略一次处理尽可能多的行，由 DataFrame 列运算负责加速
+        return max(1, min(chunk_limit_for(mode), total))
+    return max(1, min(chunk_limit_for(mode), math.ceil(total / get_scheduler().concurrency)))
+
+async def _count_pending(session: AsyncSession, batch_id: int) -> int:
+    return await session.scalar(
+        select(func.count(TestCase.id)).where(
             TestCase.batch_id == batch_id,
-            TestCase.status.in_(['failed', 'error'])
-        ).count()
-        
-        batch.status = 'failed' if failed_cases > 0 else 'completed'
-        db.commit()
-        logger.info(f"Updated batch {batch_id} status to {batch.status}")
-        
-    except Exception as e:
-        logger.error(f"Error running batch {batch_id}: {str(e)}")
-        batch.status = 'failed'
+            TestCase.status == 'pending'
+        )
+    )
+
+async def _iter_pending_chunks(session: AsyncSession, batch_id: int, chunk_size: int) -> AsyncIterator[List[Tuple[int, Dict[str, Any]]]]:
+    """按主键分页读取待执行用例的 (id, input_data)，避免一次加载整个批次"""
+    last_id = 0
+    while True:
+        rows = (await session.execute(
+            select(TestCase.id, TestCase.input_data).where(
+                TestCase.batch_id == batch_id,
+                TestCase.status == 'pending',
+                TestCase.id > last_id
+            ).order_by(TestCase.id).limit(chunk_size)
+        )).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [(row.id, row.input_data) for row in rows]
+
+def _execute_sql_batch(batch_id: int, sql_code: str) -> None:
+    """在暂存表上以集合方式执行 SQL 策略并写回结果（在线程池中运行）"""
+    db = SessionLocal()
+    try:
+        _stage_and_execute_sql(db, batch_id, sql_code)
+    finally:
+        db.close()
+
+def _write_sql_results(db: Session, batch_id: int, results: List[Dict[str, Any]]) -> None:
+    """写回一组 SQL 策略的结果并更新汇总，与 ResultWriter 使用同一条按批次过滤的语句
+
+    只写回仍在执行中的用例，批次在执行中被取消时丢弃结果。
+    """
+    if not results:
+        return
+    live = {
+        row.id for row in db.query(TestCase.id).filter(
+            TestCase.batch_id == batch_id,
+            TestCase.id.in_([result['case_id'] for result in results]),
+            TestCase.status == 'running'
+        ).with_for_update()
+    }
+    results = [result for result in results if result['case_id'] in live]
+    if not results:
         db.commit()
-        raise e
-
-def generate_test_report(db: Session, batch_id: int) -> Dict[str, Any]:
-    """生成测试报告"""
-    logger.info(f"Generating report for batch {batch_id}")
-    batch = db.query(TestBatch).filter(TestBatch.id == batch_id).first()
-    if not batch:
-        logger.error(f"Test batch {batch_id} not found")
-        raise ValueError("Test batch not found")
-    
-    # 获取测试用例数据
-    test_cases = db.query(TestCase).filter(TestCase.batch_id == batch_id).all()
-    logger.info(f"Found {len(test_cases)} test cases for batch {batch_id}")
+        return
+    db.execute(*result_update((batch_id, result) for result in results))
+    delta = SummaryDelta()
+    for result in results:
+        delta.add_result(result)
+    apply_delta(db, batch_id, delta)
+    commit_start = time.perf_counter()
+    db.commit()
+    DB_COMMIT_SECONDS.observe(time.perf_counter() - commit_start, source='sql')
+    record_results(results)
+
+def _stage_and_execute_sql(db: Session, batch_id: int, sql_code: str) -> None:
+    started = db.query(TestCase).filter(
+        TestCase.batch_id == batch_id,
+        TestCase.status == 'pending'
+    ).update({'status': 'running'}, synchronize_session=False)
+    delta = SummaryDelta()
+    delta.move('pending', 'running', started)
+    apply_delta(db, batch_id, delta)
+    db.commit()
     
     try:
-        # 创建DataFrame进行数据分析
-        df_data = []
-        for case in test_cases:
-            case_data = {
-                'status': case.status,
-                'execution_time': case.execution_time if case.execution_time is not None else 0,
-            }
-            # 添加输出数据
-            if case.actual_output:
-                case_data.update({
-                    'risk_level': case.actual_output.get('risk_level'),
-                    'risk_score': case.actual_output.get('risk_score'),
+        with SqlStrategyRun(sql_code, bind=sql_strategy_bind()) as run:
+            total = 0
+            last_id = 0
+            while True:
+                rows = db.query(TestCase.id, TestCase.input_data).filter(
+                    TestCase.batch_id == batch_id,
+                    TestCase.status == 'running',
+                    TestCase.id > last_id
+                ).order_by(TestCase.id).limit(SQL_STAGE_CHUNK_SIZE).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                run.stage([(row.id, row.input_data or {}) for row in rows])
+                total += len(rows)
+            
+            outputs = run.execute() if total else []
+            execution_time, phase_timings = run.case_timings(total)
+            results = []
+            for case_id, output in outputs:
+                results.append({
+                    'case_id': case_id,
+                    'status': 'passed',
+                    'actual_output': output,
+                    'execution_time': execution_time,
+                    'phase_timings': phase_timings
                 })
-            # 添加输入数据
-            if case.input_data:
-                case_data.update(case.input_data)
-            df_data.append(case_data)
-        
-        df = pd.DataFrame(df_data)
-        logger.info(f"Created DataFrame with columns: {df.columns.tolist()}")
-        
-        # 生成统计信息
-        statistics = {
-            'total_cases': len(test_cases),
-            'passed_cases': len([c for c in test_cases if c.status == 'passed']),
-            'failed_cases': len([c for c in test_cases if c.status == 'failed']),
-            'error_cases': len([c for c in test_cases if c.status == 'error']),
-            'avg_execution_time': float(df['execution_time'].mean()) if len(df) > 0 else 0,
-            'max_execution_time': int(df['execution_time'].max()) if len(df) > 0 else 0,
-            'min_execution_time': int(df['execution_time'].min()) if len(df) > 0 else 0
-        }
-        
-        logger.info(f"Generated statistics for batch {batch_id}: {statistics}")
-        
-        # 生成图表
-        charts = {}
-        
-        # 1. 测试结果分布饼图
-        if len(df) > 0:
-            plt.figure(figsize=(8, 8))
-            status_counts = df['status'].value_counts()
-            plt.pie(status_counts, labels=status_counts.index, autopct='%1.1f%%')
-            plt.title('Test Results Distribution')
-            buf = BytesIO()
-            plt.savefig(buf, format='png')
-            plt.close()
-            charts['results_distribution'] = base64.b64encode(buf.getvalue()).decode()
-        
-        # 2. 风险等级分布条形图
-        if 'risk_level' in df.columns and len(df['risk_level'].dropna()) > 0:
-            plt.figure(figsize=(10, 6))
-            sns.countplot(data=df, x='risk_level')
-            plt.title('Risk Level Distribution')
-            buf = BytesIO()
-            plt.savefig(buf, format='png')
-            plt.close()
-            charts['risk_level_distribution'] = base64.b64encode(buf.getvalue()).decode()
-        
-        # 3. 执行时间箱线图
-        if len(df) > 0 and df['execution_time'].sum() > 0:
-            plt.figure(figsize=(10, 6))
-            sns.boxplot(data=df, y='execution_time')
-            plt.title('Execution Time Distribution')
-            buf = BytesIO()
-            plt.savefig(buf, format='png')
-            plt.close()
-            charts['execution_time_distribution'] = base64.b64encode(buf.getvalue()).decode()
-        
-        logger.info(f"Generated charts for batch {batch_id}")
-        
-        return {
-            'batch_id': batch_id,
-            'summary': {
-                'name': batch.name,
-                'description': batch.description,
-                'status': batch.status,
-                'created_at': batch.created_at,
-                'updated_at': batch.updated_at
-            },
-            'statistics': statistics,
-            'charts_data': charts,
-            'test_cases': test_cases
-        }
+                if len(results) >= SQL_STAGE_CHUNK_SIZE:
+                    _write_sql_results(db, batch_id, results)
+                    results = []
+            _write_sql_results(db, batch_id, results)
+        error = "SQL 未返回该用例的结果"
     except Exception as e:
-        logger.error(f"Error generating report for batch {batch_id}: {str(e)}")
-        raise
\ No newline at end of file
+        db.rollback()
+        logger.error(f"Error executing SQL strategy for batch {batch_id}: {str(e)}")
+        error = str(e)
+    
+    # SQL 出错或没有返回结果的用例记为失败
+    failed = db.query(TestCase).filter(
+        TestCase.batch_id == batch_id,
+        TestCase.status == 'running'
+    ).update({'status': 'failed', 'error_message': error}, synchronize_session=False)
+    delta = SummaryDelta()
+    delta.move('running', 'failed', failed)
+    apply_delta(db, batch_id, delta)
+    db.commit()
+
+async def run_sql_batch(batch_id: int, sql_code: str) -> None:
+    """运行 SQL 策略批次"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _execute_sql_batch, batch_id, sql_code)
+
+async def _fail_running_batch(session: AsyncSession, batch_id: int, error: str) -> None:
+    """执行出错时把批次标记为失败，仍在执行中的用例标记为 error 并更新汇总
+
+    与正常结束时一样按条件更新，不覆盖执行期间被取消的批次。
+    """
+    failed = await session.execute(
+        update(TestBatch).where(
+            TestBatch.id == batch_id,
+            TestBatch.status == 'running'
+        ).values(status='failed')
+    )
+    if failed.rowcount:
+        marked = await session.execute(
+            update(TestCase).where(
+                TestCase.batch_id == batch_id,
+                TestCase.status == 'running'
+            ).values(status='error', error_message=error)
+        )
+        delta = SummaryDelta()
+        delta.move('running', 'error', marked.rowcount)
+        await apply_delta_async(session, batch_id, delta)
+    await session.commit()
+    notify_progress()
+
+async def run_test_batch(batch_id: int) -> None:
+    """运行测试批次
+
+    使用执行子系统自己的异步数据库会话，不依赖请求作用域的会话，也不阻塞事件循环。
+    """
+    logger.info(f"Starting test batch {batch_id}")
+    async with AsyncSessionLocal() as session:
+        batch = await session.get(TestBatch, batch_id)
+        if not batch:
+            logger.error(f"Test batch {batch_id} not found")
+            return
+        
+        try:
+            # 条件更新，开始前已被取消的批次不再执行
+            started = await session.execute(
+                update(TestBatch).where(
+                    TestBatch.id == batch_id,
+                    TestBatch.status != 'cancelled'
+                ).values(status='running')
+            )
+            await session.commit()
+            if not started.rowcount:
+                logger.info(f"Test batch {batch_id} was cancelled before it started")
+                return
+            logger.info(f"Updated batch {batch_id} status to running")
+            
+            strategy = await get_strategy_cache().load_async(session, batch.strategy_id)
+            if not strategy:
+                raise ValueError(f"Strategy {batch.strategy_id} not found")
+            
+            logger.info(f"Found strategy {strategy.id} for batch {batch_id}")
+            
+            writer = ResultWriter()
+            if batch.challenger_ids:
+                # 对比批次：每块输入只读取一次，依次交给冠军和挑战者策略执行
+                champion_code = strategy_code_for(strategy, batch.engine)
+                if not champion_code:
+                    raise ValueError(f"Strategy {strategy.id} has no {batch.engine} code")
+                challengers = await load_challengers(session, batch.challenger_ids, batch.engine)
+                total = await _count_pending(session, batch_id)
+                limit = comparison_chunk_limit(batch.engine, [champion_code] + [code for _, code in challengers])
+                chunk_size = max(1, min(limit, math.ceil(total / get_scheduler().concurrency)))
+                logger.info(f"Comparing {len(challengers) + 1} strategies on {total} test cases of batch {batch_id} in chunks of {chunk_size}")
+                jobs = (
+                    functools.partial(
+                        run_comparison_chunk, writer, batch_id, test_cases, batch.engine, champion_code, challengers
+                    )
+                    async for test_cases in _iter_pending_chunks(session, batch_id, chunk_size)
+                )
+            elif batch.engine == 'sql':
+                if not strategy.sql_code:
+                    raise ValueError(f"Strategy {strategy.id} has no SQL code")
+                # SQL 策略对整个批次一次性执行
+                jobs = [functools.partial(run_sql_batch, batch_id, strategy.sql_code)]
+            else:
+                # 按策略协议分块，每块在一个工作进程中一次执行
+                total = await _count_pending(session, batch_id)
+                chunk_size = _chunk_size_for(total, detect_mode(strategy.python_code))
+                logger.info(f"Running {total} test cases of batch {batch_id} in chunks of {chunk_size}")
+                jobs = (
+                    functools.partial(run_test_chunk, writer, batch_id, test_cases, strategy.python_code)
+                    async for test_cases in _iter_pending_chunks(session, batch_id, chunk_size)
+                )
+            
+            # 交给调度器执行：受全局并发上限约束，并与其他批次公平分享执行资源
+            async with writer:
+                await get_scheduler().run_batch(batch_id, jobs, priority=batch.priority or 0)
+            logger.info(f"Completed all tasks for batch {batch_id}")
+            
+            # 更新批次状态
+            failed_cases = await session.scalar(
+                select(func.count(TestCase.id)).where(
+                    TestCase.batch_id == batch_id,
+                    TestCase.status.in_(['failed', 'error', 'timeout'])
+                )
+            )
+            
+            if batch_id in writer.failed_batches:
+                logger.error(f"Results of batch {batch_id} could not be written: {writer.failed_batches[batch_id]}")
+            
+            # 条件更新，不覆盖执行期间被取消的批次
+            status = 'failed' if failed_cases > 0 or batch_id in writer.failed_batches else 'completed'
+            await session.execute(
+                update(TestBatch).where(
+                    TestBatch.id == batch_id,
+                    TestBatch.status == 'running'
+                ).values(status=status)
+            )
+            await session.commit()
+            notify_progress()
+            logger.info(f"Updated batch {batch_id} status to {status}")
+            
+        except BatchCancelled:
+            logger.info(f"Test batch {batch_id} was cancelled")
+        except Exception as e:
+            logger.error(f"Error running batch {batch_id}: {str(e)}")
+            await session.rollback()
+            await _fail_running_batch(session, batch_id, str(e))
+            raise e
@@ -0,0 +1,296 @@
+"""常驻策略工作进程池
+
+每个工作进程只加载一次策略代码，之后通过管道处理多个测试用例，
+省去每个用例重复启动解释器和导入模块的开销。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RUNNER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategy_runner.py')
+
+# 工作进程总数上限
+POOL_SIZE = int(os.getenv("STRATEGY_WORKER_POOL_SIZE", os.cpu_count() or 4))
+# 单个工作进程处理多少个用例后回收重启
+MAX_CASES_PER_WORKER = int(os.getenv("STRATEGY_WORKER_MAX_CASES", 1000))
+# 管道单行消息的长度上限
+STREAM_LIMIT = 64 * 1024 * 1024
+# 单个用例的墙钟时间上限（秒），0 表示不限制
+CASE_TIMEOUT = float(os.getenv("STRATEGY_TIMEOUT", 10))
+# 单个用例的 CPU 时间上限（秒），默认与墙钟时间相同
+CASE_CPU_LIMIT = float(os.getenv("STRATEGY_CPU_LIMIT", CASE_TIMEOUT))
+# 工作进程的地址空间上限（MB），0 表示不限制
+MEMORY_LIMIT_MB = int(os.getenv("STRATEGY_MEMORY_LIMIT_MB", 2048))
+# 工作进程自身的计时失效（如卡在 C 扩展中）时，额外等待多少秒后强制结束进程
+TIMEOUT_GRACE = float(os.getenv("STRATEGY_TIMEOUT_GRACE", 5))
+# 一块用例的工作进程超时后，最多把它二分重试的次数，用完后剩余的用例记为超时
+TIMEOUT_RETRIES = int(os.getenv("STRATEGY_TIMEOUT_RETRIES", 3))
+
+
+class WorkerError(Exception):
+    """工作进程无法启动或异常退出"""
+
+
+class WorkerTimeout(WorkerError):
+    """工作进程超过时间上限没有响应，已被强制结束"""
+
+
+def code_key(code: str) -> str:
+    return hashlib.sha1((code or '').encode()).hexdigest()
+
+
+def _failure(error: WorkerError) -> Dict[str, Any]:
+    return {'ok': False, 'timeout': isinstance(error, WorkerTimeout), 'error': str(error), 'elapsed_ms': 0}
+
+
+def _limits() -> Dict[str, Any]:
+    return {'timeout': CASE_TIMEOUT, 'cpu': CASE_CPU_LIMIT, 'memory': MEMORY_LIMIT_MB * 1024 * 1024}
+
+
+def _deadline(cases: int) -> Optional[float]:
+    """等待工作进程返回一组结果的最长时间"""
+    if CASE_TIMEOUT <= 0:
+        return None
+    return CASE_TIMEOUT * cases + TIMEOUT_GRACE
+
+
+class StrategyWorker:
+    """运行 strategy_runner.py 的单个工作进程"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.cases_handled = 0
+        self.proc: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self, code: str) -> None:
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, RUNNER_PATH,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT
+        )
+        logger.info(f"Started strategy worker {self.proc.pid} for code {self.key[:8]}")
+        ready = await self._request({'code': code, 'limits': _limits()}, _deadline(1))
+        if not ready.get('ready'):
+            await self.kill()
+            raise WorkerError(ready.get('error') or 'strategy failed to load')
+
+    async def evaluate(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.cases_handled += len(inputs)
+        response = await self._request({'inputs': inputs}, _deadline(len(inputs)))
+        return response['results']
+
+    async def _request(self, message: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            self.proc.stdin.write((json.dumps(message) + '\n').encode())
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        try:
+            line = await asyncio.wait_for(self.proc.stdout.readline(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.kill()
+            raise WorkerTimeout(f"strategy worker did not respond within {timeout:g}s and was killed")
+        if not line:
+            returncode = await self.proc.wait()
+            raise WorkerError(f"strategy worker exited unexpectedly (exit code {returncode})")
+        return json.loads(line)
+
+    async def stop(self) -> None:
+        if not self.alive:
+            return
+        self.proc.stdin.close()
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout=1)
+        except asyncio.TimeoutError:
+            await self.kill()
+
+    async def kill(self) -> None:
+        if self.alive:
+            self.proc.kill()
+            await self.proc.wait()
+
+
+class StrategyWorkerPool:
+    """按策略代码复用工作进程的进程池
+
+    空闲进程按代码哈希分组；进程数达到上限时，优先淘汰其他策略的空闲进程。
+    崩溃或达到回收次数的进程会被丢弃，下次取用时重新启动。
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_cases_per_worker: int = MAX_CASES_PER_WORKER):
+        self.size = max(1, size)
+        self.max_cases_per_worker = max(1, max_cases_per_worker)
+        self._idle: Dict[str, List[StrategyWorker]] = {}
+        self._count = 0
+        self._cond = asyncio.Condition()
+        self._closed = False
+
+    @property
+    def idle(self) -> int:
+        return sum(len(workers) for workers in self._idle.values())
+
+    @property
+    def busy(self) -> int:
+        """正在执行用例（或正在启动）的工作进程数"""
+        return self._count - self.idle
+
+    async def run(self, code: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个用例"""
+        results = await self.run_chunk(code, [input_data])
+        return results[0]
+
+    async def run_chunk(self, code: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """在同一个工作进程中执行一组用例
+
+        每个结果为 {'ok', 'error', 'elapsed_ms'}，成功时带有 'output'（已解析的对象）
+        或 'stdout'（脚本协议的原始输出），超时的用例带有 'timeout'。正常返回的结果还带有
+        平摊到每个用例的 'spawn_ms'（取得工作进程）和 'transfer_ms'（管道往返）。
+        """
+        return await self._run_chunk(code, inputs, [TIMEOUT_RETRIES])
+
+    async def _run_chunk(self, code: str, inputs: List[Dict[str, Any]], retries: List[int]) -> List[Dict[str, Any]]:
+        """retries 为这一整块剩余的超时重试次数，在二分出的各部分之间共享"""
+        start_time = time.perf_counter()
+        try:
+            worker = await self._acquire(code)
+        except WorkerError as e:
+            return [_failure(e) for _ in inputs]
+        acquired_time = time.perf_counter()
+
+        healthy = False
+        try:
+            results = await worker.evaluate(inputs)
+            healthy = True
+            # 取得进程和管道往返中策略执行之外的耗时，按用例数平摊
+            elapsed_ms = (time.perf_counter() - acquired_time) * 1000
+            executed_ms = sum(result.get('elapsed_ms', 0) for result in results)
+            spawn_ms = (acquired_time - start_time) * 1000 / len(inputs)
+            transfer_ms = max(0.0, elapsed_ms - executed_ms) / len(inputs)
+            for result in results:
+                result['spawn_ms'] = spawn_ms
+                result['transfer_ms'] = transfer_ms
+            return results
+        except WorkerError as e:
+            error = e
+            logger.error(f"Strategy worker {'timed out' if isinstance(e, WorkerTimeout) else 'crashed'}: {str(e)}")
+        finally:
+            await self._release(worker, healthy)
+
+        if len(inputs) == 1:
+            return [_failure(error)]
+        if isinstance(error, WorkerTimeout):
+            # 超时重试的代价是整块的时间预算，不逐条重试；二分定位卡住的用例，次数用完后整块记为超时
+            if retries[0] <= 0:
+                return [_failure(error) for _ in inputs]
+            retries[0] -= 1
+            middle = len(inputs) // 2
+            return (
+                await self._run_chunk(code, inputs[:middle], retries)
+                + await self._run_chunk(code, inputs[middle:], retries)
+            )
+        # 进程崩溃时逐条重新执行，只让导致崩溃的用例失败
+        results = []
+        for input_data in inputs:
+            results.extend(await self._run_chunk(code, [input_data], retries))
+        return results
+
+    async def _acquire(self, code: str) -> StrategyWorker:
+        key = code_key(code)
+        victim = None
+        async with self._cond:
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop()
+                if self._count < self.size:
+                    self._count += 1
+                    break
+                victim = self._pop_any_idle()
+                if victim:
+                    break
+                await self._cond.wait()
+
+        if victim:
+            await victim.stop()
+        worker = StrategyWorker(key)
+        try:
+            await worker.start(code)
+        except BaseException:
+            await worker.kill()
+            async with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            raise
+        return worker
+
+    async def _release(self, worker: StrategyWorker, healthy: bool) -> None:
+        recycle = (
+            self._closed
+            or not healthy
+            or not worker.alive
+            or worker.cases_handled >= self.max_cases_per_worker
+        )
+        if recycle:
+            if healthy:
+                await worker.stop()
+            else:
+                await worker.kill()
+        async with self._cond:
+            if recycle:
+                self._count -= 1
+            else:
+                self._idle.setdefault(worker.key, []).append(worker)
+            self._cond.notify()
+
+    def _pop_any_idle(self) -> Optional[StrategyWorker]:
+        for key, workers in self._idle.items():
+            if workers:
+                worker = workers.pop()
+                if not workers:
+                    del self._idle[key]
+                return worker
+        return None
+
+    async def shutdown(self) -> None:
+        """停止所有空闲进程，使用中的进程在归还时停止"""
+        async with self._cond:
+            self._closed = True
+            workers = [w for ws in self._idle.values() for w in ws]
+            self._count -= len(workers)
+            self._idle.clear()
+        await asyncio.gather(*(w.stop() for w in workers))
+
+
+_pool: Optional[StrategyWorkerPool] = None
+
+
+def get_worker_pool() -> StrategyWorkerPool:
+    """获取进程内共享的工作进程池（需在事件循环中调用）"""
+    global _pool
+    if _pool is None or _pool._closed:
+        _pool = StrategyWorkerPool()
+    return _pool
+
+
+def peek_worker_pool() -> Optional[StrategyWorkerPool]:
+    """返回已创建的工作进程池，不创建新的"""
+    return _pool
+
+
+async def shutdown_worker_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.shutdown()
+        _pool = None
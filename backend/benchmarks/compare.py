@@ -0,0 +1,63 @@
+"""对比两次基准测试的结果
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+按（策略，规模）配对，逐项输出新旧数值和变化比例；吞吐量越大越好，耗时和内存越小越好。
+"""
+import argparse
+import json
+from typing import Any, Dict, Iterator, Tuple
+
+# （阶段，指标路径，是否越大越好）
+METRICS = (
+    ("generate", ("rows_per_second",), True),
+    ("ingest", ("rows_per_second",), True),
+    ("run", ("cases_per_second",), True),
+    ("run", ("execution_time_ms", "p50"), False),
+    ("run", ("execution_time_ms", "p99"), False),
+    ("run", ("latency_ms", "p50"), False),
+    ("run", ("latency_ms", "p99"), False),
+    ("report", ("seconds",), False),
+    ("report", ("cached_seconds",), False),
+    ("report", ("peak_memory_bytes",), False),
+)
+
+
+def _load(path: str) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {(result["strategy"], result["size"]): result for result in data["results"]}
+
+
+def _value(result: Dict[str, Any], stage: str, path: Tuple[str, ...]):
+    value = result.get(stage)
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(old_path: str, new_path: str) -> Iterator[str]:
+    old, new = _load(old_path), _load(new_path)
+    for key in sorted(old.keys() & new.keys()):
+        yield f"{key[0]} x {key[1]}"
+        for stage, path, higher_is_better in METRICS:
+            before, after = _value(old[key], stage, path), _value(new[key], stage, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            mark = "+" if better and change else ("-" if change else " ")
+            yield f"  {mark} {stage}.{'.'.join(path):<28} {before:>14} -> {after:<14} {change:+.1%}"
+    for key in sorted(old.keys() ^ new.keys()):
+        yield f"{key[0]} x {key[1]}: only in {'old' if key in old else 'new'} results"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比两次基准测试的结果")
+    parser.add_argument("old", help="作为基准的结果文件")
+    parser.add_argument("new", help="要对比的结果文件")
+    args = parser.parse_args()
+    for line in compare(args.old, args.new):
+        print(line)
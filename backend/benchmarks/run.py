@@ -0,0 +1,211 @@
+"""执行、导入和报告路径的基准测试
+
+在独立的 SQLite 库（默认为临时文件）上，对每个参考策略和每个批次规模依次测量：
+- generate：generate_test_data 的生成速度
+- ingest：create_test_batch 的写入速度
+- run：run_test_batch 的吞吐量，以及用例执行时间和端到端耗时（各阶段耗时之和）的 p50 / p99
+- report：generate_test_report 的耗时（首次渲染图表和命中图表缓存）和 Python 内存峰值
+
+结果写成 JSON，可用 benchmarks/compare.py 对比两次运行。在 backend 目录下执行：
+
+    python -m benchmarks.run --sizes 100,1000,10000
+    python -m benchmarks.run --sizes 1000000 --strategies vectorized
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+
+from .strategies import STRATEGIES
+
+DEFAULT_SIZES = '100,1000,10000'
+PERCENTILES = (50, 99)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="运行执行、导入和报告路径的基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="逗号分隔的批次规模，例如 100,1000,1000000")
+    parser.add_argument("--strategies", default=','.join(STRATEGIES), help=f"逗号分隔的参考策略：{', '.join(STRATEGIES)}")
+    parser.add_argument("--database", default=None, help="数据库 URL，默认使用临时 SQLite 文件")
+    parser.add_argument("--output", default=None, help="结果文件，默认写到 benchmarks/results/ 下")
+    parser.add_argument("--seed", type=int, default=42, help="测试数据的随机种子")
+    parser.add_argument("--cache", action="store_true", help="保留结果缓存（默认关闭，测量实际执行）")
+    return parser.parse_args()
+
+
+def _configure(args) -> str:
+    """在导入 app 之前配置数据库和缓存，返回使用的数据库 URL"""
+    database_url = args.database
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="crm-bench-"), "bench.db")
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["EXECUTION_BACKEND"] = "inprocess"
+    if not args.cache:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+    logging.basicConfig(level=logging.WARNING)
+    return database_url
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    import numpy as np
+
+    if not values:
+        return {f"p{p}": 0.0 for p in PERCENTILES}
+    points = np.percentile(np.asarray(values, dtype=float), PERCENTILES)
+    return {f"p{p}": round(float(value), 3) for p, value in zip(PERCENTILES, points)}
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+
+async def _bench_one(name: str, code: str, size: int, seed: int) -> Dict[str, Any]:
+    from app.database import SessionLocal
+    from app.models.test import TestCase
+    from app.schemas.strategy import StrategyCreate
+    from app.schemas.test import TestBatchCreate, TestDataGenerator
+    from app.services import data_generator, report, strategy, test
+
+    result: Dict[str, Any] = {"strategy": name, "size": size}
+
+    start = time.perf_counter()
+    cases = data_generator.generate_test_data(TestDataGenerator(count=size, seed=seed))
+    elapsed = time.perf_counter() - start
+    # 生成器在随机用例之后追加边界值用例，吞吐量按实际用例数计算
+    count = result["cases"] = len(cases)
+    result["generate"] = {"seconds": round(elapsed, 3), "rows_per_second": _rate(count, elapsed)}
+
+    db = SessionLocal()
+    try:
+        db_strategy = strategy.create_strategy(db, StrategyCreate(name=f"bench-{name}", python_code=code))
+        batch_in = TestBatchCreate(name=f"bench-{name}-{size}", strategy_id=db_strategy.id, test_cases=cases)
+        del cases
+
+        start = time.perf_counter()
+        batch = test.create_test_batch(db, batch_in)
+        elapsed = time.perf_counter() - start
+        batch_id = batch.id
+        del batch_in
+        result["ingest"] = {"seconds": round(elapsed, 3), "rows_per_second": _rate(count, elapsed)}
+
+        start = time.perf_counter()
+        await test.run_test_batch(batch_id)
+        elapsed = time.perf_counter() - start
+
+        db.expire_all()
+        execution_times, latencies, statuses = [], [], {}
+        for status, execution_time, phase_timings in db.query(
+            TestCase.status, TestCase.execution_time, TestCase.phase_timings
+        ).filter(TestCase.batch_id == batch_id).yield_per(10000):
+            statuses[status] = statuses.get(status, 0) + 1
+            if execution_time is not None:
+                execution_times.append(execution_time)
+            if phase_timings:
+                latencies.append(sum(phase_timings.values()))
+        result["run"] = {
+            "seconds": round(elapsed, 3),
+            "cases_per_second": _rate(count, elapsed),
+            "statuses": statuses,
+            "execution_time_ms": _percentiles(execution_times),
+            "latency_ms": _percentiles(latencies)
+        }
+        del execution_times, latencies
+
+        start = time.perf_counter()
+        report.generate_test_report(db, batch_id)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        report.generate_test_report(db, batch_id)
+        cached = time.perf_counter() - start
+        tracemalloc.start()
+        try:
+            report.generate_test_report(db, batch_id, charts=report.CHARTS_DATA)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["report"] = {
+            "seconds": round(cold, 3),
+            "cached_seconds": round(cached, 3),
+            "peak_memory_bytes": peak
+        }
+    finally:
+        db.close()
+    return result
+
+
+async def _run(names: List[str], sizes: List[int], seed: int) -> List[Dict[str, Any]]:
+    from app.database import engine
+    from app.migrations import run_migrations
+    from app.services.charts import shutdown_chart_renderer
+    from app.services.scheduler import shutdown_scheduler
+    from app.services.worker_pool import shutdown_worker_pool
+
+    run_migrations(engine)
+    results = []
+    try:
+        for name in names:
+            for size in sizes:
+                print(f"{name} x {size} ...", file=sys.stderr, flush=True)
+                result = await _bench_one(name, STRATEGIES[name], size, seed)
+                print(json.dumps(result, ensure_ascii=False), file=sys.stderr, flush=True)
+                results.append(result)
+    finally:
+        await shutdown_scheduler()
+        await shutdown_worker_pool()
+        shutdown_chart_renderer()
+    return results
+
+
+def main():
+    args = _parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    names = [name.strip() for name in args.strategies.split(',') if name.strip()]
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        sys.exit(f"Unknown strategies: {', '.join(unknown)}")
+    database_url = _configure(args)
+
+    started_at = datetime.now()
+    results = asyncio.run(_run(names, sizes, args.seed))
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"{started_at:%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": database_url.split("@")[-1],
+            "seed": args.seed,
+            "result_cache": args.cache,
+            "results": results
+        }, f, ensure_ascii=False, indent=2)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
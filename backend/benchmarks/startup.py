@@ -0,0 +1,115 @@
+"""API 启动时间测量
+
+每次在新的 Python 进程中测量：
+- import：导入 app.main 的耗时，不应连接数据库
+- startup：执行启动事件（数据库迁移等）的耗时
+- heavy_modules：导入和启动之后已经加载的分析库（NumPy、pandas、matplotlib 等），
+  这些库应在第一次生成数据、执行向量化策略或渲染报告时才导入
+
+第一次运行在空库上建表，之后的运行测量已是最新结构时的启动。导入耗时的中位数超过
+--max-import-seconds，或启动时加载了分析库时以非零状态退出，可在 CI 中防止启动变慢。
+在 backend 目录下执行：
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --max-import-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib', 'seaborn', 'scipy', 'pyarrow')
+
+_PROBE = '''
+import asyncio, json, sys, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+heavy_after_import = [name for name in {heavy!r} if name in sys.modules]
+asyncio.run(app.router.startup())
+started = time.perf_counter()
+heavy_after_startup = [name for name in {heavy!r} if name in sys.modules]
+asyncio.run(app.router.shutdown())
+print(json.dumps({{
+    "import": imported - start,
+    "startup": started - imported,
+    "heavy_modules": sorted(set(heavy_after_import) | set(heavy_after_startup))
+}}))
+'''
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="测量 API 进程的导入和启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数，每次使用新的进程")
+    parser.add_argument("--database", default=None, help="数据库 URL，默认使用临时 SQLite 文件")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="导入耗时中位数的上限（秒）")
+    parser.add_argument("--output", default=None, help="把结果另外写入该 JSON 文件")
+    return parser.parse_args()
+
+
+def _probe(database_url: str) -> Dict[str, Any]:
+    env = dict(os.environ, DATABASE_URL=database_url)
+    env.pop("ASYNC_DATABASE_URL", None)
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=backend_dir, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "median": round(statistics.median(values), 4),
+        "min": round(min(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def main():
+    args = _parse_args()
+    database_url = args.database
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="crm-startup-"), "startup.db")
+        database_url = f"sqlite:///{path}"
+
+    runs = []
+    for index in range(max(1, args.runs)):
+        run = _probe(database_url)
+        print(f"run {index + 1}: import {run['import']:.3f}s, startup {run['startup']:.3f}s", file=sys.stderr, flush=True)
+        runs.append(run)
+
+    heavy_modules = sorted({name for run in runs for name in run["heavy_modules"]})
+    result = {
+        "python": sys.version.split()[0],
+        "database": database_url.split("@")[-1],
+        "import_seconds": _summarize([run["import"] for run in runs]),
+        "startup_seconds": _summarize([run["startup"] for run in runs]),
+        # 第一次运行在空库上建表
+        "first_startup_seconds": round(runs[0]["startup"], 4),
+        "heavy_modules": heavy_modules,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failures = []
+    if heavy_modules:
+        failures.append(f"Analytics modules loaded at startup: {', '.join(heavy_modules)}")
+    if args.max_import_seconds is not None and result["import_seconds"]["median"] > args.max_import_seconds:
+        failures.append(
+            f"Median import time {result['import_seconds']['median']:.3f}s exceeds {args.max_import_seconds:.3f}s"
+        )
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
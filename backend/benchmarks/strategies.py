@@ -0,0 +1,38 @@
+"""基准测试使用的参考策略
+
+- trivial：脚本协议，几乎不做计算，衡量调度、进程通信和写回的固定开销
+- cpu：脚本协议，每个用例做一段纯 Python 计算，衡量执行本身占主导时的吞吐量
+- vectorized：evaluate_arrays 协议，整块输入一次用 NumPy 计算
+"""
+
+TRIVIAL = '''
+import sys, json
+d = json.load(sys.stdin)
+score = 40 if d['credit_score'] >= 700 else 10
+print(json.dumps({'risk_score': score, 'risk_level': 'LOW' if score >= 40 else 'HIGH'}))
+'''
+
+CPU_HEAVY = '''
+import sys, json
+d = json.load(sys.stdin)
+x = d['credit_score'] / 850
+for _ in range(20000):
+    x = 3.9 * x * (1 - x)
+score = int(d['credit_score'] / 10 + x * 10)
+print(json.dumps({'risk_score': score, 'risk_level': 'LOW' if score >= 70 else 'HIGH'}))
+'''
+
+VECTORIZED = '''
+import numpy as np
+
+def evaluate_arrays(columns):
+    ratio = columns['loan_amount'] / np.maximum(columns['annual_income'], 1)
+    score = np.clip(columns['credit_score'] / 10 - ratio * 5, 0, 100).round().astype(int)
+    return {'risk_score': score, 'risk_level': np.where(score >= 60, 'LOW', 'HIGH')}
+'''
+
+STRATEGIES = {
+    'trivial': TRIVIAL,
+    'cpu': CPU_HEAVY,
+    'vectorized': VECTORIZED,
+}
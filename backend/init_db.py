@@ -1,9 +1,9 @@
-from app.database import engine, Base
-from app.models.strategy import Strategy
+from app.database import engine
+from app.migrations import run_migrations
 
 def init_db():
-    # 创建所有表
-    Base.metadata.create_all(bind=engine)
+    # 创建所有表，已有的库补齐新增的列、枚举取值和索引
+    run_migrations(engine)
     print("数据库表创建成功！")
 
 if __name__ == "__main__":
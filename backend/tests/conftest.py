@@ -0,0 +1,52 @@
+"""测试使用临时目录中的 SQLite 数据库
+
+app.database 在导入时读取 DATABASE_URL，因此要在导入 app 之前设置。
+"""
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix='crm-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ['RESULT_FLUSH_INTERVAL'] = '0.05'
+
+import pytest
+
+from app.database import Base, SessionLocal, engine
+from app.models import test as models
+from app.models.strategy import Strategy
+from app.services.strategy_cache import get_strategy_cache
+
+
+@pytest.fixture
+def tables():
+    """每个测试使用新建的表，结束后删除"""
+    Base.metadata.create_all(bind=engine)
+    # 表重建后 id 从头开始，缓存的策略快照不再对应
+    get_strategy_cache().clear()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def create_batch(tables):
+    """创建策略和批次，返回 (batch_id, case_ids)；用例都处于 case_status，汇总与之一致"""
+    def create(cases: int, status: str = 'running', case_status: str = 'running', python_code: str = 'pass'):
+        db = SessionLocal()
+        try:
+            strategy = Strategy(name='strategy', python_code=python_code)
+            db.add(strategy)
+            db.flush()
+            batch = models.TestBatch(name='batch', strategy_id=strategy.id, status=status)
+            db.add(batch)
+            db.flush()
+            db.add(models.TestBatchSummary(batch_id=batch.id, status_counts={case_status: cases}))
+            rows = [
+                models.TestCase(batch_id=batch.id, input_data={'x': i}, status=case_status)
+                for i in range(cases)
+            ]
+            db.add_all(rows)
+            db.commit()
+            return batch.id, [row.id for row in rows]
+        finally:
+            db.close()
+    return create
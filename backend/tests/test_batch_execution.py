@@ -0,0 +1,113 @@
+import asyncio
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import test as models
+from app.services.scheduler import shutdown_scheduler
+from app.services.test import _execute_sql_batch, _fail_running_batch, cancel_test_batch, run_test_batch
+from app.services.worker_pool import shutdown_worker_pool
+
+SLOW_CODE = (
+    "import json, sys, time\n"
+    "data = json.load(sys.stdin)\n"
+    "time.sleep(0.05)\n"
+    "print(json.dumps({'risk_level': 'LOW', 'risk_score': data['x']}))"
+)
+
+SQL_CODE = "SELECT case_id, CASE WHEN x >= 3 THEN 'HIGH' ELSE 'LOW' END AS risk_level FROM test_inputs WHERE x <> 4"
+
+
+def _batch_state(batch_id: int):
+    """返回批次状态、各用例状态和汇总中的状态计数"""
+    db = SessionLocal()
+    try:
+        status = db.query(models.TestBatch.status).filter(models.TestBatch.id == batch_id).scalar()
+        cases = dict(db.query(models.TestCase.id, models.TestCase.status).filter(models.TestCase.batch_id == batch_id))
+        summary = db.query(models.TestBatchSummary).filter(models.TestBatchSummary.batch_id == batch_id).one()
+        return status, cases, summary.status_counts
+    finally:
+        db.close()
+
+
+def test_cancel_running_batch(create_batch):
+    batch_id, _ = create_batch(200, status='pending', case_status='pending', python_code=SLOW_CODE)
+
+    async def run():
+        task = asyncio.create_task(run_test_batch(batch_id))
+        try:
+            while 'running' not in _batch_state(batch_id)[1].values():
+                await asyncio.sleep(0.05)
+            previous = await cancel_test_batch(batch_id)
+            cancelled = {case_id for case_id, status in _batch_state(batch_id)[1].items() if status == 'cancelled'}
+            await task
+            # 给被取消的任务留出写回迟到结果的时间
+            await asyncio.sleep(0.3)
+            return previous, cancelled
+        finally:
+            await shutdown_scheduler()
+            await shutdown_worker_pool()
+
+    previous, cancelled = asyncio.run(run())
+
+    status, cases, counts = _batch_state(batch_id)
+    assert previous == 'running'
+    assert status == 'cancelled'
+    assert cancelled == set(cases)
+    # 迟到的结果不会覆盖已取消的用例
+    assert set(cases.values()) == {'cancelled'}
+    assert counts == {'cancelled': 200}
+
+
+def _fail(batch_id: int) -> None:
+    async def run():
+        async with AsyncSessionLocal() as session:
+            await _fail_running_batch(session, batch_id, 'boom')
+
+    asyncio.run(run())
+
+
+def test_failure_does_not_overwrite_cancelled_batch(create_batch):
+    batch_id, _ = create_batch(5, status='cancelled', case_status='cancelled')
+
+    _fail(batch_id)
+
+    status, cases, counts = _batch_state(batch_id)
+    assert status == 'cancelled'
+    assert set(cases.values()) == {'cancelled'}
+    assert counts == {'cancelled': 5}
+
+
+def test_failure_marks_running_cases_error(create_batch):
+    batch_id, case_ids = create_batch(5)
+    db = SessionLocal()
+    try:
+        db.query(models.TestCase).filter(models.TestCase.id.in_(case_ids[:2])).update(
+            {'status': 'passed'}, synchronize_session=False
+        )
+        db.query(models.TestBatchSummary).filter(models.TestBatchSummary.batch_id == batch_id).update(
+            {'status_counts': {'running': 3, 'passed': 2}}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    _fail(batch_id)
+
+    status, cases, counts = _batch_state(batch_id)
+    assert status == 'failed'
+    assert [cases[case_id] for case_id in case_ids] == ['passed', 'passed', 'error', 'error', 'error']
+    assert counts == {'passed': 2, 'error': 3}
+
+
+def test_sql_batch_writes_results(create_batch):
+    batch_id, _ = create_batch(5, case_status='pending')
+
+    _execute_sql_batch(batch_id, SQL_CODE)
+
+    db = SessionLocal()
+    try:
+        cases = db.query(models.TestCase).filter(models.TestCase.batch_id == batch_id).order_by(models.TestCase.id).all()
+    finally:
+        db.close()
+    assert [case.status for case in cases] == ['passed', 'passed', 'passed', 'passed', 'failed']
+    assert [(case.actual_output or {}).get('risk_level') for case in cases] == ['LOW', 'LOW', 'LOW', 'HIGH', None]
+    assert cases[4].error_message == "SQL 未返回该用例的结果"
+    assert _batch_state(batch_id)[2] == {'passed': 4, 'failed': 1}
@@ -0,0 +1,79 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import run_migrations
+
+# 基线版本（尚未加入批次调度、引擎选择、分区等功能时）的表结构
+BASELINE_SCHEMA = (
+    """CREATE TABLE strategies (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        sql_code TEXT,
+        python_code TEXT,
+        status VARCHAR(8),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME
+    )""",
+    "CREATE INDEX ix_strategies_id ON strategies (id)",
+    """CREATE TABLE test_batches (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        description TEXT,
+        strategy_id INTEGER REFERENCES strategies (id),
+        status VARCHAR(9),
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME
+    )""",
+    "CREATE INDEX ix_test_batches_id ON test_batches (id)",
+    """CREATE TABLE test_cases (
+        id INTEGER PRIMARY KEY,
+        batch_id INTEGER REFERENCES test_batches (id),
+        input_data JSON,
+        expected_output JSON,
+        actual_output JSON,
+        status VARCHAR(7),
+        error_message TEXT,
+        execution_time INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME
+    )""",
+    "CREATE INDEX ix_test_cases_id ON test_cases (id)",
+)
+
+
+def _baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO strategies (id, name, python_code, status) VALUES (1, 's', 'pass', 'active')"))
+        conn.execute(text("INSERT INTO test_batches (id, name, strategy_id, status) VALUES (1, 'b', 1, 'completed')"))
+        conn.execute(text("INSERT INTO test_cases (batch_id, input_data, status) VALUES (1, '{}', 'passed')"))
+    return engine
+
+
+def test_migrations_upgrade_baseline_schema(tmp_path):
+    engine = _baseline_engine(tmp_path)
+
+    run_migrations(engine)
+    # 可以重复执行
+    run_migrations(engine)
+
+    inspector = inspect(engine)
+    assert {'test_batch_summaries', 'strategy_result_cache', 'test_case_results'} <= set(inspector.get_table_names())
+    assert {'version'} <= {column['name'] for column in inspector.get_columns('strategies')}
+    assert {'challenger_ids', 'priority', 'engine', 'enqueued_at'} <= {
+        column['name'] for column in inspector.get_columns('test_batches')
+    }
+    assert {'phase_timings', 'claimed_by', 'heartbeat_at'} <= {
+        column['name'] for column in inspector.get_columns('test_cases')
+    }
+    assert {'ix_test_cases_batch_status', 'ix_test_cases_batch_id', 'ix_test_cases_running_claims'} <= {
+        index['name'] for index in inspector.get_indexes('test_cases')
+    }
+    with engine.connect() as conn:
+        # 已有的行填入模型的默认值
+        assert conn.execute(text("SELECT version FROM strategies")).scalar() == 1
+        assert conn.execute(text("SELECT engine, priority FROM test_batches")).one() == ('python', 0)
+        assert conn.execute(text("SELECT status FROM test_cases")).scalar() == 'passed'
+    engine.dispose()
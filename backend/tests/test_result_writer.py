@@ -0,0 +1,92 @@
+import asyncio
+
+from app.database import SessionLocal
+from app.models import test as models
+from app.services.result_writer import ResultWriter
+
+
+def _results(case_ids):
+    return [
+        {
+            'case_id': case_id,
+            'status': 'passed',
+            'actual_output': {'risk_level': 'LOW', 'risk_score': case_id},
+            'error_message': None,
+            'execution_time': 5
+        }
+        for case_id in case_ids
+    ]
+
+
+def _cases_and_counts(batch_id: int):
+    db = SessionLocal()
+    try:
+        cases = db.query(models.TestCase).filter(models.TestCase.batch_id == batch_id).order_by(models.TestCase.id).all()
+        summary = db.query(models.TestBatchSummary).filter(models.TestBatchSummary.batch_id == batch_id).one()
+        return cases, summary.status_counts
+    finally:
+        db.close()
+
+
+def _flaky_write(monkeypatch, failures: int):
+    """让 ResultWriter._write 先失败 failures 次"""
+    write = ResultWriter._write
+    calls = {'failed': 0}
+
+    async def flaky(self, *args):
+        if calls['failed'] < failures:
+            calls['failed'] += 1
+            raise RuntimeError('database unavailable')
+        return await write(self, *args)
+
+    monkeypatch.setattr(ResultWriter, '_write', flaky)
+    return calls
+
+
+def _write_results(batch_id: int, case_ids, flush_retries: int) -> ResultWriter:
+    async def run():
+        async with ResultWriter(flush_interval=0.01, flush_retries=flush_retries) as writer:
+            await writer.put(batch_id, _results(case_ids))
+        return writer
+
+    return asyncio.run(run())
+
+
+def test_flush_retries_after_transient_failures(create_batch, monkeypatch):
+    batch_id, case_ids = create_batch(20)
+    calls = _flaky_write(monkeypatch, 2)
+
+    writer = _write_results(batch_id, case_ids, flush_retries=3)
+
+    assert calls['failed'] == 2
+    assert writer.failed_batches == {}
+    cases, counts = _cases_and_counts(batch_id)
+    assert [case.status for case in cases] == ['passed'] * 20
+    assert cases[0].actual_output == {'risk_level': 'LOW', 'risk_score': case_ids[0]}
+    assert counts == {'passed': 20}
+
+
+def test_persistent_failures_mark_cases_error(create_batch, monkeypatch):
+    batch_id, case_ids = create_batch(20)
+    _flaky_write(monkeypatch, 1000)
+
+    writer = _write_results(batch_id, case_ids, flush_retries=1)
+
+    assert list(writer.failed_batches) == [batch_id]
+    assert 'database unavailable' in writer.failed_batches[batch_id]
+    cases, counts = _cases_and_counts(batch_id)
+    assert [case.status for case in cases] == ['error'] * 20
+    assert cases[0].error_message == writer.failed_batches[batch_id]
+    assert counts == {'error': 20}
+
+
+def test_late_results_do_not_overwrite_cancelled_cases(create_batch):
+    batch_id, case_ids = create_batch(5, status='cancelled', case_status='cancelled')
+
+    writer = _write_results(batch_id, case_ids, flush_retries=0)
+
+    assert writer.failed_batches == {}
+    cases, counts = _cases_and_counts(batch_id)
+    assert [case.status for case in cases] == ['cancelled'] * 5
+    assert cases[0].actual_output is None
+    assert counts == {'cancelled': 5}
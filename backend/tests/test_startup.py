@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib')
+# 宽松的上限，只用于发现导入时做了明显多余的工作
+MAX_IMPORT_SECONDS = 10
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({{
+    "import": time.perf_counter() - start,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules]
+}}))
+'''
+
+
+def test_import_does_not_connect_or_load_heavy_modules(tmp_path):
+    # 数据库文件所在的目录不存在，导入时任何连接尝试都会失败
+    database = tmp_path / 'missing' / 'crm.db'
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}")
+    env.pop('ASYNC_DATABASE_URL', None)
+    proc = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+
+    assert proc.returncode == 0, proc.stderr
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert result['heavy_modules'] == []
+    assert result['import'] < MAX_IMPORT_SECONDS
+    assert not database.parent.exists()
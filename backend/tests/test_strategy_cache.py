@@ -0,0 +1,71 @@
+import asyncio
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.strategy import Strategy
+from app.schemas.strategy import StrategyCreate, StrategyUpdate
+from app.services import strategy as strategy_service
+from app.services.strategy_cache import get_strategy_cache
+
+
+def _create(db, python_code: str = 'pass') -> int:
+    return strategy_service.create_strategy(db, StrategyCreate(name='strategy', python_code=python_code)).id
+
+
+def _load_async(strategy_id: int):
+    async def run():
+        async with AsyncSessionLocal() as session:
+            return await get_strategy_cache().load_async(session, strategy_id)
+
+    return asyncio.run(run())
+
+
+def test_update_invalidates_cached_strategy(tables):
+    db = SessionLocal()
+    try:
+        strategy_id = _create(db, 'old')
+        record = strategy_service.get_strategy(db, strategy_id)
+        assert strategy_service.get_strategy(db, strategy_id) is record
+
+        strategy_service.update_strategy(db, strategy_id, StrategyUpdate(name='strategy', python_code='new'))
+
+        updated = strategy_service.get_strategy(db, strategy_id)
+        assert (updated.python_code, updated.version) == ('new', 2)
+        assert _load_async(strategy_id).python_code == 'new'
+    finally:
+        db.close()
+
+
+def test_delete_invalidates_cached_strategy(tables):
+    db = SessionLocal()
+    try:
+        strategy_id = _create(db)
+        assert strategy_service.get_strategy(db, strategy_id) is not None
+
+        strategy_service.delete_strategy(db, strategy_id)
+
+        assert strategy_service.get_strategy(db, strategy_id) is None
+        assert _load_async(strategy_id) is None
+    finally:
+        db.close()
+
+
+def test_update_from_other_process_is_detected_by_version(tables):
+    db = SessionLocal()
+    try:
+        strategy_id = _create(db, 'old')
+        assert strategy_service.get_strategy(db, strategy_id).python_code == 'old'
+
+        # 不经过本进程的缓存直接修改策略，相当于其他进程的更新
+        other = SessionLocal()
+        try:
+            other.query(Strategy).filter(Strategy.id == strategy_id).update(
+                {'python_code': 'new', 'version': Strategy.version + 1}, synchronize_session=False
+            )
+            other.commit()
+        finally:
+            other.close()
+
+        assert strategy_service.get_strategy(db, strategy_id).python_code == 'new'
+        assert _load_async(strategy_id).python_code == 'new'
+    finally:
+        db.close()
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.services import worker_pool
+from app.services.worker_pool import StrategyWorker, StrategyWorkerPool, WorkerTimeout
+
+CODE = "def evaluate_batch(rows):\n    return [{'risk_level': 'LOW', 'risk_score': row['x']} for row in rows]"
+
+
+def _run_with_stuck_inputs(monkeypatch, stuck, cases):
+    """执行 cases 个用例，包含 stuck 中任一输入的一组用例视为工作进程超时"""
+    calls = []
+    evaluate = StrategyWorker.evaluate
+
+    async def stuck_evaluate(self, inputs):
+        calls.append(len(inputs))
+        if any(input_data['x'] in stuck for input_data in inputs):
+            await self.kill()
+            raise WorkerTimeout('strategy worker did not respond')
+        return await evaluate(self, inputs)
+
+    monkeypatch.setattr(StrategyWorker, 'evaluate', stuck_evaluate)
+    monkeypatch.setattr(worker_pool, 'TIMEOUT_RETRIES', 3)
+
+    async def run():
+        pool = StrategyWorkerPool(2)
+        try:
+            return await pool.run_chunk(CODE, [{'x': i} for i in range(cases)])
+        finally:
+            await pool.shutdown()
+
+    return asyncio.run(run()), calls
+
+
+def test_timeout_bisects_to_stuck_case(monkeypatch):
+    results, calls = _run_with_stuck_inputs(monkeypatch, {3}, 8)
+
+    assert calls == [8, 4, 2, 2, 1, 1, 4]
+    assert [result['ok'] for result in results] == [True, True, True, False, True, True, True, True]
+    assert results[3]['timeout']
+    assert results[5]['output'] == {'risk_level': 'LOW', 'risk_score': 5}
+
+
+def test_timeout_retries_are_bounded(monkeypatch):
+    results, calls = _run_with_stuck_inputs(monkeypatch, set(range(100)), 100)
+
+    # 重试次数在二分出的各部分之间共享，用完后剩余的用例整块记为超时
+    assert calls == [100, 50, 25, 12, 13, 25, 50]
+    assert len(results) == 100
+    assert all(result['timeout'] and not result['ok'] for result in results)
@@ -0,0 +1,22 @@
+import argparse
+import asyncio
+import logging
+
+from app.services.job_queue import QueueWorker
+from app.services.worker_pool import POOL_SIZE, shutdown_worker_pool
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main(args):
+    try:
+        await QueueWorker(worker_id=args.worker_id, concurrency=args.concurrency).run()
+    finally:
+        await shutdown_worker_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从数据库队列认领并执行测试用例")
+    parser.add_argument("--concurrency", type=int, default=POOL_SIZE, help="同时执行的用例块数")
+    parser.add_argument("--worker-id", default=None, help="worker 标识，默认由主机名和进程号生成")
+    asyncio.run(main(parser.parse_args()))
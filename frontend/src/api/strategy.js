@@ -36,5 +36,10 @@ export const strategyApi = {
   // 运行策略测试
   runStrategyTest(id, testData) {
     return api.post(`/api/strategies/${id}/test`, testData)
+  },
+
+  // 在一到两个字段的取值网格上扫描策略
+  sweepStrategy(id, config) {
+    return api.post(`/api/strategies/${id}/sweep`, config)
   }
 } 
\ No newline at end of file
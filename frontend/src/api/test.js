@@ -23,8 +23,43 @@ export const testApi = {
     return api.get(`/api/tests/batches/${id}`)
   },
 
-  // 获取测试报告
-  getTestReport(id) {
-    return api.get(`/api/tests/batches/${id}/report`)
+  // 分页获取批次的用例，params：status、after_id、limit、include_data
+  listTestCases(id, params = {}) {
+    return api.get(`/api/tests/batches/${id}/cases`, { params })
+  },
+
+  // 获取测试批次进度（只包含各状态的用例数）
+  getTestProgress(id) {
+    return api.get(`/api/tests/batches/${id}/progress`)
+  },
+
+  // 取消测试批次，返回取消后的进度
+  cancelTestBatch(id) {
+    return api.post(`/api/tests/batches/${id}/cancel`)
+  },
+
+  // 订阅测试批次进度推送（Server-Sent Events）
+  streamTestProgress(id) {
+    return new EventSource(`${baseURL}/api/tests/batches/${id}/progress/stream`)
+  },
+
+  // 删除已结束的测试批次，archive 为 true 时把用例分区归档为独立的表（需启用按批次分区）
+  deleteTestBatch(id, archive = false) {
+    return api.delete(`/api/tests/batches/${id}`, { params: { archive } })
+  },
+
+  // 获取测试报告，params.charts 为 data 时只返回图表数据序列
+  getTestReport(id, params = {}) {
+    return api.get(`/api/tests/batches/${id}/report`, { params })
+  },
+
+  // 获取对比批次的报告（一致率、risk_level 混淆矩阵、执行时间差异）
+  getComparisonReport(id, params = {}) {
+    return api.get(`/api/tests/batches/${id}/comparison`, { params })
+  },
+
+  // 批次结果的导出地址，format 为 parquet、arrow 或 csv
+  exportTestBatchUrl(id, format) {
+    return `${baseURL}/api/tests/batches/${id}/export?format=${format}`
   }
 } 
\ No newline at end of file